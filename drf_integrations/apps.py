@@ -11,6 +11,43 @@ DEFAULT_SETTINGS = {
     "INTEGRATIONS_APPLICATION_INSTALLATION_INSTALL_ATTRIBUTE": "target_id",
 }
 
+# Settings that are not required to run drf_integrations, together with the value
+# used when they are not defined. Use `drf_integrations.utils.get_setting` to read them.
+OPTIONAL_SETTINGS = {
+    "INTEGRATIONS_PRELOAD": False,
+    "INTEGRATIONS_INSTALLATION_CACHE_ENABLED": False,
+    "INTEGRATIONS_INSTALLATION_CACHE_ALIAS": "default",
+    "INTEGRATIONS_INSTALLATION_CACHE_TIMEOUT": 300,
+    "INTEGRATIONS_INSTALLATION_CACHE_LOCAL_MAXSIZE": 1024,
+    "INTEGRATIONS_INSTALLATION_CACHE_LOCAL_TIMEOUT": 5,
+    "INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_ENABLED": False,
+    "INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_MAXSIZE": 10000,
+    "INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_TIMEOUT": 30,
+    "INTEGRATIONS_CLIENT_POOL_ENABLED": False,
+    "INTEGRATIONS_CLIENT_POOL_MAXSIZE": 256,
+    "INTEGRATIONS_CLIENT_POOL_IDLE_TIMEOUT": 300,
+    "INTEGRATIONS_OUTBOX_MAX_ATTEMPTS": 10,
+    "INTEGRATIONS_OUTBOX_RETRY_BACKOFF": 30,
+    "INTEGRATIONS_OUTBOX_RETRY_BACKOFF_MAX": 3600,
+    "INTEGRATIONS_OUTBOX_LEASE_TIMEOUT": 300,
+    "INTEGRATIONS_WEBHOOK_MAX_ATTEMPTS": 10,
+    "INTEGRATIONS_WEBHOOK_RETRY_BACKOFF": 30,
+    "INTEGRATIONS_WEBHOOK_RETRY_BACKOFF_MAX": 3600,
+    "INTEGRATIONS_WEBHOOK_LEASE_TIMEOUT": 300,
+    "INTEGRATIONS_WEBHOOK_BLOOM_CAPACITY": 100000,
+    "INTEGRATIONS_WEBHOOK_BLOOM_ERROR_RATE": 0.001,
+    "INTEGRATIONS_INTERNAL_TOKEN_CACHE_ENABLED": False,
+    "INTEGRATIONS_INTERNAL_TOKEN_CACHE_ALIAS": "default",
+    "INTEGRATIONS_INTERNAL_TOKEN_CACHE_LOCAL_MAXSIZE": 1024,
+    "INTEGRATIONS_INTERNAL_TOKEN_REFRESH_MARGIN": 3600,
+    "INTEGRATIONS_INTERNAL_TOKEN_BACKGROUND_REFRESH": True,
+    "INTEGRATIONS_INTERNAL_APPLICATION_CACHE_TIMEOUT": 300,
+    "INTEGRATIONS_INSTRUMENTATION_SINK": None,
+    "INTEGRATIONS_READ_REPLICAS": [],
+    "INTEGRATIONS_READ_REPLICA_STICKINESS": 5,
+    "INTEGRATIONS_READ_REPLICA_CACHE_ALIAS": "default",
+}
+
 DEFAULT_MODEL_SETTINGS = {
     "OAUTH2_PROVIDER_APPLICATION_MODEL": "AbstractApplication",
     "OAUTH2_PROVIDER_ACCESS_TOKEN_MODEL": "AbstractAccessToken",
@@ -26,7 +63,8 @@ class DRFIntegrationsConfig(AppConfig):
 
     def ready(self):
         from drf_integrations import models
-        from drf_integrations.integrations import register
+        from drf_integrations.integrations import preload, register, register_lazy
+        from drf_integrations.utils import get_setting
 
         for name, default_value in itertools.chain(
             DEFAULT_SETTINGS.items(), DEFAULT_MODEL_SETTINGS.items()
@@ -43,5 +81,11 @@ class DRFIntegrationsConfig(AppConfig):
                     )
 
         for installed_integration in settings.INSTALLED_INTEGRATIONS:
-            integration_class = import_string(installed_integration)
-            register(integration_class)
+            if isinstance(installed_integration, dict):
+                register_lazy(**installed_integration)
+            else:
+                integration_class = import_string(installed_integration)
+                register(integration_class)
+
+        if get_setting("INTEGRATIONS_PRELOAD"):
+            preload()
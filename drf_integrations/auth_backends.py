@@ -1,14 +1,29 @@
-from typing import TYPE_CHECKING, Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple, Type
 
+import django
 import logging
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import FilteredRelation, Q
+from django.utils.translation import gettext_lazy as _
 from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model
+from oauth2_provider.settings import oauth2_settings
 from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
 
 from drf_integrations import models
+from drf_integrations.cache import installation_cache
+from drf_integrations.exceptions import ImproperlyConfigured
+from drf_integrations.instrumentation import instrument
+from drf_integrations.routers import aget_from_replica, get_from_replica, get_replicas, use_primary
 
 if TYPE_CHECKING:
+    from django.db.models import QuerySet
     from rest_framework.request import Request
 
+    from drf_integrations.integrations.base import BaseIntegration
+    from drf_integrations.signatures import SignatureVerifier
     from drf_integrations.types import AnyUser
 
 
@@ -24,12 +39,35 @@ class IntegrationOAuth2Authentication(OAuth2Authentication):
     - Raise an AuthenticationFailed error when an invalid token is provided, and
     - Return an instance of AnonymousUser when the client credentials grant is used in
         the case of server-to-server communications.
+
+    The ``token`` and ``installation`` phases are reported to the instrumentation sink,
+    if any (see `drf_integrations.instrumentation`).
     """
 
     ensure_integration_classes = ()
+    installation_cache = installation_cache
+    single_query_local_installations = False
+    """
+    Fetch the token, its application and, for local integrations, their only active
+    installation in a single query, instead of validating the token through oauthlib
+    and then looking up the installation. Only use it if the local integrations do not
+    customise `get_installation_lookup_from_request`. Requires Django 3.2+, which
+    supports the nested condition of the join.
+    """
 
     def authenticate(self, request: "Request") -> "Optional[Tuple[AnyUser, models.AccessToken]]":
-        result = super().authenticate(request)
+        if self._use_single_query():
+            return self._authenticate_single_query(request)
+
+        with instrument("token") as phase:
+            result = super().authenticate(request)
+            if not result and get_replicas() and self._is_token_missing(request):
+                # The token may not be replicated yet
+                del request.oauth2_error
+                with use_primary():
+                    result = super().authenticate(request)
+            if result:
+                phase.integration = self._get_integration_name(result[1])
 
         if hasattr(request, "oauth2_error") and request.oauth2_error:
             raise exceptions.AuthenticationFailed(
@@ -39,26 +77,15 @@ class IntegrationOAuth2Authentication(OAuth2Authentication):
 
         if result:
             token = result[1]
-            if token.is_internal_only:
+            integration = self._get_integration(token)
+            if integration is None:
                 return None
 
             try:
-                integration = token.application.get_integration_instance(
-                    *self.ensure_integration_classes
-                )
-            except ValueError:
-                return None
-
-            try:
-                installation = (
-                    ApplicationInstallation.objects.select_related("application")
-                    .active()
-                    .get(
-                        **integration.get_installation_lookup_from_request(
-                            request=request, application=token.application
-                        )
+                with instrument("installation", integration.name):
+                    installation = self.get_installation(
+                        request, integration=integration, application=token.application
                     )
-                )
             except (
                 ApplicationInstallation.DoesNotExist,
                 ApplicationInstallation.MultipleObjectsReturned,
@@ -69,3 +96,319 @@ class IntegrationOAuth2Authentication(OAuth2Authentication):
             request.auth_context = installation.get_context()
 
         return result
+
+    async def aauthenticate(
+        self, request: "Request"
+    ) -> "Optional[Tuple[AnyUser, models.AccessToken]]":
+        """
+        Async version of `authenticate`, which validates the bearer token and looks up
+        the installation through the async ORM (Django 4.1+).
+
+        Token introspection against a remote authorization server is not supported by
+        the async ORM path, so if it is configured, `authenticate` is run in a thread.
+        """
+        if oauth2_settings.RESOURCE_SERVER_INTROSPECTION_URL:
+            return await sync_to_async(self.authenticate)(request)
+        self._check_async_orm()
+
+        token_string = self._get_bearer_token(request)
+        if not token_string:
+            return None
+
+        AccessToken = get_access_token_model()
+        with instrument("token") as phase:
+            try:
+                token = await aget_from_replica(self._get_token_queryset(), token=token_string)
+            except AccessToken.DoesNotExist as err:
+                raise exceptions.AuthenticationFailed(
+                    detail=_("The access token is invalid."), code="invalid_token"
+                ) from err
+            except AccessToken.MultipleObjectsReturned as err:
+                # The same local application is installed more than once
+                logger.exception("drf_integrations.auth_backends.invalid_installation")
+                raise exceptions.AuthenticationFailed() from err
+            phase.integration = self._get_integration_name(token)
+            self._check_token(token)
+
+        integration = self._get_integration(token)
+        if integration is None:
+            return None
+
+        try:
+            with instrument("installation", integration.name):
+                if self._use_single_query() and integration.is_local:
+                    installation = self._get_joined_installation(token)
+                else:
+                    installation = await self.aget_installation(
+                        request, integration=integration, application=token.application
+                    )
+        except (
+            ApplicationInstallation.DoesNotExist,
+            ApplicationInstallation.MultipleObjectsReturned,
+        ) as err:
+            logger.exception("drf_integrations.auth_backends.invalid_installation")
+            raise exceptions.AuthenticationFailed() from err
+
+        request.auth_context = installation.get_context()
+
+        return token.user, token
+
+    def _is_token_missing(self, request: "Request") -> bool:
+        """
+        Whether the bearer token was rejected because it is not in the DB it was read
+        from, rather than because it is expired or lacks scopes.
+        """
+        error = getattr(request, "oauth2_error", None)
+        if not error or error.get("error") != "invalid_token":
+            return False
+        token_string = self._get_bearer_token(request)
+        if not token_string:
+            return False
+        return not get_access_token_model().objects.filter(token=token_string).exists()
+
+    def _authenticate_single_query(
+        self, request: "Request"
+    ) -> "Optional[Tuple[AnyUser, models.AccessToken]]":
+        token_string = self._get_bearer_token(request)
+        if not token_string:
+            return None
+
+        AccessToken = get_access_token_model()
+        with instrument("token") as phase:
+            try:
+                token = get_from_replica(self._get_token_queryset(), token=token_string)
+            except AccessToken.DoesNotExist as err:
+                raise exceptions.AuthenticationFailed(
+                    detail=_("The access token is invalid."), code="invalid_token"
+                ) from err
+            except AccessToken.MultipleObjectsReturned as err:
+                # The same local application is installed more than once
+                logger.exception("drf_integrations.auth_backends.invalid_installation")
+                raise exceptions.AuthenticationFailed() from err
+            phase.integration = self._get_integration_name(token)
+            self._check_token(token)
+
+        integration = self._get_integration(token)
+        if integration is None:
+            return None
+
+        try:
+            with instrument("installation", integration.name):
+                if integration.is_local:
+                    installation = self._get_joined_installation(token)
+                else:
+                    installation = self.get_installation(
+                        request, integration=integration, application=token.application
+                    )
+        except (
+            ApplicationInstallation.DoesNotExist,
+            ApplicationInstallation.MultipleObjectsReturned,
+        ) as err:
+            logger.exception("drf_integrations.auth_backends.invalid_installation")
+            raise exceptions.AuthenticationFailed() from err
+
+        request.auth_context = installation.get_context()
+
+        return token.user, token
+
+    def get_installation(
+        self,
+        request: "Request",
+        *,
+        integration: "BaseIntegration",
+        application: "models.Application",
+    ) -> "models.AbstractApplicationInstallation":
+        """
+        Return the active installation linked to the request, going through
+        `installation_cache` before querying the DB.
+
+        :raises ApplicationInstallation.DoesNotExist: If there is no active installation,
+            also if the lookup is known to be missing
+        :raises ApplicationInstallation.MultipleObjectsReturned: If the lookup is ambiguous
+        """
+        lookup = integration.get_installation_lookup_from_request(
+            request=request, application=application
+        )
+        return self.installation_cache.resolve(
+            lookup, ApplicationInstallation.objects.select_related("application").active()
+        )
+
+    async def aget_installation(
+        self,
+        request: "Request",
+        *,
+        integration: "BaseIntegration",
+        application: "models.Application",
+    ) -> "models.AbstractApplicationInstallation":
+        """Async version of `get_installation`."""
+        self._check_async_orm()
+        lookup = integration.get_installation_lookup_from_request(
+            request=request, application=application
+        )
+        return await self.installation_cache.aresolve(
+            lookup, ApplicationInstallation.objects.select_related("application").active()
+        )
+
+    @staticmethod
+    def _check_async_orm():
+        if django.VERSION[0:2] < (4, 1):
+            raise ImproperlyConfigured(
+                "Authenticating asynchronously requires Django 4.1+, which has an async ORM"
+            )
+
+    def _use_single_query(self) -> bool:
+        if not self.single_query_local_installations:
+            return False
+        if django.VERSION[0:2] < (3, 2):
+            raise ImproperlyConfigured(
+                "single_query_local_installations requires Django 3.2+, older versions "
+                "do not support FilteredRelation conditions on nested relations"
+            )
+        return not oauth2_settings.RESOURCE_SERVER_INTROSPECTION_URL
+
+    def _get_token_queryset(self) -> "QuerySet":
+        queryset = get_access_token_model().objects.select_related("application", "user")
+        if self._use_single_query():
+            queryset = queryset.annotate(
+                active_installation=FilteredRelation(
+                    "application__installations",
+                    # Only local applications have a single active installation
+                    condition=Q(
+                        application__local_integration_name__isnull=False,
+                        application__installations__deleted_at__isnull=True,
+                    ),
+                )
+            ).select_related("active_installation")
+        return queryset
+
+    @staticmethod
+    def _get_joined_installation(
+        token: "models.AccessToken",
+    ) -> "models.AbstractApplicationInstallation":
+        """
+        Return the active installation fetched along with the token by the queryset
+        from `_get_token_queryset`.
+
+        :raises ApplicationInstallation.DoesNotExist: If there is no active installation
+        """
+        installation = getattr(token, "active_installation", None)
+        if installation is None:
+            raise ApplicationInstallation.DoesNotExist()
+        installation.application = token.application
+        return installation
+
+    @staticmethod
+    def _check_token(token: "models.AccessToken"):
+        if token.is_expired():
+            raise exceptions.AuthenticationFailed(
+                detail=_("The access token has expired."), code="invalid_token"
+            )
+
+    @staticmethod
+    def _get_integration_name(token: "models.AccessToken") -> Optional[str]:
+        application = token.application
+        if application is None:
+            return None
+        return application.internal_integration_name or application.local_integration_name
+
+    def _get_integration(self, token: "models.AccessToken") -> "Optional[BaseIntegration]":
+        """
+        Return the integration the token can authenticate requests for, if any.
+        Internal-only tokens cannot be used to authenticate external requests.
+        """
+        if token.is_internal_only:
+            return None
+
+        try:
+            return token.application.get_integration_instance(*self.ensure_integration_classes)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _get_bearer_token(request: "Request") -> Optional[str]:
+        """
+        Extract the token from the Authorization header or, in its absence, from the
+        `access_token` query param, in the same way oauthlib does.
+        """
+        authorization = request.META.get("HTTP_AUTHORIZATION")
+        if authorization is not None:
+            split_header = authorization.split()
+            if len(split_header) == 2 and split_header[0].lower() == "bearer":
+                return split_header[1]
+            return None
+        return request.GET.get("access_token")
+
+
+class AsyncIntegrationOAuth2Authentication(IntegrationOAuth2Authentication):
+    """
+    `IntegrationOAuth2Authentication` for async views (e.g. adrf's), where
+    `authenticate` is awaited, so that authenticating does not block a thread
+    in ASGI deployments. Requires Django 4.1+.
+    """
+
+    async def authenticate(
+        self, request: "Request"
+    ) -> "Optional[Tuple[AnyUser, models.AccessToken]]":
+        return await self.aauthenticate(request)
+
+
+class IntegrationSignatureAuthentication(BaseAuthentication):
+    """
+    Authenticates requests signed by a third party with the secret of an installation
+    of ``integration_class``, e.g. webhooks. The installation is looked up with
+    `BaseIntegration.get_installation_lookup_from_request` and the signature is checked
+    by ``signature_verifier`` (by default, the one of the integration).
+
+    Authenticated requests get an internal-only token of the integration application.
+    """
+
+    integration_class: "Type[BaseIntegration]"
+    signature_verifier: "Optional[SignatureVerifier]" = None
+    installation_cache = installation_cache
+
+    def get_signature_verifier(self) -> "SignatureVerifier":
+        verifier = self.signature_verifier or self.integration_class.signature_verifier
+        if verifier is None:
+            raise ValueError(f"{self.integration_class.name} has no signature verifier")
+        return verifier
+
+    def authenticate(self, request: "Request") -> "Optional[Tuple[AnyUser, models.AccessToken]]":
+        verifier = self.get_signature_verifier()
+        integration_name = self.integration_class.name
+        if not verifier.get_signature(request):
+            return None
+
+        try:
+            with instrument("installation", integration_name):
+                installation = self.installation_cache.resolve(
+                    self.integration_class.get_installation_lookup_from_request(
+                        request=request, application=None
+                    ),
+                    ApplicationInstallation.objects.select_related("application").active(),
+                )
+        except (
+            ApplicationInstallation.DoesNotExist,
+            ApplicationInstallation.MultipleObjectsReturned,
+        ):
+            logger.info(
+                "drf_integrations.auth_backends.installation_not_found",
+                extra=dict(integration=integration_name),
+            )
+            return None
+
+        with instrument("signature", integration_name):
+            is_valid = verifier.verify(request, installation)
+        if not is_valid:
+            logger.info(
+                "drf_integrations.auth_backends.invalid_signature",
+                extra=dict(integration=integration_name, installation=installation.pk),
+            )
+            return None
+
+        request.auth_context = installation.get_context()
+
+        with instrument("token", integration_name):
+            token, __ = get_access_token_model().objects.create_for_internal_integration(
+                application=installation.application
+            )
+        return AnonymousUser(), token
@@ -0,0 +1,848 @@
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import copy
+import hashlib
+import json
+import math
+import pickle
+import threading
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+from drf_integrations.utils import get_setting
+
+if TYPE_CHECKING:
+    from django.core.cache.backends.base import BaseCache
+
+    from drf_integrations.integrations.base import BaseClient, BaseIntegration, Context
+    from drf_integrations.models import (
+        AbstractAccessToken,
+        AbstractApplication,
+        AbstractApplicationInstallation,
+    )
+
+
+class lazy_cache_property:
+    """
+    Property creating a per-process cache on first access, with the decorated method.
+
+    The cache is stored in the ``_<name>`` attribute of the instance, which must be set
+    to None beforehand and is only set once, under the ``_lock`` of the instance.
+    Checking that attribute tells whether the cache was created without creating it.
+    """
+
+    def __init__(self, factory: Callable[[Any], Any]):
+        self.factory = factory
+        self.__doc__ = factory.__doc__
+
+    def __set_name__(self, owner: type, name: str):
+        self.attr_name = f"_{name}"
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        if instance is None:
+            return self
+        value = getattr(instance, self.attr_name)
+        if value is None:
+            with instance._lock:
+                value = getattr(instance, self.attr_name)
+                if value is None:
+                    value = self.factory(instance)
+                    setattr(instance, self.attr_name, value)
+        return value
+
+
+class LocalTTLCache:
+    """
+    Thread-safe, per-process LRU cache where entries expire after ``timeout`` seconds.
+
+    Implements the subset of the Django cache API used by drf_integrations, so it
+    can be used interchangeably with a Django cache backend.
+    """
+
+    def __init__(self, *, maxsize: int, timeout: float):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, timeout: Optional[float] = None):
+        if timeout is None:
+            timeout = self.timeout
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set_many(self, data: Dict[Hashable, Any], timeout: Optional[float] = None):
+        for key, value in data.items():
+            self.set(key, value, timeout)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_many(self, keys: Iterable[Hashable]):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_matching(self, predicate: Callable[[Hashable], bool]):
+        """Delete all the entries whose key matches the predicate."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class InstallationCache:
+    """
+    Read-through cache of active installations, keyed by the lookup filters produced
+    by `BaseIntegration.get_installation_lookup_from_request` (or any other lookup).
+
+    Installations are kept in a per-process LRU cache with a short TTL, backed by the
+    Django cache set in `INTEGRATIONS_INSTALLATION_CACHE_ALIAS`. Every cached lookup
+    records the version of its installation, which is replaced every time the
+    installation is saved, so all the lookups pointing to it are invalidated at once
+    without keeping a shared list of them. Installations read from the DB are not cached
+    if any installation was invalidated while they were read. Per-process entries in
+    other processes are only dropped when their TTL expires, so keep
+    `INTEGRATIONS_INSTALLATION_CACHE_LOCAL_TIMEOUT` short.
+
+    Lookups that do not match any installation can also be cached for a short time
+    (`INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_ENABLED`), so that repeated requests
+    from unknown callers do not hit the DB. As there is no way to tell which of those
+    lookups a new installation matches, saving any installation drops them all once its
+    transaction commits, so that lookups missed in the meantime are dropped too.
+
+    Note that queryset updates (e.g. ``.update(config=...)``) do not call ``save`` and
+    therefore do not invalidate the cache, nor sync the indexed lookups of
+    `ApplicationInstallationLookup` (run ``syncinstallationlookups`` after them).
+    """
+
+    key_prefix = "drf_integrations:installation"
+
+    def __init__(self):
+        self._local: Optional[LocalTTLCache] = None
+        self._local_missing: Optional[LocalTTLCache] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return get_setting("INTEGRATIONS_INSTALLATION_CACHE_ENABLED")
+
+    @lazy_cache_property
+    def local(self) -> LocalTTLCache:
+        return LocalTTLCache(
+            maxsize=get_setting("INTEGRATIONS_INSTALLATION_CACHE_LOCAL_MAXSIZE"),
+            timeout=get_setting("INTEGRATIONS_INSTALLATION_CACHE_LOCAL_TIMEOUT"),
+        )
+
+    @lazy_cache_property
+    def local_missing(self) -> LocalTTLCache:
+        return LocalTTLCache(
+            maxsize=get_setting("INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_MAXSIZE"),
+            timeout=get_setting("INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_TIMEOUT"),
+        )
+
+    @property
+    def shared(self) -> "Optional[BaseCache]":
+        alias = get_setting("INTEGRATIONS_INSTALLATION_CACHE_ALIAS")
+        return caches[alias] if alias else None
+
+    @property
+    def timeout(self) -> int:
+        return get_setting("INTEGRATIONS_INSTALLATION_CACHE_TIMEOUT")
+
+    @property
+    def missing_enabled(self) -> bool:
+        return get_setting("INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_ENABLED")
+
+    @classmethod
+    def make_key(cls, lookup: Dict) -> str:
+        """
+        Build a cache key from a queryset lookup. Model instances in the lookup are
+        replaced by their primary key, and subqueries by their SQL, so that equal
+        lookups map to the same key.
+        """
+        normalized = sorted((name, cls._normalize(value)) for name, value in lookup.items())
+        digest = hashlib.sha1(repr(normalized).encode()).hexdigest()
+        return f"{cls.key_prefix}:lookup:{digest}"
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        if isinstance(value, models.Model):
+            return value.pk
+        if isinstance(value, models.QuerySet):
+            return str(value.query)
+        return value
+
+    @classmethod
+    def make_version_key(cls, pk: Any) -> str:
+        return f"{cls.key_prefix}:version:{pk}"
+
+    @property
+    def generation_key(self) -> str:
+        return f"{self.key_prefix}:generation"
+
+    def _layers(self):
+        yield self.local, self.local.timeout
+        shared = self.shared
+        if shared is not None:
+            yield shared, self.timeout
+
+    def get(self, lookup: Dict) -> "Optional[AbstractApplicationInstallation]":
+        if not self.enabled:
+            return None
+
+        key = self.make_key(lookup)
+        data = self._get_layer(self.local, key)
+        if data is not None:
+            return pickle.loads(data)
+
+        shared = self.shared
+        if shared is None:
+            return None
+
+        installation = self._get_layer(shared, key)
+        if installation is not None:
+            self._set_layer(self.local, self.local.timeout, key, installation)
+        return installation
+
+    def _get_layer(self, layer, key: str) -> Any:
+        """
+        Return the entry of the layer for the key, unless its installation was saved
+        after it was cached.
+        """
+        entry = layer.get(key)
+        if entry is None:
+            return None
+        pk, version, value = entry
+        if layer.get(self.make_version_key(pk), "") != version:
+            return None
+        return value
+
+    def set(
+        self,
+        lookup: Dict,
+        installation: "AbstractApplicationInstallation",
+        generations: Optional[Tuple[int, Optional[int]]] = None,
+    ):
+        """
+        Cache the installation for the lookup. If ``generations`` is given, see
+        `get_generations`, the installation is not cached in the layers that have been
+        invalidated since then.
+        """
+        if not self.enabled:
+            return
+
+        key = self.make_key(lookup)
+        for index, (layer, timeout) in enumerate(self._layers()):
+            generation = generations[index] if generations is not None else None
+            self._set_layer(layer, timeout, key, installation, generation)
+
+    def _set_layer(
+        self,
+        layer,
+        timeout,
+        key: str,
+        installation: "AbstractApplicationInstallation",
+        generation: Optional[int] = None,
+    ):
+        version = layer.get(self.make_version_key(installation.pk), "")
+        # Checked after reading the version, as invalidations bump the generation before
+        # replacing the versions: either the installation was read before the new
+        # version, which then invalidates the entry, or the generation has changed
+        if generation is not None and self._get_generation(layer) != generation:
+            return
+        if isinstance(layer, LocalTTLCache):
+            # Keep a serialized copy so that each request gets its own instance
+            value = pickle.dumps(installation)
+        else:
+            value = installation
+        layer.set(key, (installation.pk, version, value), timeout)
+
+    def _get_generation(self, layer) -> int:
+        if isinstance(layer, LocalTTLCache):
+            return self._generation
+        return layer.get(self.generation_key, 0)
+
+    def get_generations(self) -> Optional[Tuple[int, Optional[int]]]:
+        """
+        Return the generations of the per-process and Django caches, which are bumped by
+        every invalidation, or None if the caches are disabled. Take them before reading
+        installations from the DB, so that what was read is not cached if they were
+        invalidated in the meantime (e.g. uninstalled by a concurrent request).
+        """
+        if not (self.enabled or self.missing_enabled):
+            return None
+        shared = self.shared
+        return self._generation, self._get_generation(shared) if shared is not None else None
+
+    def resolve(
+        self, lookup: Dict, queryset: "models.QuerySet"
+    ) -> "AbstractApplicationInstallation":
+        """
+        Return the installation in ``queryset`` that matches ``lookup``, going through
+        the cache before querying the DB.
+
+        :raises DoesNotExist: If there is no installation, also if the lookup is
+            known to be missing
+        :raises MultipleObjectsReturned: If the lookup is ambiguous
+        """
+        installation, missing = self._get_cached(lookup)
+        if installation is not None:
+            return installation
+
+        if missing:
+            raise queryset.model.DoesNotExist()
+
+        from drf_integrations.routers import get_from_replica
+
+        generations = self.get_generations()
+        try:
+            installation = get_from_replica(queryset, **lookup)
+        except queryset.model.DoesNotExist:
+            self.set_missing(lookup, generations)
+            raise
+
+        self.set(lookup, installation, generations)
+        return installation
+
+    async def aresolve(
+        self, lookup: Dict, queryset: "models.QuerySet"
+    ) -> "AbstractApplicationInstallation":
+        """
+        Async version of `resolve`, querying the DB through the async ORM (Django 4.1+).
+
+        The per-process caches are used from the event loop, whereas the Django cache
+        is accessed in a thread, since its backends may be blocking.
+        """
+        uses_shared = self.shared is not None and (self.enabled or self.missing_enabled)
+
+        async def run(func, *args):
+            if uses_shared:
+                return await sync_to_async(func)(*args)
+            return func(*args)
+
+        installation, missing = await run(self._get_cached, lookup)
+        if installation is not None:
+            return installation
+
+        if missing:
+            raise queryset.model.DoesNotExist()
+
+        from drf_integrations.routers import aget_from_replica
+
+        generations = await run(self.get_generations)
+        try:
+            installation = await aget_from_replica(queryset, **lookup)
+        except queryset.model.DoesNotExist:
+            await run(self.set_missing, lookup, generations)
+            raise
+
+        await run(self.set, lookup, installation, generations)
+        return installation
+
+    def _get_cached(
+        self, lookup: Dict
+    ) -> "Tuple[Optional[AbstractApplicationInstallation], bool]":
+        installation = self.get(lookup)
+        return installation, installation is None and self.is_missing(lookup)
+
+    def _get_missing_key(
+        self, lookup: Dict, generations: Optional[Tuple[int, Optional[int]]] = None
+    ) -> str:
+        if generations is None:
+            shared = self.shared
+            generations = (
+                self._generation,
+                self._get_generation(shared) if shared is not None else None,
+            )
+        local_generation, shared_generation = generations
+        generation = local_generation if shared_generation is None else shared_generation
+        return f"{self.make_key(lookup)}:missing:{generation}"
+
+    def is_missing(self, lookup: Dict) -> bool:
+        """Whether the lookup was recently known not to match any installation."""
+        if not self.missing_enabled:
+            return False
+
+        key = self._get_missing_key(lookup)
+        if self.local_missing.get(key):
+            return True
+
+        shared = self.shared
+        if shared is not None and shared.get(key):
+            self.local_missing.set(key, True)
+            return True
+        return False
+
+    def set_missing(self, lookup: Dict, generations: Optional[Tuple[int, Optional[int]]] = None):
+        """
+        Remember that the lookup does not match any installation. If ``generations`` is
+        given, see `get_generations`, it is forgotten straight away if installations were
+        saved since then.
+        """
+        if not self.missing_enabled:
+            return
+
+        key = self._get_missing_key(lookup, generations)
+        self.local_missing.set(key, True)
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, True, self.local_missing.timeout)
+
+    def invalidate_missing(self):
+        """Forget all the lookups known not to match any installation."""
+        if self.missing_enabled:
+            self._bump_generation()
+
+    def _bump_generation(self):
+        with self._lock:
+            self._generation += 1
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.incr(self.generation_key)
+            except ValueError:
+                shared.set(self.generation_key, 1, None)
+
+    def invalidate(self, installation: "AbstractApplicationInstallation"):
+        """
+        Drop every cached lookup that resolves to the given installation, as well as
+        the lookups known to be missing, since the installation may match them now.
+        """
+        self.invalidate_many([installation])
+
+    def invalidate_many(self, installations: "Iterable[AbstractApplicationInstallation]"):
+        """Bulk version of `invalidate`."""
+        if not (self.enabled or self.missing_enabled):
+            return
+        # Before replacing the versions, see `_set_layer`
+        self._bump_generation()
+        if not self.enabled:
+            return
+
+        version_keys = [
+            self.make_version_key(installation.pk)
+            for installation in installations
+            if installation.pk is not None
+        ]
+        if not version_keys:
+            return
+        # Versions are never reused, so entries cached with an expired version are not
+        # taken for current ones
+        version = uuid.uuid4().hex
+        for layer, timeout in self._layers():
+            layer.set_many(dict.fromkeys(version_keys, version), timeout)
+
+    def clear(self):
+        """Drop all the entries from the per-process caches."""
+        self.local.clear()
+        self.local_missing.clear()
+
+
+installation_cache = InstallationCache()
+
+
+class InternalTokenCache:
+    """
+    Cache of the internal-only AccessToken in use for each (application, scope) pair.
+
+    Tokens are kept in a per-process LRU cache, backed by the Django cache set in
+    `INTEGRATIONS_INTERNAL_TOKEN_CACHE_ALIAS`, until they expire.
+    """
+
+    key_prefix = "drf_integrations:internal_token"
+
+    def __init__(self):
+        self._local: Optional[LocalTTLCache] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return get_setting("INTEGRATIONS_INTERNAL_TOKEN_CACHE_ENABLED")
+
+    @lazy_cache_property
+    def local(self) -> LocalTTLCache:
+        return LocalTTLCache(
+            maxsize=get_setting("INTEGRATIONS_INTERNAL_TOKEN_CACHE_LOCAL_MAXSIZE"),
+            timeout=0,
+        )
+
+    @property
+    def shared(self) -> "Optional[BaseCache]":
+        alias = get_setting("INTEGRATIONS_INTERNAL_TOKEN_CACHE_ALIAS")
+        return caches[alias] if alias else None
+
+    @classmethod
+    def make_key(cls, application_id: Any, scope: str) -> str:
+        digest = hashlib.sha1(scope.encode()).hexdigest()
+        return f"{cls.key_prefix}:{application_id}:{digest}"
+
+    def get(self, application_id: Any, scope: str) -> "Optional[AbstractAccessToken]":
+        if not self.enabled:
+            return None
+
+        key = self.make_key(application_id, scope)
+        token = self.local.get(key)
+        if token is None and self.shared is not None:
+            token = self.shared.get(key)
+            if token is not None:
+                self.local.set(key, token, self._get_timeout(token))
+
+        if token is None or token.is_expired():
+            return None
+        return token
+
+    def set(self, token: "AbstractAccessToken"):
+        if not self.enabled:
+            return
+
+        key = self.make_key(token.application_id, token.scope)
+        timeout = self._get_timeout(token)
+        if timeout <= 0:
+            return
+
+        self.local.set(key, token, timeout)
+        if self.shared is not None:
+            self.shared.set(key, token, timeout)
+
+    def delete(self, application_id: Any, scope: str):
+        key = self.make_key(application_id, scope)
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        """Drop all the entries from the per-process cache."""
+        self.local.clear()
+
+    @staticmethod
+    def _get_timeout(token: "AbstractAccessToken") -> int:
+        return int((token.expires - timezone.now()).total_seconds())
+
+
+internal_token_cache = InternalTokenCache()
+
+
+class InternalApplicationCache:
+    """
+    Per-process map from the name of an internal integration to its Application, so that
+    resolving internal applications is a read instead of an ``update_or_create``.
+
+    Entries are dropped when the application is saved or deleted in this process, when
+    the registry is synced, and after `INTEGRATIONS_INTERNAL_APPLICATION_CACHE_TIMEOUT`
+    seconds, which bounds how long changes made by other processes go unnoticed (set it
+    to 0 to disable the cache). Copies of the cached application are returned, so
+    callers can modify them freely.
+    """
+
+    maxsize = 1024
+
+    def __init__(self):
+        self._local: Optional[LocalTTLCache] = None
+        self._lock = threading.Lock()
+
+    @lazy_cache_property
+    def local(self) -> LocalTTLCache:
+        return LocalTTLCache(
+            maxsize=self.maxsize,
+            timeout=get_setting("INTEGRATIONS_INTERNAL_APPLICATION_CACHE_TIMEOUT"),
+        )
+
+    def get(self, using: str, name: str) -> "Optional[AbstractApplication]":
+        application = self.local.get((using, name))
+        return copy.copy(application) if application is not None else None
+
+    def set(self, using: str, application: "AbstractApplication"):
+        self.local.set((using, application.internal_integration_name), copy.copy(application))
+
+    def invalidate(self, name: str):
+        """Drop the application of the given internal integration, for every DB."""
+        self.invalidate_many([name])
+
+    def invalidate_many(self, names: Iterable[str]):
+        """Bulk version of `invalidate`."""
+        if self._local is None:
+            return
+        names = set(names)
+        if names:
+            self._local.delete_matching(lambda key: key[1] in names)
+
+    def clear(self):
+        if self._local is not None:
+            self._local.clear()
+
+
+internal_application_cache = InternalApplicationCache()
+
+
+class RecentWritesCache:
+    """
+    Installations written in the last `INTEGRATIONS_READ_REPLICA_STICKINESS` seconds,
+    by pk and by target, so that reading them again can be sent to the primary DB until
+    the read replicas have caught up (see `drf_integrations.routers`).
+
+    Writes are kept in a per-process cache, backed by the Django cache set in
+    `INTEGRATIONS_READ_REPLICA_CACHE_ALIAS`, so that the writes made by other processes
+    are seen too.
+    """
+
+    key_prefix = "drf_integrations:recent_write"
+    maxsize = 10000
+
+    def __init__(self):
+        self._local: Optional[LocalTTLCache] = None
+        self._lock = threading.Lock()
+
+    @lazy_cache_property
+    def local(self) -> LocalTTLCache:
+        return LocalTTLCache(maxsize=self.maxsize, timeout=self.timeout)
+
+    @property
+    def shared(self) -> "Optional[BaseCache]":
+        alias = get_setting("INTEGRATIONS_READ_REPLICA_CACHE_ALIAS")
+        return caches[alias] if alias else None
+
+    @property
+    def timeout(self) -> int:
+        return get_setting("INTEGRATIONS_READ_REPLICA_STICKINESS")
+
+    @classmethod
+    def make_installation_key(cls, pk: Any) -> str:
+        return f"{cls.key_prefix}:installation:{pk}"
+
+    @classmethod
+    def make_target_key(cls, target_id: Any) -> str:
+        return f"{cls.key_prefix}:target:{target_id}"
+
+    @classmethod
+    def make_keys(cls, installation: "AbstractApplicationInstallation") -> List[str]:
+        from drf_integrations.models import get_application_installation_install_attribute_name
+
+        keys = [cls.make_installation_key(installation.pk)]
+        target_id = getattr(installation, get_application_installation_install_attribute_name())
+        if target_id is not None:
+            keys.append(cls.make_target_key(target_id))
+        return keys
+
+    def add_many(self, installations: "Iterable[AbstractApplicationInstallation]"):
+        keys = [
+            key
+            for installation in installations
+            if installation.pk is not None
+            for key in self.make_keys(installation)
+        ]
+        if not keys:
+            return
+        for key in keys:
+            self.local.set(key, True)
+        shared = self.shared
+        if shared is not None:
+            shared.set_many(dict.fromkeys(keys, True), self.timeout)
+
+    def has_installation(self, installation: "AbstractApplicationInstallation") -> bool:
+        """Whether the installation, or another one of its target, was written recently."""
+        return self._has_any(self.make_keys(installation))
+
+    def has_target(self, target_id: Any) -> bool:
+        """Whether an installation of the target was written recently."""
+        return self._has_any([self.make_target_key(target_id)])
+
+    def _has_any(self, keys: List[str]) -> bool:
+        if any(self.local.get(key) for key in keys):
+            return True
+
+        shared = self.shared
+        if shared is None:
+            return False
+        found = shared.get_many(keys)
+        for key in found:
+            self.local.set(key, True)
+        return bool(found)
+
+    def clear(self):
+        if self._local is not None:
+            self._local.clear()
+
+
+recent_writes = RecentWritesCache()
+
+
+class ClientPool:
+    """
+    Per-process pool of API clients, so that clients and their underlying connections
+    are reused across requests instead of being built for every context.
+
+    Clients are keyed by integration, installation and a digest of the installation
+    config, and dropped when the pool is full (least recently used first), when they
+    have not been used for `INTEGRATIONS_CLIENT_POOL_IDLE_TIMEOUT` seconds or when
+    their installation is saved.
+    """
+
+    def __init__(self):
+        self._local: Optional[LocalTTLCache] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return get_setting("INTEGRATIONS_CLIENT_POOL_ENABLED")
+
+    @lazy_cache_property
+    def local(self) -> LocalTTLCache:
+        return LocalTTLCache(
+            maxsize=get_setting("INTEGRATIONS_CLIENT_POOL_MAXSIZE"),
+            timeout=get_setting("INTEGRATIONS_CLIENT_POOL_IDLE_TIMEOUT"),
+        )
+
+    @staticmethod
+    def make_key(integration: "BaseIntegration", context: "Context") -> Tuple[str, Any, str]:
+        config = json.dumps(context.installation.config, sort_keys=True, cls=DjangoJSONEncoder)
+        digest = hashlib.sha1(config.encode()).hexdigest()
+        return integration.name, context.installation.pk, digest
+
+    def get_or_create(
+        self,
+        integration: "BaseIntegration",
+        context: "Context",
+        factory: "Callable[[], BaseClient]",
+    ) -> "BaseClient":
+        """
+        Return the pooled client for the integration and context, creating it with
+        ``factory`` if there is none. Clients for unsaved installations are not pooled.
+        """
+        if not self.enabled or context.installation.pk is None:
+            return factory()
+
+        key = self.make_key(integration, context)
+        client = self.local.get(key)
+        if client is None:
+            client = factory()
+        # Setting the client again resets its idle time
+        self.local.set(key, client)
+        return client
+
+    def evict(self, installation: "AbstractApplicationInstallation"):
+        """Drop all the clients of the given installation."""
+        self.evict_many([installation])
+
+    def evict_many(self, installations: "Iterable[AbstractApplicationInstallation]"):
+        """Bulk version of `evict`."""
+        if self._local is None:
+            return
+        pks = {installation.pk for installation in installations} - {None}
+        if pks:
+            self._local.delete_matching(lambda key: key[1] in pks)
+
+    def clear(self):
+        if self._local is not None:
+            self._local.clear()
+
+
+client_pool = ClientPool()
+
+
+class BloomFilter:
+    """
+    Thread-safe Bloom filter of strings, sized for ``capacity`` items with a false
+    positive rate of ``error_rate``. Once it holds ``capacity`` items it is emptied, so
+    that the false positive rate stays bounded.
+    """
+
+    def __init__(self, *, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
+
+    def add(self, item: str):
+        indexes = list(self._indexes(item))
+        with self._lock:
+            if self._count >= self.capacity:
+                self.clear()
+            for index in indexes:
+                self._bits[index >> 3] |= 1 << (index & 7)
+            self._count += 1
+
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+        self._count = 0
+
+    def _indexes(self, item: str) -> Iterable[int]:
+        # Double hashing over the two halves of a single digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+
+class WebhookDeliveryCache:
+    """
+    Per-process Bloom filter of the webhook deliveries already stored, so that new
+    deliveries are stored without checking for duplicates first, and only possible
+    duplicates are looked up in the DB. Sized by `INTEGRATIONS_WEBHOOK_BLOOM_CAPACITY`
+    and `INTEGRATIONS_WEBHOOK_BLOOM_ERROR_RATE`.
+    """
+
+    def __init__(self):
+        self._filter: Optional[BloomFilter] = None
+        self._lock = threading.Lock()
+
+    @lazy_cache_property
+    def filter(self) -> BloomFilter:
+        return BloomFilter(
+            capacity=get_setting("INTEGRATIONS_WEBHOOK_BLOOM_CAPACITY"),
+            error_rate=get_setting("INTEGRATIONS_WEBHOOK_BLOOM_ERROR_RATE"),
+        )
+
+    @staticmethod
+    def make_key(installation_id: Any, delivery_id: str) -> str:
+        return f"{installation_id}:{delivery_id}"
+
+    def might_contain(self, installation_id: Any, delivery_id: str) -> bool:
+        return self.make_key(installation_id, delivery_id) in self.filter
+
+    def add(self, installation_id: Any, delivery_id: str):
+        self.filter.add(self.make_key(installation_id, delivery_id))
+
+    def clear(self):
+        if self._filter is not None:
+            with self._lock:
+                self._filter.clear()
+
+
+webhook_delivery_cache = WebhookDeliveryCache()
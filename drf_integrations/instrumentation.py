@@ -0,0 +1,258 @@
+"""
+Optional instrumentation of the authentication pipeline.
+
+Authentication backends split their work in phases (e.g. fetching the token, looking up
+the installation or checking a signature) and wrap each one with `instrument`, which
+reports its duration, number of queries and outcome, together with the integration
+name, to the sink set in `INTEGRATIONS_INSTRUMENTATION_SINK`. When no sink is set,
+`instrument` returns a shared no-op context manager, so the overhead is a settings
+lookup per phase.
+
+The sink setting can be a sink instance or a dotted path to a sink instance, a sink
+class (which is instantiated without arguments) or a plain callable, which is called
+with the same keyword arguments as `BaseSink.record`.
+"""
+from typing import Any, Callable, Optional, Tuple
+
+import logging
+import time
+from contextlib import ExitStack
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from drf_integrations.utils import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSink:
+    def record(
+        self,
+        phase: str,
+        *,
+        integration: Optional[str],
+        duration: float,
+        queries: int,
+        success: bool,
+    ):
+        """
+        Record a phase of the authentication pipeline.
+
+        :param phase: Name of the phase, e.g. ``token`` or ``installation``
+        :param integration: Name of the integration, if known
+        :param duration: Time spent in the phase, in seconds
+        :param queries: Number of queries run in the phase, in the current thread
+        :param success: Whether the phase completed without raising an exception
+        """
+        raise NotImplementedError()
+
+
+class CallableSink(BaseSink):
+    """Sink forwarding the records to a callable."""
+
+    def __init__(self, func: Callable[..., Any]):
+        self.func = func
+
+    def record(self, phase: str, **kwargs):
+        self.func(phase, **kwargs)
+
+
+class LoggingSink(BaseSink):
+    """Sink logging every record to the ``drf_integrations.instrumentation`` logger."""
+
+    level = logging.DEBUG
+
+    def record(self, phase: str, **kwargs):
+        logger.log(
+            self.level, "drf_integrations.instrumentation.phase", extra=dict(phase=phase, **kwargs)
+        )
+
+
+class StatsdSink(BaseSink):
+    """
+    Sink sending the records to a statsd-style client (i.e. with ``timing`` and
+    ``incr`` methods), as ``<prefix>.<phase>.<integration>.<metric>`` metrics:
+    ``duration`` (ms), ``queries`` and ``success`` or ``failure``.
+
+    If no client is given, a ``statsd.StatsClient`` with its default settings is used.
+    """
+
+    prefix = "drf_integrations"
+
+    def __init__(self, client: Any = None, *, prefix: Optional[str] = None):
+        if client is None:
+            try:
+                from statsd import StatsClient
+            except ImportError:
+                raise ImportError(
+                    "StatsdSink requires the statsd package when no client is given."
+                ) from None
+            client = StatsClient()
+        self.client = client
+        if prefix is not None:
+            self.prefix = prefix
+
+    def record(
+        self,
+        phase: str,
+        *,
+        integration: Optional[str],
+        duration: float,
+        queries: int,
+        success: bool,
+    ):
+        name = f"{self.prefix}.{phase}.{integration or 'unknown'}"
+        self.client.timing(f"{name}.duration", duration * 1000)
+        self.client.incr(f"{name}.queries", queries)
+        self.client.incr(f"{name}.{'success' if success else 'failure'}")
+
+
+class PrometheusSink(BaseSink):
+    """
+    Sink updating Prometheus metrics, labelled by phase, integration and outcome:
+    a ``<namespace>_phase_duration_seconds`` histogram and a
+    ``<namespace>_phase_queries_total`` counter.
+    """
+
+    namespace = "drf_integrations"
+
+    def __init__(self, *, namespace: Optional[str] = None, registry: Any = None):
+        try:
+            import prometheus_client
+        except ImportError:
+            raise ImportError("PrometheusSink requires the prometheus_client package.") from None
+        if namespace is not None:
+            self.namespace = namespace
+        kwargs = dict(labelnames=("phase", "integration", "outcome"))
+        if registry is not None:
+            kwargs["registry"] = registry
+        self.duration = prometheus_client.Histogram(
+            f"{self.namespace}_phase_duration_seconds",
+            "Time spent in a phase of the authentication pipeline.",
+            **kwargs,
+        )
+        self.queries = prometheus_client.Counter(
+            f"{self.namespace}_phase_queries_total",
+            "Queries run in a phase of the authentication pipeline.",
+            **kwargs,
+        )
+
+    def record(
+        self,
+        phase: str,
+        *,
+        integration: Optional[str],
+        duration: float,
+        queries: int,
+        success: bool,
+    ):
+        labels = (phase, integration or "unknown", "success" if success else "failure")
+        self.duration.labels(*labels).observe(duration)
+        self.queries.labels(*labels).inc(queries)
+
+
+class _NullPhase:
+    """No-op phase, returned by `instrument` when instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullPhase":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+    def __setattr__(self, name: str, value: Any):
+        # The integration name may be set once known, ignore it
+        pass
+
+
+_null_phase = _NullPhase()
+
+
+class Phase:
+    """
+    Context manager timing a phase and counting the queries run in it, in the current
+    thread. The integration name can be set within the block, once it is known.
+    """
+
+    def __init__(self, sink: BaseSink, name: str, integration: Optional[str] = None):
+        self.sink = sink
+        self.name = name
+        self.integration = integration
+        self.queries = 0
+        self._exit_stack: Optional[ExitStack] = None
+        self._start = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self) -> "Phase":
+        self._exit_stack = ExitStack()
+        for connection in connections.all():
+            self._exit_stack.enter_context(connection.execute_wrapper(self))
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start
+        self._exit_stack.close()
+        try:
+            self.sink.record(
+                self.name,
+                integration=self.integration,
+                duration=duration,
+                queries=self.queries,
+                success=exc_type is None,
+            )
+        except Exception:
+            # Metrics must never break authentication
+            logger.exception("drf_integrations.instrumentation.sink_error")
+        return None
+
+
+_sink_cache: Tuple[Any, Optional[BaseSink]] = (None, None)
+
+
+def get_sink() -> Optional[BaseSink]:
+    """
+    Return the sink set in `INTEGRATIONS_INSTRUMENTATION_SINK`, if any. The sink is
+    built once and reused for as long as the setting does not change.
+    """
+    global _sink_cache
+
+    value = get_setting("INTEGRATIONS_INSTRUMENTATION_SINK")
+    if not value:
+        return None
+
+    cached_value, sink = _sink_cache
+    if cached_value is not value:
+        sink = value
+        if isinstance(sink, str):
+            sink = import_string(sink)
+        if isinstance(sink, type):
+            sink = sink()
+        if not isinstance(sink, BaseSink):
+            if not callable(sink):
+                raise TypeError(
+                    "INTEGRATIONS_INSTRUMENTATION_SINK must be a sink or a callable, "
+                    f"got {sink!r}"
+                )
+            sink = CallableSink(sink)
+        _sink_cache = (value, sink)
+    return sink
+
+
+def instrument(name: str, integration: Optional[str] = None):
+    """
+    Return a context manager reporting the phase ``name`` of the authentication
+    pipeline to the configured sink, or a no-op one if there is none.
+
+    >>> with instrument("installation", integration.name):
+    ...     installation = get_installation()
+    """
+    sink = get_sink()
+    if sink is None:
+        return _null_phase
+    return Phase(sink, name, integration)
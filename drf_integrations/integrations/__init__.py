@@ -3,6 +3,9 @@ from drf_integrations.integrations.registry import Registry
 default_registry = Registry()
 
 register = default_registry.register
+register_lazy = default_registry.register_lazy
+preload = default_registry.preload
 get = default_registry.get
 get_all = default_registry.get_all
+get_names = default_registry.get_names
 get_urls = default_registry.get_urls
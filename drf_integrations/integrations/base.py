@@ -1,22 +1,52 @@
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Type
 
 import copy
 from django import forms
 from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+
+from drf_integrations import routers
 
 if TYPE_CHECKING:
     from rest_framework.request import Request
 
     from drf_integrations import models
+    from drf_integrations.signatures import SignatureVerifier
 
 
 @dataclass
 class Context:
+    """
+    Context of an installation, usually linked to a request as `request.auth_context`.
+
+    Data derived from the installation is computed lazily and memoized, get a new
+    context from `installation.get_context()` after changing the installation.
+    """
+
     installation: "models.AbstractApplicationInstallation"
 
+    @cached_property
+    def integration(self) -> "BaseIntegration":
+        return self.installation.application.get_integration_instance()
+
+    @cached_property
+    def config(self) -> Optional[Dict[str, Any]]:
+        return self.integration.get_config(self)
+
+    @cached_property
+    def client(self) -> "BaseClient":
+        return self.integration.get_client(self)
+
 
 class BaseIntegrationForm(forms.Form):
+    indexed_fields: Tuple[str, ...] = ()
+    """
+    Fields queried directly in the config (e.g. ``config__<field>=...`` in a uniqueness
+    check), which the ``makeconfigindexes`` command creates expression indexes for.
+    Lookups on the integration's `lookup_keys` go through the lookup table instead.
+    """
+
     @classmethod
     def _get_install_attribute_id_name(cls):
         from drf_integrations import models
@@ -95,7 +125,8 @@ class BaseIntegrationForm(forms.Form):
                     f"given application {self._application}"
                 )
             target_filter = {target_id_name: target.pk}
-            self._installation = self._application.installations.filter(**target_filter).first()
+            installations = routers.using_for_target(self._application.installations, target.pk)
+            self._installation = installations.filter(**target_filter).first()
 
         if self._installation:
             config = self._installation.get_config()
@@ -105,6 +136,12 @@ class BaseIntegrationForm(forms.Form):
 
 
 class BaseClient(object):
+    is_reusable: bool = True
+    """
+    Whether a client instance can be shared between requests (and threads), so it can
+    be kept in the client pool (`INTEGRATIONS_CLIENT_POOL_ENABLED`).
+    """
+
     def __init__(self, **kwargs):
         ...
 
@@ -114,6 +151,14 @@ class BaseClient(object):
         initkwargs.update(kwargs)
         return cls(**initkwargs)
 
+    def send_events(self, events: "List[models.OutboxEvent]"):
+        """
+        Send a batch of outbox events of the same installation to the third party.
+
+        :raises Exception: If the events could not be sent, so that they are retried
+        """
+        raise NotImplementedError()
+
 
 class BaseIntegration:
     name: str
@@ -123,6 +168,16 @@ class BaseIntegration:
     is_local: bool = False
     is_installable: bool = True
     is_uninstallable: bool = False
+    lookup_keys: Tuple[str, ...] = ()
+    """
+    Config keys used to look up installations, e.g. in `get_installation_lookup_from_request`.
+    Their values are stored in an indexed table so lookups do not scan the config column.
+    """
+    signature_verifier: "Optional[SignatureVerifier]" = None
+    """
+    Verifier of the requests signed by the third party, used by default by
+    `IntegrationSignatureAuthentication`.
+    """
 
     def __init__(self, **kwargs):
         ...
@@ -202,8 +257,52 @@ class BaseIntegration:
         return True
 
     def get_client(self, context: Context, **kwargs) -> BaseClient:
-        """Return the API client for the integration."""
-        return self.client_class.from_context(context, **kwargs)
+        """
+        Return the API client for the integration.
+
+        Reusable clients without custom ``kwargs`` are taken from the client pool when
+        it is enabled.
+        """
+        from drf_integrations.cache import client_pool
+
+        if kwargs or not self.client_class.is_reusable:
+            return self.client_class.from_context(context, **kwargs)
+        return client_pool.get_or_create(
+            self, context, lambda: self.client_class.from_context(context)
+        )
+
+    def enqueue_event(
+        self, context: Context, event_type: str, payload: Optional[Dict] = None
+    ) -> "models.OutboxEvent":
+        """
+        Store an event for the installation in the context, within the current
+        transaction, to be dispatched later by the `dispatchoutbox` command.
+        """
+        from drf_integrations.models import OutboxEvent
+
+        return OutboxEvent.objects.enqueue(
+            installation=context.installation, event_type=event_type, payload=payload
+        )
+
+    def dispatch_events(self, context: Context, events: "List[models.OutboxEvent]"):
+        """
+        Dispatch a batch of outbox events of the installation in the context.
+
+        Override to customise how events are delivered, by default they are sent through
+        the API client.
+
+        :raises Exception: If the events could not be dispatched, so that they are retried
+        """
+        context.client.send_events(events)
+
+    def process_webhook(self, context: Context, event: "models.WebhookEvent"):
+        """
+        Process a webhook delivery for the installation in the context, stored by
+        `WebhookIngestionViewSet`.
+
+        :raises Exception: If the event could not be processed, so that it is retried
+        """
+        raise NotImplementedError()
 
     @classmethod
     def get_installation_lookup_from_config_values(cls, **kwargs) -> Dict:
@@ -212,14 +311,24 @@ class BaseIntegration:
         `drf_integrations.models.AbstractApplicationInstallation`.
         The filter should always return just 1 result.
 
+        Keys declared in `lookup_keys` are resolved through the indexed
+        `ApplicationInstallationLookup` table, any other key filters the config directly.
+
         :param kwargs: Config values to uniquely identify an installation
         """
-        kwargs = {f"config__{key}": value for key, value in kwargs.items()}
+        from drf_integrations.models import ApplicationInstallationLookup
+
+        indexed = {key: value for key, value in kwargs.items() if key in cls.lookup_keys}
+        lookup = {f"config__{key}": value for key, value in kwargs.items() if key not in indexed}
+        if indexed:
+            lookup.update(
+                pk__in=ApplicationInstallationLookup.objects.get_installation_ids(**indexed)
+            )
         if cls.is_local:
-            kwargs.update(application__local_integration_name=cls.name)
+            lookup.update(application__local_integration_name=cls.name)
         else:
-            kwargs.update(application__internal_integration_name=cls.name)
-        return kwargs
+            lookup.update(application__internal_integration_name=cls.name)
+        return lookup
 
     @classmethod
     def get_installation_lookup_from_request(
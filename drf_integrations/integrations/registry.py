@@ -1,11 +1,24 @@
-from typing import Dict, Iterable, List, Optional, Set, Type, Union
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Type, Union
 
 import inspect
-from django.urls import include, path
+import threading
+from django.urls import Resolver404, URLResolver, include, path
+from django.urls.resolvers import RoutePattern
+from django.utils.module_loading import import_string
 
 from drf_integrations.exceptions import ImproperlyConfigured
 from drf_integrations.integrations.base import BaseIntegration
-from drf_integrations.utils import is_instance_of_all
+
+
+@dataclass
+class LazyIntegration:
+    """Integration registered by its dotted path, imported the first time it is needed."""
+
+    path: str
+    name: str
+    is_local: bool = False
+    kwargs: Dict[str, Any] = field(default_factory=dict)
 
 
 class Registry:
@@ -13,17 +26,92 @@ class Registry:
         pass
 
     def __init__(self):
+        self._lock = threading.RLock()
         self.integrations: Dict[str, BaseIntegration] = {}
 
+    @property
+    def integrations(self) -> Dict[str, BaseIntegration]:
+        """Integrations already loaded, by name."""
+        return self._integrations
+
+    @integrations.setter
+    def integrations(self, value: Dict[str, BaseIntegration]):
+        self._integrations = value
+        self._lazy_integrations: Dict[str, LazyIntegration] = {}
+        self._clear_indexes()
+
+    def _clear_indexes(self):
+        self._by_locality: Dict[Optional[bool], FrozenSet[BaseIntegration]] = {}
+        self._by_class: Dict[type, FrozenSet[BaseIntegration]] = {}
+        self._get_all_cache: Dict[Tuple, FrozenSet[BaseIntegration]] = {}
+        self._urls_cache: Dict[str, List] = {}
+
     def register(self, integration_cls: Type[BaseIntegration], **kwargs) -> BaseIntegration:
         """Register an integration."""
-        if integration_cls.name in self.integrations:
-            raise ImproperlyConfigured(
-                f"Integration with name {integration_cls.name} already registered"
-            )
-        self.integrations[integration_cls.name] = integration_cls(**kwargs)
+        with self._lock:
+            self._check_name_available(integration_cls.name)
+            self.integrations[integration_cls.name] = integration_cls(**kwargs)
+            self._clear_indexes()
         return self.integrations[integration_cls.name]
 
+    def register_lazy(self, path: str, *, name: str, is_local: bool = False, **kwargs):
+        """
+        Register an integration by its dotted path, without importing it until it is
+        first needed (e.g. by `get`), so that processes do not import the SDKs of
+        integrations they never use. ``name`` and ``is_local`` must match the attributes
+        of the integration class.
+        """
+        with self._lock:
+            self._check_name_available(name)
+            self._lazy_integrations[name] = LazyIntegration(
+                path=path, name=name, is_local=is_local, kwargs=kwargs
+            )
+
+    def preload(self):
+        """Import and instantiate all the lazily registered integrations."""
+        for name in list(self._lazy_integrations):
+            self._load(name)
+
+    def get_names(self, *, is_local: Optional[bool] = None) -> Set[str]:
+        """Get the names of all the integrations, without loading them."""
+        names = {
+            name
+            for name, integration in self.integrations.items()
+            if is_local is None or integration.is_local is is_local
+        }
+        names.update(
+            name
+            for name, integration in self._lazy_integrations.items()
+            if is_local is None or integration.is_local is is_local
+        )
+        return names
+
+    def _check_name_available(self, name: str):
+        if name in self.integrations or name in self._lazy_integrations:
+            raise ImproperlyConfigured(f"Integration with name {name} already registered")
+
+    def _load(self, name: str) -> Optional[BaseIntegration]:
+        with self._lock:
+            lazy_integration = self._lazy_integrations.get(name)
+            if lazy_integration is None:
+                return self.integrations.get(name)
+
+            integration_cls = import_string(lazy_integration.path)
+            if (
+                integration_cls.name != lazy_integration.name
+                or integration_cls.is_local is not lazy_integration.is_local
+            ):
+                raise ImproperlyConfigured(
+                    f"Integration {lazy_integration.path} was registered with name "
+                    f"{lazy_integration.name} and is_local {lazy_integration.is_local}, "
+                    f"but it has name {integration_cls.name} and is_local "
+                    f"{integration_cls.is_local}"
+                )
+            self.integrations[name] = integration_cls(**lazy_integration.kwargs)
+            del self._lazy_integrations[name]
+            self._clear_indexes()
+            return self.integrations[name]
+
     def get_all(
         self, *implements: Iterable[type], is_local: Optional[bool] = None
     ) -> Set[BaseIntegration]:
@@ -31,42 +119,82 @@ class Registry:
         Get all integrations. If ``implements`` is provided, only return integrations
         that are instances of **all** of the classes in ``implements``.
 
+        Results are computed from indexes by locality and by class, and cached per
+        arguments until another integration is registered. Lazily registered
+        integrations that may match are loaded.
+
         :raises TypeError: If any element of ``implements`` is not a type.
         """
-        if is_local is not None:
-            integrations = {
-                value for value in self.integrations.values() if value.is_local is is_local
+        if self._lazy_integrations:
+            # Implemented classes are only known once the integrations are loaded
+            for name in self.get_names(is_local=None if implements else is_local):
+                self._load(name)
+
+        key = (implements, is_local)
+        try:
+            integrations = self._get_all_cache.get(key)
+        except TypeError:
+            # Unhashable elements are not types either
+            integrations = None
+
+        if integrations is None:
+            if any(not isinstance(classinfo, type) for classinfo in implements):
+                raise TypeError("classes must contain types")
+            integrations = self._get_by_locality(is_local)
+            for classinfo in implements:
+                integrations = integrations & self._get_by_class(classinfo)
+            self._get_all_cache[key] = integrations
+
+        return set(integrations)
+
+    def _get_by_locality(self, is_local: Optional[bool]) -> FrozenSet[BaseIntegration]:
+        if not self._by_locality:
+            integrations = frozenset(self.integrations.values())
+            self._by_locality = {
+                None: integrations,
+                True: frozenset(value for value in integrations if value.is_local is True),
+                False: frozenset(value for value in integrations if value.is_local is False),
             }
-        else:
-            integrations = set(self.integrations.values())
+        return self._by_locality[is_local]
 
-        # Filter by implements
-        return set(
-            integration
-            for integration in integrations
-            if is_instance_of_all(integration, implements)
-        )
+    def _get_by_class(self, classinfo: type) -> FrozenSet[BaseIntegration]:
+        if classinfo not in self._by_class:
+            self._by_class[classinfo] = frozenset(
+                value for value in self.integrations.values() if isinstance(value, classinfo)
+            )
+        return self._by_class[classinfo]
 
     def get(self, name_or_class: Union[str, Type[BaseIntegration]]) -> BaseIntegration:
         """
         Get integration by name or class.
         Raises Registry.IntegrationUnavailableException
         """
-        try:
-            if isinstance(name_or_class, str):
-                integration = self.integrations[name_or_class]
-            elif inspect.isclass(name_or_class) and issubclass(name_or_class, BaseIntegration):
-                integration = self.integrations[name_or_class.name]
-            else:
-                raise ValueError("invalid name or base integration class")
-        except KeyError as err:
-            raise Registry.IntegrationUnavailableException() from err
+        if isinstance(name_or_class, str):
+            name = name_or_class
+        elif inspect.isclass(name_or_class) and issubclass(name_or_class, BaseIntegration):
+            name = name_or_class.name
+        else:
+            raise ValueError("invalid name or base integration class")
 
+        integration = self.integrations.get(name) or self._load(name)
+        if integration is None:
+            raise Registry.IntegrationUnavailableException()
         return integration
 
     def get_urls(self, basepath="api/integrations/") -> List:
-        """Get URLConf for all registered integrations."""
+        """
+        Get URLConf for all registered integrations.
+
+        The URLConf is built once per ``basepath`` until another integration is
+        registered. Integration URLs are resolved by a single `IntegrationURLResolver`,
+        which goes straight to the patterns of the integration named in the path.
+        """
+        self.preload()
+        if basepath in self._urls_cache:
+            return list(self._urls_cache[basepath])
+
         urls = []
+        resolvers = {}
         for name, integration_cls in self.integrations.items():
             # Legacy unprefixed URLs
             urls.extend(integration_cls.get_legacy_unprefixed_urls())
@@ -74,13 +202,48 @@ class Registry:
             # Integration URLs
             integration_urls = integration_cls.get_urls()
             if integration_urls:
-                urls += [
-                    path(
-                        f"{basepath}{name}/",
-                        include(
-                            (integration_urls, integration_cls.namespace),
-                            namespace=integration_cls.namespace,
-                        ),
-                    )
-                ]
-        return urls
+                resolvers[name] = path(
+                    f"{basepath}{name}/",
+                    include(
+                        (integration_urls, integration_cls.namespace),
+                        namespace=integration_cls.namespace,
+                    ),
+                )
+        if resolvers:
+            urls.append(IntegrationURLResolver(basepath, resolvers))
+
+        self._urls_cache[basepath] = urls
+        return list(urls)
+
+
+class IntegrationURLResolver(URLResolver):
+    """
+    Resolver for the URLs of all the integrations under ``basepath``, which dispatches
+    by the integration name that follows it instead of trying every integration in
+    turn, so resolving does not get slower as integrations are added.
+
+    It does not consume any part of the path itself, so reversing works as if the
+    resolvers of the integrations were included directly.
+    """
+
+    def __init__(self, basepath: str, resolvers: Dict[str, URLResolver]):
+        super().__init__(RoutePattern(""), list(resolvers.values()))
+        self.basepath = basepath
+        self.resolvers = resolvers
+        # Resolvers that do not consume the path either, so that the matches they return
+        # include the route, namespace and tried patterns of the integration resolver
+        self._dispatch = {
+            name: URLResolver(RoutePattern(""), [resolver]) for name, resolver in resolvers.items()
+        }
+
+    def resolve(self, path):
+        path = str(path)
+        if path.startswith(self.basepath):
+            name = path[len(self.basepath) :].split("/", 1)[0]
+            resolver = self._dispatch.get(name)
+            if resolver is not None:
+                return resolver.resolve(path)
+        raise Resolver404({"tried": [], "path": path})
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.basepath} ({len(self.resolvers)} integrations)>"
@@ -0,0 +1,57 @@
+from typing import Tuple, Type
+
+import time
+from django.core.management.base import BaseCommand
+from django.db import models
+
+
+class BaseEventsCommand(BaseCommand):
+    """
+    Runs ``method_name`` of the ``model`` manager, which claims a batch of pending events
+    and returns how many of them were processed and failed, until there are none left.
+    With ``--loop``, keeps polling for new events instead of exiting.
+    """
+
+    model: Type[models.Model]
+    method_name: str
+    success_message: str
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of events to claim from the DB at a time",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new events instead of exiting when there are none",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls when there are no pending events",
+        )
+
+    def run_batch(self, batch_size: int) -> Tuple[int, int]:
+        return getattr(self.model.objects, self.method_name)(batch_size=batch_size)
+
+    def handle(self, *args, **options):
+        total_processed = total_failed = 0
+        while True:
+            processed, failed = self.run_batch(options["batch_size"])
+            total_processed += processed
+            total_failed += failed
+            if processed or failed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{self.success_message}: {total_processed} processed, {total_failed} failed"
+            )
+        )
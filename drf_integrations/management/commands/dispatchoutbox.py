@@ -0,0 +1,9 @@
+from drf_integrations.management.base import BaseEventsCommand
+from drf_integrations.models import OutboxEvent
+
+
+class Command(BaseEventsCommand):
+    help = "Dispatches the pending outbox events to their integrations"
+    model = OutboxEvent
+    method_name = "dispatch"
+    success_message = "Outbox events dispatched"
@@ -0,0 +1,119 @@
+import os
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import migrations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from drf_integrations import integrations, operations
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a migration with indexes over the installation config for the indexed fields "
+        "of the config forms of the registered integrations"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_label",
+            nargs="?",
+            help="App to create the migration in. Defaults to the app of the installation model",
+        )
+        parser.add_argument(
+            "--gin",
+            action="store_true",
+            help="Also create a GIN jsonb_path_ops index over the whole config (PostgreSQL)",
+        )
+        parser.add_argument(
+            "--name", help="Use this name for the migration file instead of a generated one"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Just show the migration that would be created, without writing it",
+        )
+
+    def handle(self, *args, **options):
+        model_label = settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL
+        model_app_label = apps.get_model(model_label)._meta.app_label
+        app_label = options["app_label"] or model_app_label
+        try:
+            apps.get_app_config(app_label)
+        except LookupError as err:
+            raise CommandError(str(err)) from err
+
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        existing = set()
+        for migration in loader.disk_migrations.values():
+            for operation in migration.operations:
+                if isinstance(operation, operations.BaseConfigIndexOperation):
+                    existing.add(operation.index_name)
+
+        new_operations = []
+        for key in self.get_indexed_fields():
+            operation = operations.AddConfigKeyIndex(model=model_label, key=key)
+            if operation.index_name not in existing:
+                new_operations.append(operation)
+        if options["gin"] and operations.AddConfigGinIndex.index_name not in existing:
+            new_operations.append(operations.AddConfigGinIndex(model=model_label))
+
+        if not new_operations:
+            self.stdout.write("No changes detected")
+            return
+
+        dependencies = [
+            (label, name)
+            for label, name in loader.graph.leaf_nodes()
+            if label in (app_label, model_app_label)
+        ]
+        app_leaf = next((name for label, name in dependencies if label == app_label), None)
+        number = MigrationAutodetector.parse_number(app_leaf) + 1 if app_leaf else 1
+        name = options["name"] or (
+            new_operations[0].migration_name_fragment
+            if len(new_operations) == 1
+            else "config_indexes"
+        )
+
+        migration = type("Migration", (migrations.Migration,), {})(
+            f"{number:04d}_{name}", app_label
+        )
+        migration.dependencies = dependencies
+        migration.operations = new_operations
+        writer = MigrationWriter(migration)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Migrations for {app_label!r}:"))
+        self.stdout.write(f"  {writer.path}")
+        for operation in new_operations:
+            self.stdout.write(f"    - {operation.describe()}")
+
+        if options["dry_run"]:
+            if options["verbosity"] >= 3:
+                self.stdout.write(writer.as_string())
+            return
+
+        os.makedirs(os.path.dirname(writer.path), exist_ok=True)
+        with open(writer.path, "w", encoding="utf-8") as fh:
+            fh.write(writer.as_string())
+
+    def get_indexed_fields(self):
+        """
+        Config fields declared in the `indexed_fields` of the config forms of the
+        registered integrations, skipping the ones that are not fields of the form.
+        """
+        keys = set()
+        for integration in integrations.get_all():
+            form_class = integration.config_form_class
+            if form_class is None:
+                continue
+            for key in getattr(form_class, "indexed_fields", ()):
+                if key not in form_class.base_fields:
+                    self.stderr.write(
+                        f"Skipping indexed field {key} of {integration.name}, "
+                        f"it is not a field of {form_class.__name__}"
+                    )
+                    continue
+                keys.add(key)
+        return sorted(keys)
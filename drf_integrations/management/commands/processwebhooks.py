@@ -0,0 +1,9 @@
+from drf_integrations.management.base import BaseEventsCommand
+from drf_integrations.models import WebhookEvent
+
+
+class Command(BaseEventsCommand):
+    help = "Processes the pending webhook events with their integrations"
+    model = WebhookEvent
+    method_name = "process"
+    success_message = "Webhook events processed"
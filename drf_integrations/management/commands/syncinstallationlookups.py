@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from drf_integrations.models import (
+    ApplicationInstallationLookup,
+    get_application_installation_model,
+)
+
+
+class Command(BaseCommand):
+    help = "Synchronizes the indexed installation lookups with the installations config"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of installations to load from the DB at a time",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("==> Syncing installation lookups")
+        installations = get_application_installation_model().objects.select_related("application")
+        for installation in installations.iterator(chunk_size=options["chunk_size"]):
+            ApplicationInstallationLookup.objects.sync(installation=installation)
+        self.stdout.write(self.style.SUCCESS("Installation lookups successfully synchronized"))
@@ -1,3 +1,4 @@
+import time
 from django.core.management.base import BaseCommand
 
 from drf_integrations.models import Application
@@ -6,7 +7,32 @@ from drf_integrations.models import Application
 class Command(BaseCommand):
     help = "Synchronizes the integrations registry with the DB"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Just show the changes that would be made, without saving them",
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("==> Syncing integrations")
-        Application.objects.sync_with_integration_registry()
-        self.stdout.write(self.style.SUCCESS("Registry successfully synchronized"))
+        start = time.monotonic()
+        result = Application.objects.sync_with_integration_registry(dry_run=options["dry_run"])
+        elapsed = time.monotonic() - start
+
+        for label, names in [
+            ("Create", result.created),
+            ("Update", result.updated),
+            ("Unapprove", result.unapproved),
+        ]:
+            for name in names:
+                self.stdout.write(f"  - {label} {name}")
+        if not result.has_changes:
+            self.stdout.write("No changes detected")
+
+        if result.dry_run:
+            self.stdout.write(f"Registry diff computed in {elapsed:.3f}s")
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Registry successfully synchronized in {elapsed:.3f}s")
+            )
@@ -1,28 +1,85 @@
-from typing import TYPE_CHECKING, Type, Union
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 import datetime
+import hashlib
+import json
 import logging
-from django.db import models
+import threading
+from collections import defaultdict
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connections, models, router, transaction
 from django.utils import timezone
 from oauth2_provider.models import ApplicationManager as BaseApplicationManager
 from oauthlib.common import generate_token
 
+from drf_integrations.cache import internal_application_cache, webhook_delivery_cache
+from drf_integrations.scopes import parse_scopes
+from drf_integrations.utils import get_setting
+
 if TYPE_CHECKING:
-    from drf_integrations.integrations.base import BaseIntegration
-    from drf_integrations.models import Application
+    from drf_integrations.integrations.base import BaseIntegration, Context
+    from drf_integrations.models import (
+        AbstractApplicationInstallation,
+        AccessToken,
+        Application,
+        OutboxEvent,
+    )
 
 logger = logging.getLogger(__name__)
 
 
-class ApplicationManager(BaseApplicationManager):
+@dataclass
+class RegistrySyncResult:
+    """Changes made (or, on a dry run, to be made) by `sync_with_integration_registry`."""
+
+    created: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    unapproved: List[str] = field(default_factory=list)
+    dry_run: bool = False
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.created or self.updated or self.unapproved)
+
+
+class ApplicationQuerySet(models.QuerySet):
+    def check_scopes(self, scopes: Iterable[str]) -> Dict[Any, FrozenSet[str]]:
+        """
+        Return, for the pk of each application in the queryset, which of the given
+        scopes it is allowed. Only the pks and the allowed scopes are fetched.
+        """
+        scopes = frozenset(scopes)
+        return {
+            pk: scopes & parse_scopes(allowed_scopes)
+            for pk, allowed_scopes in self.values_list("pk", "allowed_scopes")
+        }
+
+
+class ApplicationManager(BaseApplicationManager.from_queryset(ApplicationQuerySet)):
+    def _get_internal_integration_defaults(self, *, name: str) -> Dict[str, Any]:
+        return dict(
+            name=f"{name} (Internal)",
+            client_type=self.model.CLIENT_CONFIDENTIAL,
+            is_approved=True,
+        )
+
     def _update_or_create_internal_integration(self, *, name: str) -> "Application":
         obj, __ = self.update_or_create(
             internal_integration_name=name,
-            defaults=dict(
-                name=f"{name} (Internal)",
-                client_type=self.model.CLIENT_CONFIDENTIAL,
-                is_approved=True,
-            ),
+            defaults=self._get_internal_integration_defaults(name=name),
         )
         return obj
 
@@ -37,38 +94,269 @@ class ApplicationManager(BaseApplicationManager):
                 f"An internal Application cannot be local, but {integration_class.display_name} is"
             )
 
-        return self._update_or_create_internal_integration(name=integration_class.name)
+        name = integration_class.name
+        # Not keyed by self.db, which is a random replica when reads go to replicas
+        using = self._db or router.db_for_write(self.model)
+        application = internal_application_cache.get(using, name)
+        if application is None:
+            application = self._get_or_sync_internal_integration(name=name, using=using)
+        return application
+
+    def _get_or_sync_internal_integration(self, *, name: str, using: str) -> "Application":
+        """
+        Return the application of the internal integration, only creating or updating it
+        if it is missing or differs from its defaults, and cache it for the ``using`` DB.
+        """
+        defaults = self._get_internal_integration_defaults(name=name)
+        # Read from the DB written to below, as replicas may not have the application yet
+        application = self.db_manager(using).filter(internal_integration_name=name).first()
+        if application is not None and all(
+            getattr(application, key) == value for key, value in defaults.items()
+        ):
+            internal_application_cache.set(using, application)
+            return application
+
+        application = self._update_or_create_internal_integration(name=name)
+        # Only cache the changes once they are visible to other connections
+        transaction.on_commit(
+            lambda: internal_application_cache.set(using, application),
+            using=router.db_for_write(self.model),
+        )
+        return application
+
+    def sync_with_integration_registry(self, *, dry_run: bool = False) -> RegistrySyncResult:
+        """
+        Make sure there is an approved Application for every internal integration in
+        the registry, and unapprove the ones whose integration is not registered anymore.
+
+        Existing applications are read with a single query, and the changes are written
+        with one query per kind of change.
 
-    def sync_with_integration_registry(self):
+        :param dry_run: Only compute the changes, without writing them
+        """
         from drf_integrations import integrations
 
-        installed_integrations = set(
-            self.filter(is_approved=True).values_list("internal_integration_name", flat=True)
+        names = sorted(integrations.get_names(is_local=False))
+        fields = list(self._get_internal_integration_defaults(name="").keys())
+        # Read from the DB written to below, as replicas may miss recent applications
+        manager = self.db_manager(router.db_for_write(self.model))
+        queryset = manager.filter(internal_integration_name__isnull=False)
+        existing = {
+            application.internal_integration_name: application
+            for application in queryset.only("pk", "internal_integration_name", *fields)
+        }
+
+        result = RegistrySyncResult(dry_run=dry_run)
+        to_create, to_update = [], []
+        for name in names:
+            defaults = self._get_internal_integration_defaults(name=name)
+            application = existing.get(name)
+            if application is None:
+                to_create.append(self.model(internal_integration_name=name, **defaults))
+                result.created.append(name)
+            elif any(getattr(application, key) != value for key, value in defaults.items()):
+                for key, value in defaults.items():
+                    setattr(application, key, value)
+                to_update.append(application)
+                result.updated.append(name)
+
+        registered = set(names)
+        result.unapproved = sorted(
+            name
+            for name, application in existing.items()
+            if application.is_approved and name not in registered
         )
-        updated_integrations = set()
 
-        for integration in integrations.get_all(is_local=False):
-            self._update_or_create_internal_integration(name=integration.name)
-            updated_integrations.add(integration.name)
+        if dry_run or not result.has_changes:
+            return result
 
-        self.filter(
-            internal_integration_name__in=installed_integrations - updated_integrations
-        ).update(is_approved=False)
+        with transaction.atomic(using=manager.db):
+            if to_create:
+                manager.bulk_create(to_create)
+            if to_update:
+                manager.bulk_update(to_update, fields)
+            if result.unapproved:
+                manager.filter(internal_integration_name__in=result.unapproved).update(
+                    is_approved=False
+                )
+        internal_application_cache.invalidate_many(
+            result.created + result.updated + result.unapproved
+        )
+        return result
 
 
 class ApplicationInstallationQuerySet(models.QuerySet):
+    soft_delete_batch_size = 1000
+
     def active(self):
         return self.filter(deleted_at__isnull=True)
 
+    def deleted(self):
+        return self.filter(deleted_at__isnull=False)
+
+    def delete(self) -> Tuple[int, Dict[str, int]]:
+        """
+        Soft-delete the active installations in the queryset, like
+        `AbstractApplicationInstallation.delete` does for a single installation, and
+        send the `installations_deleted` signal. Use `hard_delete` to remove the rows.
+        """
+        self._for_write = True
+        installations = list(self.active().only("pk"))
+        self._set_deleted_at(installations, timezone.now())
+        return len(installations), {self.model._meta.label: len(installations)}
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def restore(self) -> int:
+        """
+        Restore the soft-deleted installations in the queryset and send the
+        `installations_restored` signal.
+
+        :return: Number of installations restored
+        """
+        self._for_write = True
+        installations = list(self.deleted().only("pk"))
+        self._set_deleted_at(installations, None)
+        return len(installations)
+
+    restore.alters_data = True
+
+    def hard_delete(self) -> Tuple[int, Dict[str, int]]:
+        """Delete the installations in the queryset from the DB."""
+        return super().delete()
+
+    hard_delete.alters_data = True
+    hard_delete.queryset_only = True
+
+    def _set_deleted_at(
+        self,
+        installations: "List[AbstractApplicationInstallation]",
+        deleted_at: Optional[datetime.datetime],
+    ):
+        from drf_integrations.models import invalidate_installations_on_commit
+        from drf_integrations.signals import installations_deleted, installations_restored
+
+        if not installations:
+            return
+
+        now = timezone.now()
+        pks = [installation.pk for installation in installations]
+        queryset = self.model._base_manager.using(self.db)
+        for start in range(0, len(pks), self.soft_delete_batch_size):
+            queryset.filter(pk__in=pks[start : start + self.soft_delete_batch_size]).update(
+                deleted_at=deleted_at, updated_at=now
+            )
+        for installation in installations:
+            installation.deleted_at = deleted_at
+            installation.updated_at = now
+
+        invalidate_installations_on_commit(installations, using=self.db)
+        signal = installations_restored if deleted_at is None else installations_deleted
+        signal.send(sender=self.model, pks=pks, using=self.db)
+
+
+class ApplicationInstallationLookupManager(models.Manager):
+    @staticmethod
+    def get_value_digest(value: Any) -> str:
+        """Digest of a config value, stable for any JSON serializable value."""
+        return hashlib.sha256(
+            json.dumps(value, sort_keys=True, cls=DjangoJSONEncoder).encode()
+        ).hexdigest()
+
+    def get_installation_ids(self, **kwargs) -> models.QuerySet:
+        """
+        Return a subquery with the IDs of the installations whose config contains all
+        the given values. Only keys declared in the integration's `lookup_keys` are
+        stored, any other key will not match.
+        """
+        condition = models.Q()
+        for key, value in kwargs.items():
+            condition |= models.Q(key=key, value_digest=self.get_value_digest(value))
+        queryset = self.filter(condition)
+        if len(kwargs) > 1:
+            queryset = (
+                queryset.values("installation_id")
+                .annotate(matches=models.Count("key"))
+                .filter(matches=len(kwargs))
+            )
+        return queryset.values("installation_id")
+
+    def sync(self, *, installation: "AbstractApplicationInstallation"):
+        """
+        Store the values of the lookup keys declared by the installation's integration.
+        """
+        expected = self._get_expected_digests(installation)
+        current = dict(self.filter(installation=installation).values_list("key", "value_digest"))
+        if current == expected:
+            return
+
+        outdated = [key for key, digest in current.items() if expected.get(key) != digest]
+        if outdated:
+            self.filter(installation=installation, key__in=outdated).delete()
+        self.bulk_create(
+            self.model(installation=installation, key=key, value_digest=digest)
+            for key, digest in expected.items()
+            if current.get(key) != digest
+        )
+
+    def sync_many(self, *, installations: "Iterable[AbstractApplicationInstallation]"):
+        """
+        Bulk version of `sync`, which replaces the lookups of the installations whose
+        values changed with a single delete and a single insert.
+        """
+        expected = {
+            installation.pk: self._get_expected_digests(installation)
+            for installation in installations
+        }
+        current: "Dict[Any, Dict[str, str]]" = defaultdict(dict)
+        for installation_id, key, digest in self.filter(installation_id__in=expected).values_list(
+            "installation_id", "key", "value_digest"
+        ):
+            current[installation_id][key] = digest
+
+        changed = [pk for pk, digests in expected.items() if current[pk] != digests]
+        if not changed:
+            return
+        self.filter(installation_id__in=changed).delete()
+        self.bulk_create(
+            self.model(installation_id=pk, key=key, value_digest=digest)
+            for pk in changed
+            for key, digest in expected[pk].items()
+        )
+
+    def _get_expected_digests(self, installation: "AbstractApplicationInstallation") -> Dict:
+        from drf_integrations import integrations
+
+        try:
+            lookup_keys = installation.application.get_integration_instance().lookup_keys
+        except (ValueError, integrations.Registry.IntegrationUnavailableException):
+            lookup_keys = ()
+
+        config = installation.get_config()
+        return {key: self.get_value_digest(config[key]) for key in lookup_keys if key in config}
+
 
 class AccessTokenManager(models.Manager):
+    internal_token_lifetime = datetime.timedelta(hours=12)
+
+    _refreshing_lock = threading.Lock()
+    _refreshing: "Set[str]" = set()
+
     def create_for_internal_integration(self, *, application: "Application"):
         """
         Creates an AccessToken that can be used only by internal applications,
         it won't be usable by external parties through an API. Useful when using
         an authentication backend different from OAuth2 but still want to link
         an authentication object to a request internally.
+
+        When `INTEGRATIONS_INTERNAL_TOKEN_CACHE_ENABLED` is set, the valid token is
+        cached until it expires. Once it is within `INTEGRATIONS_INTERNAL_TOKEN_REFRESH_MARGIN`
+        seconds of expiring, a new token replaces it in the background, so that the
+        cached path never has to write to the DB.
         """
+        from drf_integrations.cache import internal_token_cache
+
         integration = application.get_integration_instance()
         if application.local_integration_name or integration.is_local:
             raise ValueError(
@@ -76,16 +364,285 @@ class AccessTokenManager(models.Manager):
             )
 
         scope = " ".join(sorted(scope for scope in integration.default_scopes))
-        now = timezone.now()
-        token = generate_token()
-        expires = now + datetime.timedelta(hours=12)
 
-        return (
-            self.filter(is_internal_only=True, expires__gt=now)
-            .select_related("application")
-            .get_or_create(
+        token = internal_token_cache.get(application.pk, scope)
+        if token is not None:
+            if self._needs_refresh(token):
+                self._refresh_internal_token(application=application, scope=scope)
+            return token, False
+
+        token, created = self._get_or_create_internal_token(
+            application=application, scope=scope, valid_after=timezone.now()
+        )
+        self._cache_internal_token(token, created=created)
+        return token, created
+
+    def _cache_internal_token(self, token: "AccessToken", *, created: bool):
+        from drf_integrations.cache import internal_token_cache
+
+        if not created:
+            internal_token_cache.set(token)
+            return
+        # Only cache new tokens once they are visible to other connections, so that
+        # other processes do not get a token that is rolled back with its transaction
+        transaction.on_commit(
+            lambda: internal_token_cache.set(token), using=router.db_for_write(self.model)
+        )
+
+    def _get_or_create_internal_token(
+        self, *, application: "Application", scope: str, valid_after: datetime.datetime
+    ) -> "Tuple[AccessToken, bool]":
+        # Read from the DB written to below, as replicas may not have the last token yet
+        token = (
+            self.db_manager(router.db_for_write(self.model))
+            .filter(
                 application=application,
                 scope=scope,
-                defaults=dict(scope=scope, expires=expires, is_internal_only=True, token=token),
+                is_internal_only=True,
+                expires__gt=valid_after,
             )
+            .select_related("application")
+            .order_by("-expires")
+            .first()
+        )
+        if token is not None:
+            return token, False
+
+        token = self.create(
+            application=application,
+            scope=scope,
+            expires=timezone.now() + self.internal_token_lifetime,
+            is_internal_only=True,
+            token=generate_token(),
+        )
+        return token, True
+
+    def _needs_refresh(self, token: "AccessToken") -> bool:
+        margin = datetime.timedelta(
+            seconds=get_setting("INTEGRATIONS_INTERNAL_TOKEN_REFRESH_MARGIN")
+        )
+        return token.expires - timezone.now() <= margin
+
+    def _refresh_internal_token(self, *, application: "Application", scope: str):
+        """
+        Replace the cached token for the application and scope with one that will not
+        need to be refreshed soon. Runs in a background thread unless
+        `INTEGRATIONS_INTERNAL_TOKEN_BACKGROUND_REFRESH` is disabled, and only once at a
+        time per application and scope in each process.
+        """
+        from drf_integrations.cache import internal_token_cache
+
+        key = internal_token_cache.make_key(application.pk, scope)
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                margin = datetime.timedelta(
+                    seconds=get_setting("INTEGRATIONS_INTERNAL_TOKEN_REFRESH_MARGIN")
+                )
+                token, created = self._get_or_create_internal_token(
+                    application=application, scope=scope, valid_after=timezone.now() + margin
+                )
+                self._cache_internal_token(token, created=created)
+            except Exception:
+                logger.exception("drf_integrations.managers.internal_token_refresh_failed")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        if not get_setting("INTEGRATIONS_INTERNAL_TOKEN_BACKGROUND_REFRESH"):
+            refresh()
+            return
+
+        def refresh_in_thread():
+            try:
+                refresh()
+            finally:
+                # DB connections are per thread, do not leak the one used by the refresh
+                connections.close_all()
+
+        threading.Thread(target=refresh_in_thread, daemon=True).start()
+
+
+class BaseEventQueueManager(models.Manager):
+    """
+    Manager of events processed in the background, with leases and retries configured
+    by the ``<setting_prefix>_LEASE_TIMEOUT``, ``_MAX_ATTEMPTS``, ``_RETRY_BACKOFF``
+    and ``_RETRY_BACKOFF_MAX`` settings.
+    """
+
+    setting_prefix: str
+
+    def _get_setting(self, name: str) -> Any:
+        return get_setting(f"{self.setting_prefix}_{name}")
+
+    def pending(self) -> models.QuerySet:
+        """Events due to be processed."""
+        return self.filter(
+            processed_at__isnull=True, failed_at__isnull=True, available_at__lte=timezone.now()
         )
+
+    def claim(self, *, batch_size: int) -> List[models.Model]:
+        """
+        Lease up to `batch_size` pending events for ``<setting_prefix>_LEASE_TIMEOUT``
+        seconds, so that concurrent workers skip them. Events whose worker dies become
+        pending again once their lease expires.
+        """
+        lease = datetime.timedelta(seconds=self._get_setting("LEASE_TIMEOUT"))
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            events = list(
+                self.pending()
+                .select_related("installation__application")
+                .select_for_update(skip_locked=True, of=("self",))
+                .order_by("pk")[:batch_size]
+            )
+            if events:
+                self.filter(pk__in=[event.pk for event in events]).update(
+                    available_at=timezone.now() + lease
+                )
+        return events
+
+    def _finish(self, processed: List[models.Model], failed: List[models.Model]):
+        """Mark the events as processed, and schedule the retries of the failed ones."""
+        now = timezone.now()
+        if processed:
+            self.filter(pk__in=[event.pk for event in processed]).update(processed_at=now)
+        if failed:
+            for event in failed:
+                self._schedule_retry(event, now=now)
+            self.bulk_update(failed, ["attempts", "last_error", "available_at", "failed_at"])
+
+    def _schedule_retry(self, event: models.Model, *, now: datetime.datetime):
+        if event.attempts >= self._get_setting("MAX_ATTEMPTS"):
+            event.failed_at = now
+            return
+        backoff = min(
+            self._get_setting("RETRY_BACKOFF") * 2 ** (event.attempts - 1),
+            self._get_setting("RETRY_BACKOFF_MAX"),
+        )
+        event.available_at = now + datetime.timedelta(seconds=backoff)
+
+
+class OutboxEventManager(BaseEventQueueManager):
+    setting_prefix = "INTEGRATIONS_OUTBOX"
+
+    def enqueue(
+        self,
+        *,
+        installation: "AbstractApplicationInstallation",
+        event_type: str,
+        payload: Optional[Dict] = None,
+    ) -> "OutboxEvent":
+        """
+        Store an event to be dispatched to the integration of the installation.
+
+        The event is written with the default write connection, so it is only
+        dispatched if the surrounding transaction (if any) commits.
+        """
+        return self.create(installation=installation, event_type=event_type, payload=payload)
+
+    def dispatch(self, *, batch_size: int = 100) -> Tuple[int, int]:
+        """
+        Dispatch a batch of pending events, grouped by installation so that each
+        integration gets all the events of an installation at once.
+
+        Events of a group that fails are retried with exponential backoff, up to
+        `INTEGRATIONS_OUTBOX_MAX_ATTEMPTS` times.
+
+        :return: Number of events processed and number of events that failed
+        """
+        events_by_installation: "Dict[Any, List[OutboxEvent]]" = defaultdict(list)
+        for event in self.claim(batch_size=batch_size):
+            events_by_installation[event.installation_id].append(event)
+
+        processed, failed = [], []
+        for events in events_by_installation.values():
+            installation = events[0].installation
+            try:
+                if installation.deleted_at is not None:
+                    raise ValueError("installation is not active")
+                integration = installation.application.get_integration_instance()
+                integration.dispatch_events(installation.get_context(), events)
+            except Exception as err:
+                logger.exception("drf_integrations.managers.outbox_dispatch_failed")
+                for event in events:
+                    event.attempts += 1
+                    event.last_error = repr(err)
+                failed.extend(events)
+            else:
+                processed.extend(events)
+
+        self._finish(processed, failed)
+        return len(processed), len(failed)
+
+
+class WebhookEventManager(BaseEventQueueManager):
+    setting_prefix = "INTEGRATIONS_WEBHOOK"
+
+    def ingest(
+        self,
+        *,
+        installation: "AbstractApplicationInstallation",
+        delivery_id: str,
+        topic: str = "",
+        body: bytes = b"",
+    ) -> bool:
+        """
+        Store a webhook delivery of the installation to be processed later by the
+        `processwebhooks` command, unless it was already stored.
+
+        Deliveries are only looked up before being stored if the per-process Bloom
+        filter of stored deliveries might contain them; the unique constraint over the
+        installation and delivery id catches the rest.
+
+        :return: Whether the delivery was stored, False for duplicates
+        """
+        if webhook_delivery_cache.might_contain(installation.pk, delivery_id) and (
+            self.filter(installation=installation, delivery_id=delivery_id).exists()
+        ):
+            return False
+
+        try:
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                self.create(
+                    installation=installation, delivery_id=delivery_id, topic=topic, body=body
+                )
+        except IntegrityError:
+            stored = False
+        else:
+            stored = True
+        webhook_delivery_cache.add(installation.pk, delivery_id)
+        return stored
+
+    def process(self, *, batch_size: int = 100) -> Tuple[int, int]:
+        """
+        Process a batch of pending webhook events with the integration of their
+        installation. Failed events are retried with exponential backoff, up to
+        `INTEGRATIONS_WEBHOOK_MAX_ATTEMPTS` times.
+
+        :return: Number of events processed and number of events that failed
+        """
+        processed, failed = [], []
+        contexts: "Dict[Any, Context]" = {}
+        for event in self.claim(batch_size=batch_size):
+            installation = event.installation
+            try:
+                if installation.deleted_at is not None:
+                    raise ValueError("installation is not active")
+                context = contexts.get(installation.pk)
+                if context is None:
+                    context = contexts[installation.pk] = installation.get_context()
+                context.integration.process_webhook(context, event)
+            except Exception as err:
+                logger.exception("drf_integrations.managers.webhook_processing_failed")
+                event.attempts += 1
+                event.last_error = repr(err)
+                failed.append(event)
+            else:
+                processed.append(event)
+
+        self._finish(processed, failed)
+        return len(processed), len(failed)
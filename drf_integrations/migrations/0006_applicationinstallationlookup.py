@@ -0,0 +1,100 @@
+# Generated by Django 4.2 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_lookups(apps, schema_editor):
+    """
+    Store the lookup values of the existing installations, as the lookups on the
+    integrations' `lookup_keys` only go through this table.
+    """
+    from drf_integrations import integrations
+    from drf_integrations.managers import ApplicationInstallationLookupManager
+
+    lookup_keys = {
+        integration.name: integration.lookup_keys
+        for integration in integrations.get_all()
+        if integration.lookup_keys
+    }
+    if not lookup_keys:
+        return
+
+    ApplicationInstallation = apps.get_model(settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL)
+    ApplicationInstallationLookup = apps.get_model(
+        "drf_integrations", "ApplicationInstallationLookup"
+    )
+    db = schema_editor.connection.alias
+    installations = (
+        ApplicationInstallation.objects.using(db)
+        .filter(
+            models.Q(application__local_integration_name__in=lookup_keys)
+            | models.Q(application__internal_integration_name__in=lookup_keys)
+        )
+        .values_list(
+            "pk",
+            "config",
+            "application__local_integration_name",
+            "application__internal_integration_name",
+        )
+    )
+
+    lookups = []
+    for pk, config, local_name, internal_name in installations.iterator(chunk_size=1000):
+        config = config or {}
+        for key in lookup_keys.get(local_name) or lookup_keys.get(internal_name, ()):
+            if key in config:
+                lookups.append(
+                    ApplicationInstallationLookup(
+                        installation_id=pk,
+                        key=key,
+                        value_digest=ApplicationInstallationLookupManager.get_value_digest(
+                            config[key]
+                        ),
+                    )
+                )
+        if len(lookups) >= 1000:
+            ApplicationInstallationLookup.objects.using(db).bulk_create(lookups)
+            lookups = []
+    ApplicationInstallationLookup.objects.using(db).bulk_create(lookups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL),
+        ("drf_integrations", "0005_alter_applicationinstallation_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ApplicationInstallationLookup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("key", models.CharField(max_length=255)),
+                ("value_digest", models.CharField(max_length=64)),
+                (
+                    "installation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lookups",
+                        to=settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("installation", "key")},
+            },
+        ),
+        migrations.AddIndex(
+            model_name="applicationinstallationlookup",
+            index=models.Index(fields=["key", "value_digest"], name="drf_integra_key_43e093_idx"),
+        ),
+        migrations.RunPython(backfill_lookups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-17 11:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+from drf_integrations.utils import get_json_model_field
+
+JSONField = get_json_model_field()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL),
+        ("drf_integrations", "0006_applicationinstallationlookup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("event_type", models.CharField(max_length=255)),
+                ("payload", JSONField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("available_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("failed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "installation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="outbox_events",
+                        to=settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(
+                            ("failed_at__isnull", True), ("processed_at__isnull", True)
+                        ),
+                        fields=["available_at"],
+                        name="drf_int_outbox_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
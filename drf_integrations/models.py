@@ -1,5 +1,7 @@
-from typing import TYPE_CHECKING, Dict, List, Optional, Type
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, List, Optional, Tuple, Type
 
+import django
+import json
 import urllib.parse
 from django.apps import apps
 from django.conf import settings
@@ -12,11 +14,12 @@ from oauth2_provider.models import AbstractAccessToken as OAuthAbstractAccessTok
 from oauth2_provider.models import AbstractApplication as OAuthAbstractApplication
 from oauth2_provider.models import AbstractGrant as OAuthAbstractGrant
 from oauth2_provider.models import AbstractRefreshToken as OAuthAbstractRefreshToken
-from oauth2_provider.scopes import get_scopes_backend
 from oauth2_provider.settings import oauth2_settings
 from uuid import uuid4
 
-from drf_integrations import managers
+from drf_integrations import managers, routers
+from drf_integrations.cache import client_pool, installation_cache, internal_application_cache
+from drf_integrations.scopes import get_all_scopes, parse_scopes
 from drf_integrations.types import IntegrationT
 
 from . import utils
@@ -34,6 +37,26 @@ def get_application_installation_model() -> "AbstractApplicationInstallation":
     return apps.get_model(settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL)
 
 
+def invalidate_installations_on_commit(
+    installations: "Iterable[AbstractApplicationInstallation]", *, using: str
+):
+    """
+    Drop the cached copies of the installations once the transaction writing them
+    commits, so that concurrent requests cannot cache them again as they were before
+    the commit. Reads made in the meantime in this context go to the primary DB.
+    """
+    installations = list(installations)
+    if routers.get_replicas():
+        routers.pin_to_primary()
+
+    def invalidate():
+        installation_cache.invalidate_many(installations)
+        client_pool.evict_many(installations)
+        routers.record_writes(installations)
+
+    transaction.on_commit(invalidate, using=using)
+
+
 def get_application_installation_install_attribute_name():
     attr = settings.INTEGRATIONS_APPLICATION_INSTALLATION_INSTALL_ATTRIBUTE
     if not attr.endswith("_id"):
@@ -78,10 +101,56 @@ class AbstractApplication(OAuthAbstractApplication):
             )
         ]
 
+    def __getstate__(self):
+        # Integrations are resolved from the registry of each process
+        state = super().__getstate__().copy()
+        state.pop("_integration_instance", None)
+        state.pop("_parsed_redirect_uris", None)
+        return state
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.internal_integration_name:
+            internal_application_cache.invalidate(self.internal_integration_name)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        if self.internal_integration_name:
+            internal_application_cache.invalidate(self.internal_integration_name)
+        return result
+
     #
     # Overrides: oauth2_provider
     #
 
+    @property
+    def default_redirect_uri(self) -> str:
+        """
+        Overridden to take the first of the redirect URIs parsed in `parsed_redirect_uris`.
+        """
+        if not self.redirect_uris:
+            return super().default_redirect_uri
+        return self._get_redirect_uris()[0][0]
+
+    def redirect_uri_allowed(self, uri: str) -> bool:
+        """
+        Overridden to compare the given URI with the redirect URIs parsed in
+        `parsed_redirect_uris`, instead of parsing them again.
+        """
+        parsed_uri = urllib.parse.urlparse(uri)
+        uri_query = None
+        for parsed_allowed_uri in self.parsed_redirect_uris:
+            if (
+                parsed_allowed_uri.scheme == parsed_uri.scheme
+                and parsed_allowed_uri.netloc == parsed_uri.netloc
+                and parsed_allowed_uri.path == parsed_uri.path
+            ):
+                if uri_query is None:
+                    uri_query = set(urllib.parse.parse_qsl(parsed_uri.query))
+                if set(urllib.parse.parse_qsl(parsed_allowed_uri.query)).issubset(uri_query):
+                    return True
+        return False
+
     def allows_grant_type(self, *grant_types) -> bool:
         """
         Overridden to support client credentials grant always and
@@ -106,21 +175,43 @@ class AbstractApplication(OAuthAbstractApplication):
         """
         Overridden to take schemes from the value of `redirect_uris`.
         """
-        schemes = set()
-        for allowed_uri in self.redirect_uris.split():
-            parsed_allowed_uri = urllib.parse.urlparse(allowed_uri)
-            if parsed_allowed_uri.scheme:
-                schemes.add(parsed_allowed_uri.scheme)
-        return list(schemes)
+        return list({uri.scheme for uri in self.parsed_redirect_uris if uri.scheme})
 
     def valid_scopes_access(self) -> Dict[str, str]:
         """
         Returns a dictionary of allowed scope names (as keys)
         with their descriptions (as values).
         """
-        all_scopes = get_scopes_backend().get_all_scopes()
-        token_scopes = self.allowed_scopes.split() if self.allowed_scopes else []
-        return {name: desc for name, desc in all_scopes.items() if name in token_scopes}
+        allowed_scopes = self.allowed_scope_set
+        return {name: desc for name, desc in get_all_scopes().items() if name in allowed_scopes}
+
+    @property
+    def allowed_scope_set(self) -> FrozenSet[str]:
+        """The names of the allowed scopes, parsed once per distinct value."""
+        return parse_scopes(self.allowed_scopes)
+
+    def has_scopes(self, scopes: Iterable[str]) -> bool:
+        """Returns whether all the given scopes are allowed."""
+        return self.allowed_scope_set.issuperset(scopes)
+
+    @property
+    def parsed_redirect_uris(self) -> Tuple[urllib.parse.ParseResult, ...]:
+        """
+        The redirect URIs, parsed once for every value of `redirect_uris` (so assigning
+        the field discards them).
+        """
+        return self._get_redirect_uris()[1]
+
+    def _get_redirect_uris(self) -> Tuple[Tuple[str, ...], Tuple[urllib.parse.ParseResult, ...]]:
+        cached = self.__dict__.get("_parsed_redirect_uris")
+        if cached is None or cached[0] != self.redirect_uris:
+            uris = tuple(self.redirect_uris.split()) if self.redirect_uris else ()
+            cached = (
+                self.redirect_uris,
+                (uris, tuple(urllib.parse.urlparse(uri) for uri in uris)),
+            )
+            self._parsed_redirect_uris = cached
+        return cached[1]
 
     @property
     def status_text(self) -> str:
@@ -163,15 +254,22 @@ class AbstractApplication(OAuthAbstractApplication):
 
         Ensures that the instance of the integration class is a subclass of
         `subclasses`. This is also useful for type hinting.
+
+        The integration is memoized in the application until any of the integration
+        names change.
         """
         from drf_integrations import integrations
 
         if not self.internal_integration_name and not self.local_integration_name:
             raise ValueError("application is not linked to an integration")
 
-        integration = integrations.get(
-            self.internal_integration_name or self.local_integration_name
-        )
+        names = (self.internal_integration_name, self.local_integration_name)
+        memoized_names, integration = self.__dict__.get("_integration_instance", (None, None))
+        if memoized_names != names:
+            integration = integrations.get(
+                self.internal_integration_name or self.local_integration_name
+            )
+            self._integration_instance = (names, integration)
 
         for subclass in ensure_subclasses:
             if not isinstance(integration, subclass):
@@ -194,17 +292,20 @@ class AbstractApplication(OAuthAbstractApplication):
         integration = self.get_integration_instance()
         application_installation = get_application_installation_model()
         target_filter = {get_application_installation_install_attribute_name(): target_id}
+        using = router.db_for_write(application_installation)
         if self.local_integration_name:
-            other_installations = application_installation.objects.filter(
-                application=self, deleted_at__isnull=True
-            ).exclude(**target_filter)
+            other_installations = (
+                application_installation.objects.using(using)
+                .filter(application=self, deleted_at__isnull=True)
+                .exclude(**target_filter)
+            )
             if other_installations.exists():
                 raise ValidationError(
                     "Cannot install this local application to more than one target"
                 )
 
-        with transaction.atomic(using=router.db_for_write(application_installation)):
-            installation, __ = application_installation.objects.update_or_create(
+        with transaction.atomic(using=using):
+            installation, __ = application_installation.objects.using(using).update_or_create(
                 application=self,
                 **target_filter,
                 defaults={"config": config, "deleted_at": None},
@@ -217,10 +318,126 @@ class AbstractApplication(OAuthAbstractApplication):
     def uninstall(self, target_id: int) -> "AbstractApplicationInstallation":
         application_installation = get_application_installation_model()
         target_filter = {get_application_installation_install_attribute_name(): target_id}
-        installation = application_installation.objects.get(application=self, **target_filter)
+        using = router.db_for_write(application_installation)
+        installation = application_installation.objects.using(using).get(
+            application=self, **target_filter
+        )
         installation.delete()
         return installation
 
+    def install_many(
+        self, target_ids: Iterable[int], *, config: Dict = None, batch_size: int = 1000
+    ) -> "List[AbstractApplicationInstallation]":
+        """
+        Install the application to many targets at once with the same config, which is
+        only validated once. Existing installations are updated and activated again.
+
+        Installations are upserted in batches of `batch_size` targets, in a single
+        transaction. Local applications can only be installed to one target.
+
+        Upserting in bulk requires Django 4.1+, older versions upsert the installations
+        one by one instead, still validating the config once.
+
+        :return: The installations, in the order of `target_ids`
+        """
+        target_ids = list(dict.fromkeys(target_ids))
+        if not target_ids:
+            return []
+        if self.local_integration_name:
+            if len(target_ids) > 1:
+                raise ValidationError(
+                    "Cannot install this local application to more than one target"
+                )
+            return [self.install(target_ids[0], config=config)]
+
+        integration = self.get_integration_instance()
+        application_installation = get_application_installation_model()
+        attr = get_application_installation_install_attribute_name()
+        if self.has_config_class:
+            integration.check_config(
+                application_installation(
+                    application=self, config=config, **{attr: target_ids[0]}
+                ).get_context()
+            )
+
+        using = router.db_for_write(application_installation)
+        manager = application_installation.objects.db_manager(using)
+        installations = []
+        with transaction.atomic(using=using):
+            for start in range(0, len(target_ids), batch_size):
+                batch = target_ids[start : start + batch_size]
+                if django.VERSION[0:2] >= (4, 1):
+                    manager.bulk_create(
+                        [
+                            application_installation(
+                                application=self,
+                                config=config,
+                                deleted_at=None,
+                                **{attr: target_id},
+                            )
+                            for target_id in batch
+                        ],
+                        update_conflicts=True,
+                        unique_fields=["application", attr],
+                        update_fields=["config", "deleted_at", "updated_at"],
+                    )
+                else:
+                    # bulk_create cannot update conflicting rows before Django 4.1
+                    for target_id in batch:
+                        manager.update_or_create(
+                            application=self,
+                            **{attr: target_id},
+                            defaults={"config": config, "deleted_at": None},
+                        )
+                batch_installations = list(
+                    manager.filter(application=self, **{f"{attr}__in": batch})
+                )
+                for installation in batch_installations:
+                    installation.application = self
+                ApplicationInstallationLookup.objects.db_manager(using).sync_many(
+                    installations=batch_installations
+                )
+                installations.extend(batch_installations)
+
+        invalidate_installations_on_commit(installations, using=using)
+        positions = {target_id: position for position, target_id in enumerate(target_ids)}
+        return sorted(
+            installations, key=lambda installation: positions[getattr(installation, attr)]
+        )
+
+    def uninstall_many(
+        self, target_ids: Iterable[int], *, batch_size: int = 1000
+    ) -> "List[AbstractApplicationInstallation]":
+        """
+        Uninstall the application from many targets at once, with a soft-delete
+        ``UPDATE`` per batch of `batch_size` targets, which sends the
+        `installations_deleted` signal. Targets without an active installation are
+        ignored.
+
+        :return: The installations that were uninstalled
+        """
+        target_ids = list(dict.fromkeys(target_ids))
+        application_installation = get_application_installation_model()
+        attr = get_application_installation_install_attribute_name()
+        using = router.db_for_write(application_installation)
+        manager = application_installation.objects.db_manager(using)
+        now = timezone.now()
+        installations = []
+        with transaction.atomic(using=using):
+            for start in range(0, len(target_ids), batch_size):
+                batch = target_ids[start : start + batch_size]
+                batch_installations = list(
+                    manager.active()
+                    .filter(application=self, **{f"{attr}__in": batch})
+                    .select_for_update()
+                )
+                for installation in batch_installations:
+                    installation.application = self
+                manager.get_queryset()._set_deleted_at(batch_installations, now)
+                installations.extend(batch_installations)
+
+        return installations
+
 
 class Application(AbstractApplication):
     class Meta(AbstractApplication.Meta):
@@ -298,10 +515,26 @@ def _get_application_installation_class():
         def get_config(self) -> Dict:
             return self.config or {}
 
+        def __getstate__(self):
+            # The context may hold clients that cannot be pickled (e.g. HTTP sessions)
+            state = super().__getstate__().copy()
+            state.pop("_context", None)
+            return state
+
         def get_context(self) -> "Context":
+            """
+            Returns the context of this installation, memoized until it is saved or
+            refreshed from the DB.
+            """
             from drf_integrations.integrations.base import Context
 
-            return Context(installation=self)
+            if "_context" not in self.__dict__:
+                self._context = Context(installation=self)
+            return self._context
+
+        def refresh_from_db(self, *args, **kwargs):
+            self.__dict__.pop("_context", None)
+            super().refresh_from_db(*args, **kwargs)
 
         def get_external_data_source_lookup(self) -> Dict:
             """
@@ -310,6 +543,14 @@ def _get_application_installation_class():
             """
             return {"performed_by_installation_id": self.pk}
 
+        def save(self, *args, **kwargs):
+            using = kwargs.get("using") or router.db_for_write(self.__class__, instance=self)
+            self.__dict__.pop("_context", None)
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+                ApplicationInstallationLookup.objects.db_manager(using).sync(installation=self)
+                invalidate_installations_on_commit([self], using=using)
+
         def delete(self, using=None, keep_parents=False):
             using = using or router.db_for_write(self.__class__, instance=self)
             self.deleted_at = timezone.now()
@@ -333,3 +574,121 @@ class ApplicationInstallation(AbstractApplicationInstallation):
 
     class Meta(AbstractApplicationInstallation.Meta):
         swappable = "INTEGRATIONS_APPLICATION_INSTALLATION_MODEL"
+
+
+class ApplicationInstallationLookup(models.Model):
+    """
+    Indexed copy of the config values that an integration declares in its
+    `lookup_keys`, so that installations can be looked up by config without scanning
+    the JSON column. Kept in sync every time an installation is saved, but not by
+    queryset updates (e.g. ``.update(config=...)``), after which the
+    ``syncinstallationlookups`` command must be run.
+    """
+
+    id = models.BigAutoField(
+        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+    )
+    installation = models.ForeignKey(
+        settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL,
+        on_delete=models.CASCADE,
+        related_name="lookups",
+    )
+    key = models.CharField(max_length=255)
+    value_digest = models.CharField(max_length=64)
+
+    objects = managers.ApplicationInstallationLookupManager()
+
+    class Meta:
+        unique_together = [("installation", "key")]
+        indexes = [models.Index(fields=["key", "value_digest"])]
+
+    def __str__(self):
+        return f"{self.key} lookup for {self.installation_id}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Event for the integration of an installation, stored in the same transaction as
+    the change that produced it and dispatched later by the `dispatchoutbox` command,
+    so that third-party latency and failures stay out of the request.
+    """
+
+    id = models.BigAutoField(
+        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+    )
+    installation = models.ForeignKey(
+        settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL,
+        on_delete=models.CASCADE,
+        related_name="outbox_events",
+    )
+    event_type = models.CharField(max_length=255)
+    payload = JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    processed_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = managers.OutboxEventManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                name="drf_int_outbox_pending_idx",
+                condition=models.Q(processed_at__isnull=True, failed_at__isnull=True),
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} event for {self.installation_id}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Webhook delivery for an installation, stored as soon as its signature is verified
+    and processed later by the `processwebhooks` command, so that webhook endpoints
+    answer quickly. Each delivery is stored once per installation.
+    """
+
+    id = models.BigAutoField(
+        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+    )
+    installation = models.ForeignKey(
+        settings.INTEGRATIONS_APPLICATION_INSTALLATION_MODEL,
+        on_delete=models.CASCADE,
+        related_name="webhook_events",
+    )
+    delivery_id = models.CharField(max_length=255)
+    topic = models.CharField(max_length=255, blank=True, default="")
+    body = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    processed_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = managers.WebhookEventManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["installation", "delivery_id"], name="drf_int_webhook_delivery_uniq"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                name="drf_int_webhook_pending_idx",
+                condition=models.Q(processed_at__isnull=True, failed_at__isnull=True),
+            )
+        ]
+
+    def __str__(self):
+        return f"Webhook {self.delivery_id} for {self.installation_id}"
+
+    def get_payload(self) -> Any:
+        """Return the body parsed as JSON."""
+        return json.loads(bytes(self.body))
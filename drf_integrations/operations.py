@@ -0,0 +1,115 @@
+import hashlib
+from django.db import models
+from django.db.migrations.operations.base import Operation
+
+
+class BaseConfigIndexOperation(Operation):
+    """
+    Base migration operation to manage an index over the config of the installation
+    model given by its label (i.e. `INTEGRATIONS_APPLICATION_INSTALLATION_MODEL`).
+
+    These operations only touch the database, the index is not added to the model
+    state, so it does not need to be declared in the model ``Meta``. Indexes only cover
+    active installations (``deleted_at IS NULL``).
+    """
+
+    reduces_to_sql = True
+    reversible = True
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def is_supported(self, connection) -> bool:
+        return connection.features.supports_partial_indexes
+
+    def get_index(self) -> models.Index:
+        raise NotImplementedError()
+
+    def _get_model(self, state):
+        app_label, model_name = self.model.split(".")
+        return state.apps.get_model(app_label, model_name)
+
+    def _should_migrate(self, schema_editor, model) -> bool:
+        connection = schema_editor.connection
+        return self.allow_migrate_model(connection.alias, model) and self.is_supported(connection)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = self._get_model(to_state)
+        if self._should_migrate(schema_editor, model):
+            schema_editor.add_index(model, self.get_index())
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = self._get_model(from_state)
+        if self._should_migrate(schema_editor, model):
+            schema_editor.remove_index(model, self.get_index())
+
+
+class AddConfigKeyIndex(BaseConfigIndexOperation):
+    """
+    Add an expression index over ``(config -> key, application_id)``, which is used by
+    ``config__<key>=value`` lookups on active installations. Requires Django 3.2+.
+    """
+
+    def __init__(self, model: str, key: str):
+        super().__init__(model)
+        self.key = key
+
+    @property
+    def index_name(self) -> str:
+        digest = hashlib.sha1(f"{self.model.lower()}:{self.key}".encode()).hexdigest()
+        return f"drf_int_cfg_{digest[:12]}"
+
+    def is_supported(self, connection) -> bool:
+        # Expression indexes are supported from Django 3.2 on
+        return super().is_supported(connection) and getattr(
+            connection.features, "supports_expression_indexes", False
+        )
+
+    def get_index(self) -> models.Index:
+        from django.db.models.fields.json import KeyTransform
+
+        return models.Index(
+            KeyTransform(self.key, "config"),
+            models.F("application"),
+            name=self.index_name,
+            condition=models.Q(deleted_at__isnull=True),
+        )
+
+    def describe(self):
+        return f"Create index {self.index_name} on config key {self.key} of {self.model}"
+
+    @property
+    def migration_name_fragment(self):
+        return f"config_index_{self.key.lower()}"
+
+
+class AddConfigGinIndex(BaseConfigIndexOperation):
+    """
+    Add a GIN ``jsonb_path_ops`` index over the whole config, which is used by
+    ``config__contains={...}`` lookups on active installations. PostgreSQL only.
+    """
+
+    index_name = "drf_int_cfg_gin"
+
+    def is_supported(self, connection) -> bool:
+        return super().is_supported(connection) and connection.vendor == "postgresql"
+
+    def get_index(self) -> models.Index:
+        from django.contrib.postgres.indexes import GinIndex
+
+        return GinIndex(
+            fields=["config"],
+            opclasses=["jsonb_path_ops"],
+            name=self.index_name,
+            condition=models.Q(deleted_at__isnull=True),
+        )
+
+    def describe(self):
+        return f"Create GIN index {self.index_name} on config of {self.model}"
+
+    @property
+    def migration_name_fragment(self):
+        return "config_gin_index"
@@ -0,0 +1,224 @@
+"""
+Routing of the reads of the application, access token and installation models to read
+replicas.
+
+Add `ReplicaRouter` to ``DATABASE_ROUTERS`` and list the replica aliases in
+`INTEGRATIONS_READ_REPLICAS`. Writes are left to the other routers (or the default DB),
+which is the primary DB as far as drf_integrations is concerned.
+
+Replicas lag behind the primary, so reads stick to the primary for
+`INTEGRATIONS_READ_REPLICA_STICKINESS` seconds after installations are written:
+
+- in the same context (e.g. the rest of the request) and, with
+  `ReplicaStickinessMiddleware`, in the following requests of the same client;
+- for the same installation or target, in every process, when read through
+  `get_from_replica` (as the authentication backends do), which also confirms on the
+  primary the lookups that do not match anything in the replica.
+"""
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Optional, Type
+
+import math
+import random
+import time
+from asgiref.sync import sync_to_async
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import router
+
+from drf_integrations.cache import recent_writes
+from drf_integrations.utils import get_setting
+
+if TYPE_CHECKING:
+    from django.db import models
+    from django.http import HttpRequest, HttpResponse
+
+    from drf_integrations.models import AbstractApplicationInstallation
+
+
+ROUTED_MODEL_SETTINGS = (
+    "OAUTH2_PROVIDER_APPLICATION_MODEL",
+    "OAUTH2_PROVIDER_ACCESS_TOKEN_MODEL",
+    "INTEGRATIONS_APPLICATION_INSTALLATION_MODEL",
+)
+
+_primary_until: ContextVar[float] = ContextVar("drf_integrations_primary_until", default=0.0)
+
+
+def get_replicas() -> List[str]:
+    return get_setting("INTEGRATIONS_READ_REPLICAS")
+
+
+def get_primary_db(model: "Type[models.Model]") -> str:
+    return router.db_for_write(model)
+
+
+def is_routed_model(model: "Type[models.Model]") -> bool:
+    """
+    Whether the reads of the model are sent to the replicas: the application, access
+    token and installation models, as set in `ROUTED_MODEL_SETTINGS`. Grants, refresh
+    tokens and the event and lookup tables are read right after being written, so they
+    are left on the primary DB.
+    """
+    label = model._meta.label_lower
+    return any(getattr(settings, name, "").lower() == label for name in ROUTED_MODEL_SETTINGS)
+
+
+def is_pinned() -> bool:
+    """Whether the reads of the current context are sent to the primary DB."""
+    return _primary_until.get() > time.monotonic()
+
+
+def pin_to_primary(timeout: Optional[float] = None):
+    """
+    Send the reads of the current context to the primary DB for the next ``timeout``
+    seconds, by default `INTEGRATIONS_READ_REPLICA_STICKINESS`.
+    """
+    if timeout is None:
+        timeout = get_setting("INTEGRATIONS_READ_REPLICA_STICKINESS")
+    _primary_until.set(max(_primary_until.get(), time.monotonic() + timeout))
+
+
+@contextmanager
+def use_primary():
+    """Send the reads made within the block to the primary DB."""
+    token = _primary_until.set(math.inf)
+    try:
+        yield
+    finally:
+        _primary_until.reset(token)
+
+
+def record_writes(installations: "Iterable[AbstractApplicationInstallation]"):
+    """
+    Make the following reads stick to the primary DB, both in the current context and
+    for the given installations, which were just written.
+    """
+    if not get_replicas():
+        return
+    pin_to_primary()
+    recent_writes.add_many(installations)
+
+
+def _is_recently_written(instance: "models.Model") -> bool:
+    from drf_integrations.models import AbstractApplicationInstallation
+
+    return isinstance(
+        instance, AbstractApplicationInstallation
+    ) and recent_writes.has_installation(instance)
+
+
+def get_from_replica(queryset: "models.QuerySet", **lookup) -> "models.Model":
+    """
+    Return ``queryset.get(**lookup)``, reading it again from the primary DB if it was
+    read from a replica and may be stale: when nothing matches, since the row may not be
+    replicated yet, and when it is an installation written recently.
+    """
+    db = queryset.db
+    if db not in get_replicas():
+        return queryset.get(**lookup)
+
+    try:
+        instance = queryset.using(db).get(**lookup)
+    except queryset.model.DoesNotExist:
+        return queryset.using(get_primary_db(queryset.model)).get(**lookup)
+
+    if _is_recently_written(instance):
+        return queryset.using(get_primary_db(queryset.model)).get(**lookup)
+    return instance
+
+
+async def aget_from_replica(queryset: "models.QuerySet", **lookup) -> "models.Model":
+    """Async version of `get_from_replica`, through the async ORM (Django 4.1+)."""
+    db = queryset.db
+    if db not in get_replicas():
+        return await queryset.aget(**lookup)
+
+    try:
+        instance = await queryset.using(db).aget(**lookup)
+    except queryset.model.DoesNotExist:
+        return await queryset.using(get_primary_db(queryset.model)).aget(**lookup)
+
+    if recent_writes.shared is None:
+        is_stale = _is_recently_written(instance)
+    else:
+        is_stale = await sync_to_async(_is_recently_written)(instance)
+    if is_stale:
+        return await queryset.using(get_primary_db(queryset.model)).aget(**lookup)
+    return instance
+
+
+def using_for_target(queryset: "models.QuerySet", target_id: Any) -> "models.QuerySet":
+    """
+    Send the queryset to the primary DB if an installation of the target was written
+    recently, since the replicas may not have caught up yet.
+    """
+    if get_replicas() and recent_writes.has_target(target_id):
+        return queryset.using(get_primary_db(queryset.model))
+    return queryset
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of the models in `ROUTED_MODEL_SETTINGS` to a
+    random replica of `INTEGRATIONS_READ_REPLICAS`, or to the primary DB while the
+    current context is pinned to it (see `pin_to_primary`). Related objects are read
+    from the DB of the instance they are accessed from, and objects read from a replica
+    can be related to objects of the primary. Other models and writes are left to the
+    other routers.
+    """
+
+    def db_for_read(self, model: "Type[models.Model]", **hints) -> Optional[str]:
+        replicas = get_replicas()
+        if not replicas or not is_routed_model(model):
+            return None
+
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if is_pinned():
+            return get_primary_db(model)
+        return random.choice(replicas)
+
+    def allow_relation(
+        self, obj1: "models.Model", obj2: "models.Model", **hints
+    ) -> Optional[bool]:
+        replicas = get_replicas()
+        if not replicas or not (is_routed_model(type(obj1)) or is_routed_model(type(obj2))):
+            return None
+
+        databases = {*replicas, get_primary_db(type(obj1)), get_primary_db(type(obj2))}
+        return {obj1._state.db, obj2._state.db} <= databases or None
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Keeps sending the reads of a client to the primary DB for
+    `INTEGRATIONS_READ_REPLICA_STICKINESS` seconds after one of its requests wrote
+    installations (e.g. installing an application or changing its config), through a
+    cookie, so that it reads its own writes.
+    """
+
+    cookie_name = "drf_integrations_primary"
+
+    def __init__(self, get_response: "Callable[[HttpRequest], HttpResponse]"):
+        self.get_response = get_response
+
+    def __call__(self, request: "HttpRequest") -> "HttpResponse":
+        if not get_replicas():
+            return self.get_response(request)
+
+        timeout = get_setting("INTEGRATIONS_READ_REPLICA_STICKINESS")
+        pinned_until = time.monotonic() + timeout if self.cookie_name in request.COOKIES else 0.0
+        token = _primary_until.set(pinned_until)
+        try:
+            response = self.get_response(request)
+            has_written = _primary_until.get() != pinned_until
+        finally:
+            _primary_until.reset(token)
+
+        if has_written:
+            response.set_cookie(
+                self.cookie_name, "1", max_age=math.ceil(timeout), httponly=True, samesite="Lax"
+            )
+        return response
@@ -0,0 +1,46 @@
+"""
+Per-process caches of the scopes known to the OAuth2 scopes backend and of the parsed
+``allowed_scopes`` of the applications.
+"""
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, Mapping, Optional
+
+import functools
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from oauth2_provider.scopes import get_scopes_backend
+from types import MappingProxyType
+
+if TYPE_CHECKING:
+    from drf_integrations.models import AbstractApplication
+
+
+@functools.lru_cache(maxsize=None)
+def get_all_scopes() -> Mapping[str, str]:
+    """
+    Return the names of all the scopes (as keys) with their descriptions (as values),
+    as given by the scopes backend the first time it is called in the process.
+    """
+    return MappingProxyType(dict(get_scopes_backend().get_all_scopes()))
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_scopes(scopes: Optional[str]) -> FrozenSet[str]:
+    """Return the scope names in a space-separated string of scopes."""
+    return frozenset(scopes.split()) if scopes else frozenset()
+
+
+def check_scopes(
+    applications: "Iterable[AbstractApplication]", scopes: Iterable[str]
+) -> Dict[Any, FrozenSet[str]]:
+    """
+    Return, for the pk of each of the applications, which of the given scopes it is
+    allowed. See `ApplicationQuerySet.check_scopes` to check applications in the DB.
+    """
+    scopes = frozenset(scopes)
+    return {application.pk: scopes & application.allowed_scope_set for application in applications}
+
+
+@receiver(setting_changed)
+def clear_scopes_cache(*, setting: str, **kwargs):
+    if setting == "OAUTH2_PROVIDER":
+        get_all_scopes.cache_clear()
@@ -0,0 +1,14 @@
+from django.dispatch import Signal
+
+installations_deleted = Signal()
+"""
+Sent when installations are soft-deleted in bulk, e.g. by
+`ApplicationInstallationQuerySet.delete`, with the arguments ``sender`` (the installation
+model), ``pks`` (the primary keys of the installations) and ``using``.
+"""
+
+installations_restored = Signal()
+"""
+Sent when soft-deleted installations are restored in bulk by
+`ApplicationInstallationQuerySet.restore`, with the same arguments as `installations_deleted`.
+"""
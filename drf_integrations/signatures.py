@@ -0,0 +1,197 @@
+"""
+HMAC signature verification of requests sent by third parties (e.g. webhooks or app
+proxies), for integrations to declare in `BaseIntegration.signature_verifier`.
+"""
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import base64
+import hmac
+import tempfile
+import threading
+
+from drf_integrations.cache import LocalTTLCache, lazy_cache_property
+from drf_integrations.exceptions import RequestBodyTooLarge
+
+if TYPE_CHECKING:
+    from django.http import HttpRequest
+    from rest_framework.request import Request
+
+    from drf_integrations.models import AbstractApplicationInstallation
+
+
+class SignatureVerifier:
+    """
+    Verifies the HMAC signature of a request with the secret of an installation.
+
+    Keying an HMAC is done once per installation and secret: the keyed HMAC objects are
+    kept in a per-process LRU cache and copied for every request. The signature is
+    compared in constant time. Subclasses define where the signature and the signed
+    message are taken from.
+    """
+
+    digestmod: str = "sha256"
+    encoding: str = "hex"
+    """How the signature is encoded, either ``hex`` or ``base64``."""
+    secret_config_key: str = "shared_secret"
+    cache_maxsize: int = 1024
+    cache_timeout: int = 3600
+
+    def __init__(self):
+        self._prototypes: Optional[LocalTTLCache] = None
+        self._lock = threading.Lock()
+
+    @lazy_cache_property
+    def prototypes(self) -> LocalTTLCache:
+        return LocalTTLCache(maxsize=self.cache_maxsize, timeout=self.cache_timeout)
+
+    def get_signature(self, request: "Request") -> Optional[str]:
+        """Return the signature sent with the request, if any."""
+        raise NotImplementedError()
+
+    def get_message(self, request: "Request") -> Optional[Iterable[bytes]]:
+        """Return the chunks of the signed message, or None if it is missing."""
+        raise NotImplementedError()
+
+    def get_secret(self, installation: "AbstractApplicationInstallation") -> Optional[str]:
+        """Return the secret the installation signs its requests with."""
+        return installation.get_config().get(self.secret_config_key)
+
+    def get_hmac(self, installation: "AbstractApplicationInstallation") -> Optional[hmac.HMAC]:
+        """
+        Return a new HMAC keyed with the secret of the installation, or None if it has no
+        secret. The key is part of the cache key, so changing the secret takes effect
+        immediately.
+        """
+        secret = self.get_secret(installation)
+        if not secret:
+            return None
+
+        key = (installation.pk, secret)
+        prototype = self.prototypes.get(key)
+        if prototype is None:
+            prototype = hmac.new(secret.encode(), digestmod=self.digestmod)
+            self.prototypes.set(key, prototype)
+        return prototype.copy()
+
+    def compute(
+        self, installation: "AbstractApplicationInstallation", message: Iterable[bytes]
+    ) -> Optional[str]:
+        """Return the encoded signature of the message chunks, for the installation."""
+        digest = self.get_hmac(installation)
+        if digest is None:
+            return None
+        for chunk in message:
+            digest.update(chunk)
+        return self.encode(digest)
+
+    def encode(self, digest: hmac.HMAC) -> str:
+        if self.encoding == "base64":
+            return base64.b64encode(digest.digest()).decode()
+        return digest.hexdigest()
+
+    def verify(self, request: "Request", installation: "AbstractApplicationInstallation") -> bool:
+        """Returns whether the request is signed with the secret of the installation."""
+        signature = self.get_signature(request)
+        message = self.get_message(request)
+        if not signature or message is None:
+            return False
+
+        expected = self.compute(installation, message)
+        return self.compare(signature, expected)
+
+    @staticmethod
+    def compare(signature: str, expected: Optional[str]) -> bool:
+        if expected is None:
+            return False
+        return hmac.compare_digest(signature.encode(), expected.encode())
+
+    def clear(self):
+        if self._prototypes is not None:
+            self._prototypes.clear()
+
+
+class QueryStringSignatureVerifier(SignatureVerifier):
+    """
+    Verifies signatures sent as a query param, over the other query params sorted by name
+    and joined as ``key=value`` pairs, where params with multiple values are joined too.
+    """
+
+    signature_param: str = "signature"
+    pair_separator: str = "&"
+    value_separator: str = ","
+
+    def get_signature(self, request: "Request") -> Optional[str]:
+        return request.query_params.get(self.signature_param)
+
+    def get_message(self, request: "Request") -> Optional[Iterable[bytes]]:
+        params = sorted(
+            (key, self.value_separator.join(sorted(values)))
+            for key, values in request.query_params.lists()
+            if key != self.signature_param
+        )
+        return [self.pair_separator.join(f"{key}={value}" for key, value in params).encode()]
+
+
+class BodySignatureVerifier(SignatureVerifier):
+    """Verifies signatures sent in a header, over the raw body of the request."""
+
+    signature_header: str
+
+    def get_signature(self, request: "Request") -> Optional[str]:
+        return request.headers.get(self.signature_header)
+
+    def get_message(self, request: "Request") -> Optional[Iterable[bytes]]:
+        return [request.body]
+
+
+class StreamingBodySignatureVerifier(BodySignatureVerifier):
+    """
+    Verifies signatures over the raw body like `BodySignatureVerifier`, but reads the
+    body in chunks, hashing them while spooling them to a buffer which is moved to disk
+    once it grows over ``spool_max_memory`` bytes. The buffer then replaces the request
+    stream, so the parsers read the verified body from it instead of a second copy.
+
+    Bodies over ``max_body_size`` bytes are rejected with `RequestBodyTooLarge` before
+    or while reading them. If the body has already been read, it is verified from memory.
+    """
+
+    chunk_size: int = 64 * 1024
+    spool_max_memory: int = 1024 * 1024
+    max_body_size: Optional[int] = 100 * 1024 * 1024
+
+    def verify(self, request: "Request", installation: "AbstractApplicationInstallation") -> bool:
+        http_request = getattr(request, "_request", request)
+        if http_request._read_started or hasattr(http_request, "_body"):
+            return super().verify(request, installation)
+
+        signature = self.get_signature(request)
+        if not signature:
+            return False
+        digest = self.get_hmac(installation)
+        if digest is None:
+            return False
+
+        self._check_size(self._get_content_length(http_request))
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.spool_max_memory)
+        size = 0
+        for chunk in iter(lambda: http_request.read(self.chunk_size), b""):
+            size += len(chunk)
+            self._check_size(size)
+            digest.update(chunk)
+            buffer.write(chunk)
+
+        buffer.seek(0)
+        http_request._stream = buffer
+        http_request._read_started = False
+        return self.compare(signature, self.encode(digest))
+
+    def _check_size(self, size: int):
+        if self.max_body_size is not None and size > self.max_body_size:
+            raise RequestBodyTooLarge()
+
+    @staticmethod
+    def _get_content_length(http_request: "HttpRequest") -> int:
+        try:
+            return int(http_request.META.get("CONTENT_LENGTH") or 0)
+        except (TypeError, ValueError):
+            return 0
@@ -2,6 +2,7 @@ from typing import Any, Iterable, Iterator, List, Optional, Union
 
 import django
 import logging
+from django.conf import settings
 from django.utils.module_loading import import_string
 from environ import Env
 
@@ -64,6 +65,16 @@ def is_instance_of_all(obj, classes: Iterable[type]) -> bool:
     return all(isinstance(obj, classinfo) for classinfo in classes)
 
 
+def get_setting(name: str) -> Any:
+    """
+    Returns the value of an optional drf_integrations setting, falling back to its
+    default as defined in `drf_integrations.apps.OPTIONAL_SETTINGS`.
+    """
+    from drf_integrations.apps import OPTIONAL_SETTINGS
+
+    return getattr(settings, name, OPTIONAL_SETTINGS[name])
+
+
 logger = logging.getLogger(__name__)
 
 
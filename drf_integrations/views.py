@@ -0,0 +1,45 @@
+from typing import Optional
+
+from rest_framework import exceptions, status, viewsets
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from drf_integrations.models import WebhookEvent
+
+
+class WebhookIngestionViewSet(viewsets.ViewSet):
+    """
+    Stores authenticated webhook deliveries as `WebhookEvent` and answers straight away,
+    leaving them to be processed by `BaseIntegration.process_webhook` in the
+    `processwebhooks` command. Duplicated deliveries are acknowledged but not stored.
+
+    Subclasses set the authentication classes (e.g. a subclass of
+    `IntegrationSignatureAuthentication`, which sets ``request.auth_context``) and the
+    headers holding the delivery id and the topic.
+    """
+
+    delivery_id_header: str
+    topic_header: Optional[str] = None
+
+    def get_body(self, request: Request) -> bytes:
+        """
+        Read the raw body from the request stream rather than ``request.body``, which
+        would load it in memory a second time and enforce ``DATA_UPLOAD_MAX_MEMORY_SIZE``.
+        The stream is the verified spooled body when it was verified while streaming it
+        (see `StreamingBodySignatureVerifier`).
+        """
+        stream = request.stream
+        return stream.read() if stream is not None else b""
+
+    def create(self, request: Request) -> Response:
+        delivery_id = request.headers.get(self.delivery_id_header)
+        if not delivery_id:
+            raise exceptions.ParseError(f"Missing {self.delivery_id_header} header")
+
+        WebhookEvent.objects.ingest(
+            installation=request.auth_context.installation,
+            delivery_id=delivery_id,
+            topic=request.headers.get(self.topic_header, "") if self.topic_header else "",
+            body=self.get_body(request),
+        )
+        return Response(status=status.HTTP_200_OK)
@@ -7,7 +7,7 @@ from oauth2_provider.models import get_access_token_model, get_application_model
 from drf_integrations.integrations.base import BaseClient, BaseIntegration, BaseIntegrationForm
 from drf_integrations.models import get_application_installation_model
 
-from ..models import IntegrationUser, User, UserPurchase
+from ..models import IntegrationUser, UserPurchase
 
 logger = logging.getLogger(__name__)
 
@@ -49,13 +49,18 @@ class MixpanelClient(BaseClient):
         super().__init__(**kwargs)
         self._client = Mixpanel(token=token)
 
-    def register_purchase(self, user: User, amount: int, currency: str, source_integration: str):
+    def register_purchase(self, user_id: int, amount: int, currency: str, source_integration: str):
         self._client.track(
-            str(user.pk),
+            str(user_id),
             "new_purchase",
             dict(amount=amount, currency=currency, source_integration=source_integration),
         )
 
+    def send_events(self, events):
+        for event in events:
+            if event.event_type == "new_purchase":
+                self.register_purchase(**event.payload)
+
 
 class MixpanelIntegration(BaseIntegration):
     name = "mixpanel"
@@ -72,13 +77,17 @@ def on_purchase_saved(sender, instance: UserPurchase, **kwargs):
         organisation_id=integration_user.user.organisation_id,
         **MixpanelIntegration.get_installation_lookup_from_config_values(),
     )
-    integration = installation.application.get_integration_instance()
-    client: MixpanelClient = integration.get_client(installation.get_context())
-    client.register_purchase(
-        user=integration_user.user,
-        amount=instance.amount,
-        currency=instance.currency,
-        source_integration=integration_user.integration_name,
+    # Sent to Mixpanel by the dispatchoutbox command, outside of the request
+    context = installation.get_context()
+    context.integration.enqueue_event(
+        context,
+        "new_purchase",
+        dict(
+            user_id=integration_user.user.pk,
+            amount=instance.amount,
+            currency=instance.currency,
+            source_integration=integration_user.integration_name,
+        ),
     )
 
 
@@ -1,18 +1,19 @@
-from typing import TYPE_CHECKING, Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List
 
-import hmac
 import logging
 from django import forms
-from django.contrib.auth.models import AnonymousUser
-from hashlib import sha256
 from oauth2_provider.contrib.rest_framework import TokenHasScope
 from oauth2_provider.models import get_access_token_model, get_application_model
-from rest_framework import routers, status, viewsets
-from rest_framework.authentication import BaseAuthentication
-from rest_framework.response import Response
+from rest_framework import routers
 
+from drf_integrations.auth_backends import IntegrationSignatureAuthentication
 from drf_integrations.integrations.base import BaseIntegration, BaseIntegrationForm
 from drf_integrations.models import get_application_installation_model
+from drf_integrations.signatures import (
+    QueryStringSignatureVerifier,
+    StreamingBodySignatureVerifier,
+)
+from drf_integrations.views import WebhookIngestionViewSet
 
 if TYPE_CHECKING:
     from rest_framework.request import Request
@@ -29,6 +30,9 @@ class ShopifyConfigForm(BaseIntegrationForm):
     shopify_shop = forms.CharField()
     shared_secret = forms.CharField()
 
+    # Queried by the uniqueness check in clean_form_data
+    indexed_fields = ("shopify_shop",)
+
     def set_initial_values(
         self,
         *,
@@ -60,7 +64,8 @@ class ShopifyConfigForm(BaseIntegrationForm):
         shopify_shop = data["shopify_shop"]
         organisation_id = data.get("organisation_id")
         if organisation_id and (
-            ApplicationInstallation.objects.filter(config__shopify_shop=shopify_shop)
+            ApplicationInstallation.objects.active()
+            .filter(config__shopify_shop=shopify_shop)
             .exclude(client_id=organisation_id)
             .exists()
         ):
@@ -75,10 +80,24 @@ class ShopifyConfigForm(BaseIntegrationForm):
         return data
 
 
+class ShopifyProxySignatureVerifier(QueryStringSignatureVerifier):
+    signature_param = "signature"
+    # Shopify joins the sorted key=value pairs of app proxy requests without a separator
+    pair_separator = ""
+    encoding = "hex"
+
+
+class ShopifyWebhookSignatureVerifier(StreamingBodySignatureVerifier):
+    signature_header = "X-Shopify-Hmac-Sha256"
+    encoding = "base64"
+
+
 class ShopifyIntegration(BaseIntegration):
     name = "shopify"
     display_name = "Shopify"
     config_form_class = ShopifyConfigForm
+    lookup_keys = ("shopify_shop",)
+    signature_verifier = ShopifyWebhookSignatureVerifier()
     default_scopes = ["purchase:shopify:write", "webhook:shopify:write"]
 
     def get_urls(self) -> List:
@@ -86,120 +105,33 @@ class ShopifyIntegration(BaseIntegration):
         router.register("webhook", ShopifyWebhookViewSet, basename="shopify")
         return router.urls
 
+    def process_webhook(self, context, event):
+        logger.info(
+            "integrations.shopify.webhook",
+            extra=dict(
+                topic=event.topic, data=event.get_payload(), installation=context.installation
+            ),
+        )
+
     @classmethod
     def get_installation_lookup_from_request(cls, request: "Request", **kwargs) -> Dict:
         return cls.get_installation_lookup_from_config_values(
             shopify_shop=(
-                request.headers.get("X-Shopify-Hmac-Sha256") or request.query_params.get("shop")
+                request.headers.get("X-Shopify-Shop-Domain") or request.query_params.get("shop")
             )
         )
 
 
-class ShopifyBaseAuthBackend(BaseAuthentication):
-    def _validate_required(self, request) -> bool:
-        raise NotImplementedError()
-
-    def _get_signature(self, request) -> Optional[bool]:
-        raise NotImplementedError()
-
-    def _get_signature_values(self, request) -> Optional[bool]:
-        raise NotImplementedError()
-
-    def authenticate(self, request):
-        if not self._validate_required(request):
-            logger.info("integrations.shopify.missing_params")
-            return None
-
-        try:
-            installation = ApplicationInstallation.objects.select_related("application").get(
-                **ShopifyIntegration.get_installation_lookup_from_request(
-                    request=request, application=None
-                )
-            )
-        except (
-            ApplicationInstallation.DoesNotExist,
-            ApplicationInstallation.MultipleObjectsReturned,
-        ):
-            logger.info("integrations.shopify.application_setup_not_found")
-            return None
-
-        context = installation.get_context()
-        signature = self._get_signature(request)
-        signature_values = self._get_signature_values(request)
-
-        if not signature or not signature_values:
-            logger.info(
-                "integrations.shopify.missing_signature_values",
-                extra=dict(signature=signature, signature_values=signature_values),
-            )
-            return None
-
-        new_signature = hmac.new(
-            context.installation.get_config()["shared_secret"].encode(),
-            signature_values,
-            sha256,
-        )
-        if not hmac.compare_digest(signature.encode("utf-8"), new_signature.encode("utf-8")):
-            logger.info(
-                "integrations.shopify.invalid_signature",
-                extra=dict(
-                    request=request,
-                    headers=request.headers,
-                    queryparams=request.query_params,
-                    signature=signature,
-                    calculated_signature=new_signature,
-                ),
-            )
-            return None
-
-        request.auth_context = context
-
-        return (
-            AnonymousUser(),
-            AccessToken.objects.create_for_internal_integration(
-                application=installation.application
-            ),
-        )
+class ShopifyBaseAuthBackend(IntegrationSignatureAuthentication):
+    integration_class = ShopifyIntegration
 
 
 class ShopifyProxyBackend(ShopifyBaseAuthBackend):
-    required_queryparams = (
-        "shop",
-        "signature",
-    )
-
-    def _validate_required(self, request) -> bool:
-        return all(request.query_params.get(key) for key in self.required_queryparams)
-
-    def _get_signature(self, request):
-        queryparams = {
-            key: ",".join(sorted(values))
-            for key, values in request.query_params.lists()
-            if key != "signature"
-        }
-        encoded_params = "&".join(
-            (f"{key}={queryparams[key]}" for key in sorted(queryparams.keys()))
-        )
-        return encoded_params
-
-    def _get_signature_values(self, request):
-        return request.query_params["signature"]
+    signature_verifier = ShopifyProxySignatureVerifier()
 
 
 class ShopifyWebhookBackend(ShopifyBaseAuthBackend):
-    required_headers = (
-        "X-Shopify-Hmac-Sha256",
-        "X-Shopify-Shop-Domain",
-    )
-
-    def _validate_required(self, request) -> bool:
-        return all(key in request.headers for key in self.required_headers)
-
-    def _get_signature(self, request):
-        return request.headers["X-Shopify-Hmac-Sha256"]
-
-    def _get_signature_values(self, request):
-        return request.body
+    pass
 
 
 class ShopifyPermission(TokenHasScope):
@@ -209,15 +141,9 @@ class ShopifyPermission(TokenHasScope):
         ) and super().has_permission(request, view)
 
 
-class ShopifyWebhookViewSet(viewsets.ViewSet):
+class ShopifyWebhookViewSet(WebhookIngestionViewSet):
     authentication_classes = (ShopifyWebhookBackend,)
     permission_classes = (ShopifyPermission,)
     required_scopes = ("webhook:shopify:write",)
-
-    def create(self, request):
-        logger.info(
-            "integrations.shopify.webhook",
-            extra=dict(data=request.data, installation=request.auth_context.installation),
-        )
-
-        return Response(status=status.HTTP_200_OK)
+    delivery_id_header = "X-Shopify-Webhook-Id"
+    topic_header = "X-Shopify-Topic"
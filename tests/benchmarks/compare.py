@@ -0,0 +1,62 @@
+"""
+Compare two benchmark result files written with ``--benchmark-json``, e.g. from the
+base branch and from a change, and exit with an error if any benchmark regressed.
+
+    python -m tests.benchmarks.compare base.json new.json --threshold 0.2
+"""
+import argparse
+import sys
+
+from tests.benchmarks.utils import load_results
+
+
+def get_change(old: float, new: float) -> float:
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - old) / old
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base", help="Results of the base commit")
+    parser.add_argument("new", help="Results to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative increase of p50/p99 latency or allocations considered a regression",
+    )
+    args = parser.parse_args(argv)
+
+    base, new = load_results(args.base), load_results(args.new)
+    regressions = []
+    print(f"{'benchmark':<50} {'queries':>12} {'p50':>8} {'p99':>8} {'alloc':>8}")
+    for key in sorted(base.keys() & new.keys()):
+        old_result, new_result = base[key], new[key]
+        changes = {
+            field: get_change(getattr(old_result, field), getattr(new_result, field))
+            for field in ("p50_ms", "p99_ms", "alloc_kib")
+        }
+        print(
+            f"{key:<50} {old_result.queries:>5.1f} -> {new_result.queries:<4.1f}"
+            + "".join(f" {change:>+7.0%}" for change in changes.values())
+        )
+        if new_result.queries > old_result.queries:
+            regressions.append(f"{key}: queries {old_result.queries} -> {new_result.queries}")
+        regressions.extend(
+            f"{key}: {field} {change:+.0%}"
+            for field, change in changes.items()
+            if change > args.threshold
+        )
+
+    for key in sorted(base.keys() - new.keys()):
+        print(f"{key:<50} missing from {args.new}")
+
+    if regressions:
+        print("\nRegressions:", *regressions, sep="\n  ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Benchmarks of the authentication hot paths, run with:
+
+    pytest tests/benchmarks --benchmark --benchmark-sizes=1000,100000 --benchmark-json=out.json
+
+Each benchmark runs with the given numbers of installations in the DB, and reports the
+queries, p50/p99 latency and allocations per call (see `tests.benchmarks.utils`).
+"""
+from typing import Callable, Optional
+
+import django
+import hmac
+import json
+import pytest
+from base64 import b64encode
+from django.core.cache import cache
+from hashlib import sha256
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from drf_integrations import models
+from drf_integrations.auth_backends import IntegrationOAuth2Authentication
+from drf_integrations.cache import installation_cache, internal_token_cache
+from example.drf_integrations_example.integrations.shopify import (
+    ShopifyIntegration,
+    ShopifyProxyBackend,
+    ShopifyWebhookBackend,
+)
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+BATCH_SIZE = 5000
+SHARED_SECRET = "shared-secret"
+
+factory = APIRequestFactory()
+
+
+def create_installations(
+    application: models.Application, size: int, get_config: Callable[[int], Optional[dict]]
+):
+    """Create ``size`` installations of the application in bulk, with their lookups."""
+    Installation = models.get_application_installation_model()
+    attr = models.get_application_installation_install_attribute_name()
+    for start in range(0, size, BATCH_SIZE):
+        Installation.objects.bulk_create(
+            Installation(
+                application=application, config=get_config(target_id), **{attr: target_id}
+            )
+            for target_id in range(start, min(start + BATCH_SIZE, size))
+        )
+
+    if application.get_integration_instance().lookup_keys:
+        installations = Installation.objects.filter(application=application).select_related(
+            "application"
+        )
+        for start in range(0, size, BATCH_SIZE):
+            models.ApplicationInstallationLookup.objects.sync_many(
+                installations=installations.order_by("pk")[start : start + BATCH_SIZE]
+            )
+
+
+def get_shop(target_id: int) -> str:
+    return f"shop-{target_id}.myshopify.com"
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for local_cache in (installation_cache, internal_token_cache, cache):
+        local_cache.clear()
+    yield
+    for local_cache in (installation_cache, internal_token_cache, cache):
+        local_cache.clear()
+
+
+@pytest.fixture
+def shopify_application(benchmark_size) -> models.Application:
+    application = models.Application.objects.get_by_internal_integration(ShopifyIntegration)
+    create_installations(
+        application,
+        benchmark_size,
+        lambda target_id: dict(shopify_shop=get_shop(target_id), shared_secret=SHARED_SECRET),
+    )
+    return application
+
+
+@pytest.mark.parametrize(
+    "mode",
+    [
+        "default",
+        pytest.param(
+            "single_query",
+            marks=pytest.mark.skipif(django.VERSION < (3, 2), reason="Requires Django 3.2+"),
+        ),
+        "installation_cache",
+    ],
+)
+def test_oauth2_authenticate(
+    benchmark,
+    benchmark_size,
+    settings,
+    get_integration,
+    get_application,
+    create_access_token,
+    mode,
+):
+    create_installations(
+        get_application(integration=get_integration(is_local=False)),
+        benchmark_size,
+        lambda target_id: None,
+    )
+    integration = get_integration(is_local=True)
+    token, __ = create_access_token(
+        target_id=benchmark_size,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="benchmark-token",
+    )
+    backend = IntegrationOAuth2Authentication()
+    backend.single_query_local_installations = mode == "single_query"
+    settings.INTEGRATIONS_INSTALLATION_CACHE_ENABLED = mode == "installation_cache"
+
+    def authenticate():
+        return backend.authenticate(
+            Request(factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token.token}"))
+        )
+
+    assert authenticate()[1] == token
+    benchmark(authenticate, name=f"oauth2_authenticate_{mode}", size=benchmark_size)
+
+
+def test_shopify_proxy_authenticate(benchmark, benchmark_size, shopify_application):
+    params = dict(shop=get_shop(benchmark_size // 2), path_prefix="/apps/proxy", timestamp="1")
+    message = "".join(f"{key}={params[key]}" for key in sorted(params))
+    params["signature"] = hmac.new(SHARED_SECRET.encode(), message.encode(), sha256).hexdigest()
+    backend = ShopifyProxyBackend()
+
+    def authenticate():
+        return backend.authenticate(Request(factory.get("/", params)))
+
+    assert authenticate() is not None
+    benchmark(authenticate, name="shopify_proxy_authenticate", size=benchmark_size)
+
+
+def test_shopify_webhook_authenticate(benchmark, benchmark_size, shopify_application):
+    body = json.dumps(dict(id=1, line_items=[dict(sku=f"sku-{i}") for i in range(50)]))
+    signature = b64encode(
+        hmac.new(SHARED_SECRET.encode(), body.encode(), sha256).digest()
+    ).decode()
+    backend = ShopifyWebhookBackend()
+
+    def authenticate():
+        return backend.authenticate(
+            Request(
+                factory.post(
+                    "/",
+                    data=body,
+                    content_type="application/json",
+                    HTTP_X_SHOPIFY_HMAC_SHA256=signature,
+                    HTTP_X_SHOPIFY_SHOP_DOMAIN=get_shop(benchmark_size // 2),
+                )
+            )
+        )
+
+    assert authenticate() is not None
+    benchmark(authenticate, name="shopify_webhook_authenticate", size=benchmark_size)
+
+
+@pytest.mark.parametrize("token_cache", [False, True])
+def test_create_for_internal_integration(
+    benchmark, benchmark_size, settings, shopify_application, token_cache
+):
+    settings.INTEGRATIONS_INTERNAL_TOKEN_CACHE_ENABLED = token_cache
+
+    def create():
+        return models.AccessToken.objects.create_for_internal_integration(
+            application=shopify_application
+        )
+
+    name = "create_for_internal_integration" + ("_cached" if token_cache else "")
+    benchmark(create, name=name, size=benchmark_size)
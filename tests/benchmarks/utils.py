@@ -0,0 +1,120 @@
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import json
+import math
+import subprocess
+import time
+import tracemalloc
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+QUERY_CALLS = 10
+ALLOCATION_CALLS = 20
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    size: int
+    vendor: str
+    iterations: int
+    queries: float
+    p50_ms: float
+    p99_ms: float
+    alloc_kib: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.vendor}-{self.size}]"
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def measure(
+    func: Callable[[], object], *, name: str, size: int, iterations: int, warmup: int = 5
+) -> BenchmarkResult:
+    """
+    Measure ``func`` in separate passes, so that counting queries and tracing
+    allocations do not add to the measured latency:
+
+    - Queries per call, averaged over a few calls.
+    - p50 and p99 latency over ``iterations`` calls.
+    - Peak memory allocated per call (median), traced with `tracemalloc`.
+    """
+    for __ in range(warmup):
+        func()
+
+    with CaptureQueriesContext(connection) as context:
+        for __ in range(QUERY_CALLS):
+            func()
+    queries = len(context.captured_queries) / QUERY_CALLS
+
+    durations = []
+    for __ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    allocations = []
+    for __ in range(ALLOCATION_CALLS):
+        tracemalloc.start()
+        try:
+            func()
+            __, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        allocations.append(peak / 1024)
+
+    return BenchmarkResult(
+        name=name,
+        size=size,
+        vendor=connection.vendor,
+        iterations=iterations,
+        queries=queries,
+        p50_ms=round(percentile(durations, 50), 4),
+        p99_ms=round(percentile(durations, 99), 4),
+        alloc_kib=round(percentile(allocations, 50), 2),
+    )
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dump_results(results: Iterable[BenchmarkResult], path: str):
+    with open(path, "w") as output:
+        json.dump(
+            dict(commit=get_commit(), results=[asdict(result) for result in results]),
+            output,
+            indent=2,
+        )
+
+
+def load_results(path: str) -> Dict[str, BenchmarkResult]:
+    with open(path) as source:
+        data = json.load(source)
+    results = (BenchmarkResult(**result) for result in data["results"])
+    return {result.key: result for result in results}
+
+
+def format_results(results: Iterable[BenchmarkResult]) -> List[str]:
+    lines = [f"{'benchmark':<50} {'queries':>8} {'p50 ms':>9} {'p99 ms':>9} {'alloc KiB':>10}"]
+    for result in results:
+        lines.append(
+            f"{result.key:<50} {result.queries:>8.1f} {result.p50_ms:>9.3f} "
+            f"{result.p99_ms:>9.3f} {result.alloc_kib:>10.1f}"
+        )
+    return lines
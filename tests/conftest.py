@@ -19,6 +19,84 @@ if TYPE_CHECKING:
     from drf_integrations import models
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "drf_integrations benchmarks")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Run the benchmarks in tests/benchmarks, which are skipped otherwise",
+    )
+    group.addoption(
+        "--benchmark-sizes",
+        default="1000",
+        help="Comma separated numbers of installations to run each benchmark with",
+    )
+    group.addoption(
+        "--benchmark-iterations",
+        type=int,
+        default=200,
+        help="Number of calls to measure the latency of each benchmark",
+    )
+    group.addoption(
+        "--benchmark-json",
+        default=None,
+        help="Write the benchmark results to this file, to compare them between commits",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "benchmark_size" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("benchmark_sizes").split(",")]
+        metafunc.parametrize("benchmark_size", sizes)
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = getattr(config, "benchmark_results", None)
+    if not results:
+        return
+
+    from tests.benchmarks.utils import dump_results, format_results
+
+    terminalreporter.section("benchmarks")
+    for line in format_results(results):
+        terminalreporter.write_line(line)
+    path = config.getoption("benchmark_json")
+    if path:
+        dump_results(results, path)
+        terminalreporter.write_line(f"Benchmark results written to {path}")
+
+
+@pytest.fixture
+def benchmark(request):
+    """
+    Measure a callable and record the result for the benchmarks summary, see
+    `tests.benchmarks.utils.measure`.
+    """
+    from tests.benchmarks.utils import measure
+
+    config = request.config
+    if not hasattr(config, "benchmark_results"):
+        config.benchmark_results = []
+
+    def run(func, *, name: str, size: int):
+        result = measure(
+            func, name=name, size=size, iterations=config.getoption("benchmark_iterations")
+        )
+        config.benchmark_results.append(result)
+        return result
+
+    return run
+
+
 def pytest_configure(config):
     from django.conf import settings
 
@@ -87,6 +165,15 @@ def pytest_configure(config):
     django.setup()
 
 
+@pytest.fixture(autouse=True)
+def clear_internal_application_cache():
+    # Applications are rolled back after every test, so they must not outlive it
+    from drf_integrations.cache import internal_application_cache
+
+    yield
+    internal_application_cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def reset_registry():
     yield
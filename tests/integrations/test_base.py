@@ -1,10 +1,13 @@
 import copy
+import importlib
 import pytest
 from django import forms
+from django.apps import apps
 from django.core.exceptions import ValidationError
+from django.db import connection
 from unittest.mock import Mock
 
-from drf_integrations import integrations
+from drf_integrations import integrations, models
 from drf_integrations.integrations.base import Context
 from tests import factories, integration_samples
 
@@ -145,3 +148,98 @@ def test_check_config_fails(get_integration, has_form, config):
         )
 
     assert exc.value.message_dict == {"extra_field": ["Value cannot be forbidden"]}
+
+
+class IntegrationWithLookupKeys(integration_samples.TestInternalIntegration):
+    name = "test_internal_lookup_keys"
+    lookup_keys = ("shop", "region")
+
+
+@pytest.mark.django_db
+def test_get_installation_lookup_from_config_values_indexed(get_application):
+    """
+    Config keys declared in `lookup_keys` are resolved through the indexed lookup table,
+    which is kept in sync when the installation config changes
+    """
+    integration = integrations.register(IntegrationWithLookupKeys)
+    application = get_application(integration=integration)
+    installation = application.install(target_id=1, config=dict(shop="shop-1", region="eu"))
+    application.install(target_id=2, config=dict(shop="shop-2", region="eu"))
+    assert set(
+        models.ApplicationInstallationLookup.objects.filter(installation=installation).values_list(
+            "key", flat=True
+        )
+    ) == {"shop", "region"}
+
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1")
+    assert "config__shop" not in lookup
+    assert models.ApplicationInstallation.objects.get(**lookup) == installation
+
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1", region="eu")
+    assert models.ApplicationInstallation.objects.get(**lookup) == installation
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1", region="us")
+    assert not models.ApplicationInstallation.objects.filter(**lookup).exists()
+
+    application.install(target_id=1, config=dict(shop="shop-3", region="eu"))
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1")
+    assert not models.ApplicationInstallation.objects.filter(**lookup).exists()
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-3")
+    assert models.ApplicationInstallation.objects.get(**lookup) == installation
+
+
+@pytest.mark.django_db
+def test_lookups_backfilled_by_migration(get_application):
+    """
+    The migration creating the lookup table fills it for the existing installations
+    """
+    migration = importlib.import_module(
+        "drf_integrations.migrations.0006_applicationinstallationlookup"
+    )
+    integration = integrations.register(IntegrationWithLookupKeys)
+    application = get_application(integration=integration)
+    installation = application.install(target_id=1, config=dict(shop="shop-1", other="a"))
+    application.install(target_id=2, config=dict(region="eu"))
+    other_integration = integrations.register(integration_samples.TestInternalIntegration)
+    get_application(integration=other_integration).install(target_id=1, config=dict(shop="shop-1"))
+    models.ApplicationInstallationLookup.objects.all().delete()
+
+    migration.backfill_lookups(apps, Mock(connection=connection))
+
+    assert models.ApplicationInstallationLookup.objects.count() == 2
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1")
+    assert models.ApplicationInstallation.objects.get(**lookup) == installation
+
+
+@pytest.mark.django_db
+def test_get_installation_lookup_from_config_values_mixed(get_application):
+    """
+    Keys not declared in `lookup_keys` still filter the config column
+    """
+    integration = integrations.register(IntegrationWithLookupKeys)
+    application = get_application(integration=integration)
+    installation = application.install(target_id=1, config=dict(shop="shop-1", other="a"))
+
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1", other="a")
+    assert lookup["config__other"] == "a"
+    assert models.ApplicationInstallation.objects.get(**lookup) == installation
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1", other="b")
+    assert not models.ApplicationInstallation.objects.filter(**lookup).exists()
+
+
+@pytest.mark.django_db
+def test_install_many_syncs_lookups(get_application):
+    """
+    Installations created in bulk can be looked up by their indexed config values
+    """
+    integration = integrations.register(IntegrationWithLookupKeys)
+    application = get_application(integration=integration)
+    installations = application.install_many([1, 2], config=dict(shop="shop-1"))
+
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-1")
+    assert list(models.ApplicationInstallation.objects.filter(**lookup).order_by("pk")) == (
+        installations
+    )
+
+    application.install_many([2], config=dict(shop="shop-2"))
+    lookup = integration.get_installation_lookup_from_config_values(shop="shop-2")
+    assert models.ApplicationInstallation.objects.get(**lookup) == installations[1]
@@ -1,7 +1,8 @@
 import pytest
-from django.urls import URLResolver, path
+from django.urls import Resolver404, URLResolver, path, reverse
 from django.urls.resolvers import RegexPattern
 
+from drf_integrations.exceptions import ImproperlyConfigured
 from drf_integrations.integrations import Registry
 from drf_integrations.integrations.base import BaseIntegration
 from tests.integration_samples import TestInternalIntegration, TestLocalIntegration
@@ -88,3 +89,129 @@ def test_get_urls():
     for valid_path in valid_paths:
         resolver_match = resolver.resolve(valid_path)
         assert resolver_match.func == mock_request_handler
+
+
+def test_get_all_cached(get_integration, mocker):
+    """
+    Results of ``get_all`` are cached per arguments, and refreshed on ``register``
+    """
+    registry = Registry()
+    integration1 = get_integration(is_local=True, register=False)
+    registry.register(integration1)
+    assert registry.get_all(BaseIntegration) == {integration1()}
+
+    get_by_class = mocker.spy(registry, "_get_by_class")
+    result = registry.get_all(BaseIntegration)
+    result.clear()
+    assert registry.get_all(BaseIntegration) == {integration1()}
+    get_by_class.assert_not_called()
+
+    integration2 = get_integration(is_local=False, register=False)
+    registry.register(integration2)
+    assert registry.get_all(BaseIntegration) == {integration1(), integration2()}
+    assert registry.get_all(BaseIntegration, is_local=False) == {integration2()}
+
+    registry.integrations = {}
+    assert registry.get_all(BaseIntegration) == set()
+
+
+def test_register_lazy():
+    """
+    Lazily registered integrations are only instantiated when they are needed
+    """
+    registry = Registry()
+    registry.register_lazy(
+        "tests.integration_samples.TestLocalIntegration",
+        name=TestLocalIntegration.name,
+        is_local=True,
+    )
+    registry.register_lazy(
+        "tests.integration_samples.TestInternalIntegration", name=TestInternalIntegration.name
+    )
+    assert registry.integrations == {}
+    assert registry.get_names() == {TestLocalIntegration.name, TestInternalIntegration.name}
+    assert registry.get_names(is_local=True) == {TestLocalIntegration.name}
+
+    assert registry.get_all(is_local=False) == {TestInternalIntegration()}
+    assert list(registry.integrations) == [TestInternalIntegration.name]
+
+    assert registry.get(TestLocalIntegration) == TestLocalIntegration()
+    assert len(registry.integrations) == 2
+    assert registry.get_all() == {TestLocalIntegration(), TestInternalIntegration()}
+
+    with pytest.raises(ImproperlyConfigured):
+        registry.register(TestLocalIntegration)
+
+
+def test_register_lazy_preload():
+    """
+    Preloading instantiates all the lazily registered integrations, which must match
+    the name and locality they were registered with
+    """
+    registry = Registry()
+    registry.register_lazy(
+        "tests.integration_samples.TestInternalIntegration", name=TestInternalIntegration.name
+    )
+    registry.preload()
+    assert list(registry.integrations) == [TestInternalIntegration.name]
+
+    registry.register_lazy(
+        "tests.integration_samples.TestLocalIntegration", name="other", is_local=True
+    )
+    with pytest.raises(ImproperlyConfigured):
+        registry.get("other")
+    with pytest.raises(ImproperlyConfigured):
+        registry.register_lazy(
+            "tests.integration_samples.TestInternalIntegration",
+            name=TestInternalIntegration.name,
+        )
+
+
+def test_get_urls_dispatch_by_name(mocker):
+    """
+    The URLConf is cached, integration URLs are resolved without trying other
+    integrations and can be reversed
+    """
+    registry = Registry()
+
+    def handler(request):
+        return None
+
+    def make_integration(integration_name):
+        class Integration(BaseIntegration):
+            name = integration_name
+
+            def get_urls(self):
+                return [path("v1/path/", handler, name="path")]
+
+        return Integration
+
+    for name in ["first", "second"]:
+        registry.register(make_integration(name))
+
+    urlconf = registry.get_urls()
+    assert registry.get_urls() == urlconf
+    resolver = URLResolver(RegexPattern(r"^/"), urlconf)
+
+    first_resolver = urlconf[-1].resolvers["first"]
+    first_resolve = mocker.spy(first_resolver, "resolve")
+    resolver_match = resolver.resolve("/api/integrations/second/v1/path/")
+    assert resolver_match.func == handler
+    assert resolver_match.namespace == "integration-second"
+    assert resolver_match.route == "api/integrations/second/v1/path/"
+    first_resolve.assert_not_called()
+
+    class URLConf:
+        urlpatterns = urlconf
+
+    assert reverse("integration-second:path", urlconf=URLConf) == (
+        "/api/integrations/second/v1/path/"
+    )
+
+    for invalid_path in ["/api/integrations/third/v1/path/", "/api/integrations/first/v2/"]:
+        with pytest.raises(Resolver404):
+            resolver.resolve(invalid_path)
+
+    registry.register(make_integration("third"))
+    resolver = URLResolver(RegexPattern(r"^/"), registry.get_urls())
+    assert resolver.resolve("/api/integrations/third/v1/path/").func == handler
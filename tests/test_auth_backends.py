@@ -1,16 +1,34 @@
+import django
 import pytest
+from asgiref.sync import async_to_sync
+from datetime import timedelta
+from django.utils import timezone
 from oauth2_provider.contrib.rest_framework import TokenHasScope
-from rest_framework import status
+from oauth2_provider.models import get_access_token_model
+from rest_framework import exceptions, status
+from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory
 from rest_framework.viewsets import ViewSet
 
-from drf_integrations.auth_backends import IntegrationOAuth2Authentication
+from drf_integrations import auth_backends, routers
+from drf_integrations.auth_backends import (
+    AsyncIntegrationOAuth2Authentication,
+    IntegrationOAuth2Authentication,
+)
+from drf_integrations.exceptions import ImproperlyConfigured
 from drf_integrations.integrations.base import Context
 from tests.integration_samples import TestLocalWithFormIntegration
 from tests.utils import WrapperResponse
 
 REQUIRED_SCOPE = "my_scope"
 
+requires_async_orm = pytest.mark.skipif(
+    django.VERSION < (4, 1), reason="The async ORM needs Django 4.1+"
+)
+requires_nested_filtered_relation = pytest.mark.skipif(
+    django.VERSION < (3, 2), reason="FilteredRelation conditions on nested relations need 3.2+"
+)
+
 
 class TestOAuthViewset(ViewSet):
     authentication_classes = (IntegrationOAuth2Authentication,)
@@ -112,6 +130,88 @@ def test_oauth_backend_pass(get_integration, create_access_token):
     assert response.request.auth_context == Context(installation=installation)
 
 
+@pytest.fixture
+def replicas(settings, mocker):
+    """
+    Use the default DB as a replica, spying on the reads sent back to the primary.
+    """
+    settings.INTEGRATIONS_READ_REPLICAS = ["default"]
+    token = routers._primary_until.set(0.0)
+    yield mocker.spy(auth_backends, "use_primary")
+    routers._primary_until.reset(token)
+
+
+@pytest.fixture
+def lagging_replica(replicas, mocker):
+    """
+    Make the replica miss every access token, as if they were not replicated yet.
+    """
+    AccessToken = get_access_token_model()
+    manager_class = type(AccessToken.objects)
+    get_queryset = manager_class.get_queryset
+
+    def get_replicated_queryset(manager):
+        queryset = get_queryset(manager)
+        if manager.model is AccessToken and not routers.is_pinned():
+            return queryset.none()
+        return queryset
+
+    mocker.patch.object(manager_class, "get_queryset", get_replicated_queryset)
+    return replicas
+
+
+@pytest.mark.django_db
+def test_oauth_backend_token_not_replicated(get_integration, create_access_token, lagging_replica):
+    """
+    Tokens missing from the replica are read again from the primary
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="token",
+        scope=REQUIRED_SCOPE,
+    )
+    # Another request, which is not pinned to the primary by the writes above
+    routers._primary_until.set(0.0)
+    factory = APIRequestFactory()
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(factory.post("", HTTP_AUTHORIZATION="Bearer token"))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.request.auth == token
+    assert response.request.auth_context == Context(installation=installation)
+    lagging_replica.assert_called_once()
+
+    response = view(factory.post("", HTTP_AUTHORIZATION="Bearer invalid"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert lagging_replica.call_count == 2
+
+
+@pytest.mark.django_db
+def test_oauth_backend_expired_token_not_retried(get_integration, create_access_token, replicas):
+    """
+    Tokens found but rejected are not read again from the primary
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token, __ = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="token",
+        scope=REQUIRED_SCOPE,
+    )
+    token.expires = timezone.now() - timedelta(days=1)
+    token.save()
+    routers._primary_until.set(0.0)
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(APIRequestFactory().post("", HTTP_AUTHORIZATION="Bearer token"))
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    replicas.assert_not_called()
+
+
 class IntegrationSpecificAuthentication(IntegrationOAuth2Authentication):
     ensure_integration_classes = (TestLocalWithFormIntegration,)
 
@@ -136,3 +236,183 @@ def test_oauth_backend_cannot_ensure_integration(get_integration, create_access_
     response = view(request)
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_oauth_backend_aauthenticate_old_django(mocker):
+    """
+    The async backend cannot be used before Django 4.1
+    """
+    mocker.patch("django.VERSION", (4, 0, 0, "final", 0))
+    request = Request(APIRequestFactory().post(""))
+
+    with pytest.raises(ImproperlyConfigured):
+        async_to_sync(AsyncIntegrationOAuth2Authentication().authenticate)(request)
+
+
+@requires_async_orm
+@pytest.mark.django_db
+def test_oauth_backend_aauthenticate_pass(get_integration, create_access_token):
+    """
+    The async backend resolves the token and installation like the sync one
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token_str = "token"
+    token, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token=token_str,
+        scope=REQUIRED_SCOPE,
+    )
+    request = Request(APIRequestFactory().post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+
+    user, auth = async_to_sync(AsyncIntegrationOAuth2Authentication().authenticate)(request)
+
+    assert user is None
+    assert auth == token
+    assert request.auth_context == Context(installation=installation)
+
+
+@pytest.mark.parametrize("token_str", ["invalid", "expired"])
+@requires_async_orm
+@pytest.mark.django_db
+def test_oauth_backend_aauthenticate_invalid_token(
+    get_integration, create_access_token, token_str
+):
+    """
+    The async backend fails for unknown or expired tokens
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token, __ = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="expired",
+        scope=REQUIRED_SCOPE,
+    )
+    token.expires = timezone.now() - timedelta(seconds=1)
+    token.save()
+    request = Request(APIRequestFactory().post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+
+    with pytest.raises(exceptions.AuthenticationFailed):
+        async_to_sync(IntegrationOAuth2Authentication().aauthenticate)(request)
+
+
+@requires_async_orm
+@pytest.mark.django_db
+def test_oauth_backend_aauthenticate_not_installed(get_integration, create_access_token):
+    """
+    The async backend fails if the application is not installed
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token_str = "token"
+    __, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token=token_str,
+        scope=REQUIRED_SCOPE,
+    )
+    installation.delete()
+    request = Request(APIRequestFactory().post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+
+    with pytest.raises(exceptions.AuthenticationFailed):
+        async_to_sync(IntegrationOAuth2Authentication().aauthenticate)(request)
+
+
+@requires_async_orm
+def test_oauth_backend_aauthenticate_no_authentication():
+    """
+    Requests without a token are not authenticated by the async backend
+    """
+    request = Request(APIRequestFactory().post(""))
+
+    assert async_to_sync(IntegrationOAuth2Authentication().aauthenticate)(request) is None
+
+
+class SingleQueryAuthentication(IntegrationOAuth2Authentication):
+    single_query_local_installations = True
+
+
+def test_oauth_backend_single_query_old_django(mocker):
+    """
+    The single query mode cannot be used before Django 3.2
+    """
+    mocker.patch("django.VERSION", (3, 1, 0, "final", 0))
+    request = Request(APIRequestFactory().post(""))
+
+    with pytest.raises(ImproperlyConfigured):
+        SingleQueryAuthentication().authenticate(request)
+
+
+@requires_nested_filtered_relation
+@pytest.mark.django_db
+def test_oauth_backend_single_query_pass(
+    get_integration, create_access_token, django_assert_num_queries
+):
+    """
+    In single query mode, the token and the installation of a local integration are
+    fetched at once
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token_str = "token"
+    token, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token=token_str,
+        scope=REQUIRED_SCOPE,
+    )
+    factory = APIRequestFactory()
+    view = TestOAuthViewset.as_view(
+        {"post": "create"}, authentication_classes=(SingleQueryAuthentication,)
+    )
+    request = factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}")
+
+    with django_assert_num_queries(1):
+        response = view(request)
+        assert response.request.auth_context.installation.application == token.application
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.request.auth == token
+    assert response.request.auth_context == Context(installation=installation)
+
+
+@requires_nested_filtered_relation
+@pytest.mark.django_db
+def test_oauth_backend_single_query_not_installed(get_integration, create_access_token):
+    """
+    In single query mode, authentication fails if the local integration is not installed
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token_str = "token"
+    __, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token=token_str,
+        scope=REQUIRED_SCOPE,
+    )
+    installation.delete()
+    factory = APIRequestFactory()
+    view = TestOAuthViewset.as_view(
+        {"post": "create"}, authentication_classes=(SingleQueryAuthentication,)
+    )
+
+    response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = view(factory.post("", HTTP_AUTHORIZATION="Bearer invalid"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@requires_nested_filtered_relation
+@pytest.mark.django_db
+def test_oauth_backend_single_query_internal_integration(
+    get_integration, get_application, create_access_token
+):
+    """
+    Installations of internal integrations are not joined to their tokens
+    """
+    application = get_application(integration=get_integration(is_local=False))
+    token, __ = create_access_token(target_id=1, application=application, token="token")
+    application.install(target_id=2)
+
+    queryset = SingleQueryAuthentication()._get_token_queryset().filter(token="token")
+    assert queryset.count() == 1
+    assert getattr(queryset.get(), "active_installation", None) is None
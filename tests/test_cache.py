@@ -0,0 +1,431 @@
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from drf_integrations import integrations, models, routers
+from drf_integrations.cache import (
+    InstallationCache,
+    LocalTTLCache,
+    client_pool,
+    installation_cache,
+)
+from drf_integrations.integrations.base import BaseClient
+from tests import factories
+from tests.test_auth_backends import REQUIRED_SCOPE, TestOAuthViewset
+
+
+@pytest.fixture
+def enable_installation_cache(settings):
+    settings.INTEGRATIONS_INSTALLATION_CACHE_ENABLED = True
+    installation_cache.clear()
+    cache.clear()
+    yield
+    installation_cache.clear()
+    cache.clear()
+
+
+def test_local_ttl_cache_expires(mocker):
+    """
+    Entries in a LocalTTLCache are dropped once their timeout is reached
+    """
+    monotonic = mocker.patch("drf_integrations.cache.time.monotonic", return_value=0)
+    local = LocalTTLCache(maxsize=10, timeout=5)
+    local.set("key", "value")
+    assert local.get("key") == "value"
+    monotonic.return_value = 5
+    assert local.get("key") is None
+    assert len(local) == 0
+
+
+def test_local_ttl_cache_evicts_least_recently_used():
+    """
+    When a LocalTTLCache is full, the least recently used entry is evicted
+    """
+    local = LocalTTLCache(maxsize=2, timeout=60)
+    local.set("a", 1)
+    local.set("b", 2)
+    assert local.get("a") == 1
+    local.set("c", 3)
+    assert local.get("a") == 1
+    assert local.get("b") is None
+    assert local.get("c") == 3
+
+
+def test_lazy_cache_property(settings):
+    """
+    Per-process caches are created on first access only, and then reused
+    """
+    settings.INTEGRATIONS_INSTALLATION_CACHE_LOCAL_MAXSIZE = 3
+    lookup_cache = InstallationCache()
+    assert lookup_cache._local is None
+
+    local = lookup_cache.local
+    assert local.maxsize == 3
+    assert lookup_cache.local is local is lookup_cache._local
+    assert lookup_cache._local_missing is None
+
+
+def test_installation_cache_make_key():
+    """
+    Lookups are normalised, so model instances and their pk produce the same key
+    """
+    application = factories.ApplicationFactory.build(pk=3)
+    assert InstallationCache.make_key(dict(application=application, a=1)) == (
+        InstallationCache.make_key(dict(a=1, application=3))
+    )
+    assert InstallationCache.make_key(dict(a=1)) != InstallationCache.make_key(dict(a=2))
+
+
+@pytest.mark.django_db
+def test_installation_cache_disabled(get_integration, get_application):
+    """
+    Nothing is cached unless INTEGRATIONS_INSTALLATION_CACHE_ENABLED is set
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    installation = application.install(target_id=1)
+    installation_cache.set(dict(application=application), installation)
+    assert installation_cache.get(dict(application=application)) is None
+
+
+@pytest.mark.django_db
+def test_installation_cache_invalidated_on_save(
+    get_integration, get_application, enable_installation_cache, django_capture_on_commit_callbacks
+):
+    """
+    Saving, installing or uninstalling an installation drops its cached lookups, once
+    the transaction commits
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    installation = application.install(target_id=1)
+    lookup = dict(application=application)
+
+    installation_cache.set(lookup, installation)
+    assert installation_cache.get(lookup) == installation
+
+    with django_capture_on_commit_callbacks(execute=True):
+        application.uninstall(target_id=1)
+        assert installation_cache.get(lookup) == installation
+    assert installation_cache.get(lookup) is None
+
+    installation_cache.set(lookup, installation)
+    with django_capture_on_commit_callbacks(execute=True):
+        application.install(target_id=1, config=dict(key="value"))
+    assert installation_cache.get(lookup) is None
+
+
+@pytest.mark.django_db
+def test_installation_cache_shared_backend(
+    get_integration, get_application, enable_installation_cache
+):
+    """
+    Entries missing from the per-process cache are read from the Django cache
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    installation = application.install(target_id=1)
+    lookup = dict(application=application)
+
+    installation_cache.set(lookup, installation)
+    installation_cache.clear()
+    assert installation_cache.get(lookup) == installation
+    assert cache.get(InstallationCache.make_key(lookup))[2] == installation
+
+
+@pytest.mark.django_db
+def test_installation_cache_invalidates_every_lookup(
+    get_integration, get_application, enable_installation_cache
+):
+    """
+    Saving an installation invalidates all its lookups, whichever process cached them
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    installation = application.install(target_id=1)
+    lookups = [dict(application=application), dict(pk=installation.pk)]
+
+    for lookup in lookups:
+        installation_cache.set(lookup, installation)
+        # Lookups cached by other processes are only in the Django cache
+        installation_cache.clear()
+    assert all(installation_cache.get(lookup) == installation for lookup in lookups)
+
+    installation_cache.invalidate(installation)
+    assert all(installation_cache.get(lookup) is None for lookup in lookups)
+    installation_cache.clear()
+    assert all(installation_cache.get(lookup) is None for lookup in lookups)
+
+    installation_cache.set(lookups[0], installation)
+    assert installation_cache.get(lookups[0]) == installation
+
+
+@pytest.mark.django_db
+def test_installation_cache_invalidated_while_resolving(
+    get_integration,
+    get_application,
+    enable_installation_cache,
+    mocker,
+    django_capture_on_commit_callbacks,
+):
+    """
+    An installation uninstalled while it is being read from the DB is not cached
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    with django_capture_on_commit_callbacks(execute=True):
+        installation = application.install(target_id=1)
+    lookup = dict(application=application)
+    queryset = models.ApplicationInstallation.objects.active()
+    get_from_replica = routers.get_from_replica
+
+    def get_and_uninstall(*args, **kwargs):
+        result = get_from_replica(*args, **kwargs)
+        # A concurrent request uninstalls it after it is read
+        with django_capture_on_commit_callbacks(execute=True):
+            application.uninstall(target_id=1)
+        return result
+
+    mocker.patch.object(routers, "get_from_replica", get_and_uninstall)
+    assert installation_cache.resolve(lookup, queryset) == installation
+    assert installation_cache.get(lookup) is None
+
+    mocker.stopall()
+    with pytest.raises(models.ApplicationInstallation.DoesNotExist):
+        installation_cache.resolve(lookup, queryset)
+
+
+@pytest.mark.django_db
+def test_oauth_backend_uses_installation_cache(
+    get_integration,
+    create_access_token,
+    enable_installation_cache,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    """
+    Once the installation is cached, authenticating does not query it again,
+    and deleting the installation makes the next request fail
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token_str = "token"
+    __, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token=token_str,
+        scope=REQUIRED_SCOPE,
+    )
+    factory = APIRequestFactory()
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.request.auth_context.installation == installation
+
+    # Only the token is fetched, the installation comes from the cache
+    with django_assert_num_queries(1):
+        response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.request.auth_context.installation == installation
+
+    with django_capture_on_commit_callbacks(execute=True):
+        installation.delete()
+    response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.fixture
+def enable_installation_negative_cache(settings):
+    settings.INTEGRATIONS_INSTALLATION_NEGATIVE_CACHE_ENABLED = True
+    installation_cache.clear()
+    cache.clear()
+    yield
+    installation_cache.clear()
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_installation_negative_cache(
+    get_integration,
+    get_application,
+    enable_installation_negative_cache,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    """
+    A lookup without installation is remembered, until any installation is saved
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    lookup = dict(application=application)
+    queryset = models.ApplicationInstallation.objects.active()
+
+    with pytest.raises(models.ApplicationInstallation.DoesNotExist):
+        installation_cache.resolve(lookup, queryset)
+    assert installation_cache.is_missing(lookup)
+
+    with django_assert_num_queries(0):
+        with pytest.raises(models.ApplicationInstallation.DoesNotExist):
+            installation_cache.resolve(lookup, queryset)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        installation = application.install(target_id=1)
+    assert not installation_cache.is_missing(lookup)
+    assert installation_cache.resolve(lookup, queryset) == installation
+
+
+@pytest.mark.django_db
+def test_installation_negative_cache_dropped_on_commit(
+    get_integration,
+    get_application,
+    enable_installation_negative_cache,
+    django_capture_on_commit_callbacks,
+):
+    """
+    Lookups found missing while an installation is being saved are dropped once the
+    installation is committed
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    lookup = dict(application=application)
+    installation_cache.set_missing(lookup)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            application.install(target_id=1)
+        # A concurrent request does not see the installation until it is committed
+        installation_cache.set_missing(lookup)
+        assert installation_cache.is_missing(lookup)
+    assert not installation_cache.is_missing(lookup)
+
+
+@pytest.mark.django_db
+def test_installation_negative_cache_shared_backend(
+    get_integration, get_application, enable_installation_negative_cache
+):
+    """
+    Missing lookups are shared between processes through the Django cache
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    lookup = dict(application=application)
+
+    installation_cache.set_missing(lookup)
+    installation_cache.local_missing.clear()
+    assert installation_cache.is_missing(lookup)
+
+    installation_cache.invalidate_missing()
+    assert not installation_cache.is_missing(lookup)
+
+
+@pytest.mark.django_db
+def test_oauth_backend_uses_installation_negative_cache(
+    get_integration,
+    create_access_token,
+    enable_installation_negative_cache,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    """
+    Once a lookup is known to be missing, authenticating fails without querying it again
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    token_str = "token"
+    __, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token=token_str,
+        scope=REQUIRED_SCOPE,
+    )
+    installation.delete()
+    factory = APIRequestFactory()
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    # Only the token is fetched
+    with django_assert_num_queries(1):
+        response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    with django_capture_on_commit_callbacks(execute=True):
+        installation.application.install(target_id=1)
+    response = view(factory.post("", HTTP_AUTHORIZATION=f"Bearer {token_str}"))
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.fixture
+def get_client_integration(mocker, get_integration):
+    def getter():
+        integration = get_integration(is_local=True)
+        mocker.patch.object(integration, "client_class", BaseClient)
+        return integrations.get(integration.name)
+
+    return getter
+
+
+@pytest.fixture
+def enable_client_pool(settings):
+    settings.INTEGRATIONS_CLIENT_POOL_ENABLED = True
+    client_pool.clear()
+    yield
+    client_pool.clear()
+
+
+@pytest.mark.django_db
+def test_client_pool_reuses_clients(get_client_integration, get_application, enable_client_pool):
+    """
+    Contexts of the same installation share the client, unless custom kwargs are given
+    """
+    integration = get_client_integration()
+    installation = get_application(integration=integration).install(target_id=1)
+
+    client = installation.get_context().client
+    installation.refresh_from_db()
+    assert installation.get_context().client is client
+    assert integration.get_client(installation.get_context(), extra=True) is not client
+
+
+@pytest.mark.django_db
+def test_client_pool_evicted_on_save(
+    get_client_integration, get_application, enable_client_pool, django_capture_on_commit_callbacks
+):
+    """
+    Saving an installation drops its pooled clients
+    """
+    integration = get_client_integration()
+    installation = get_application(integration=integration).install(target_id=1)
+
+    client = integration.get_client(installation.get_context())
+    assert len(client_pool.local) == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        installation.save()
+    assert len(client_pool.local) == 0
+    assert integration.get_client(installation.get_context()) is not client
+
+
+@pytest.mark.django_db
+def test_client_pool_idle_timeout(
+    mocker, get_client_integration, get_application, enable_client_pool
+):
+    """
+    Clients idle for longer than the timeout are dropped, using them resets their idle time
+    """
+    monotonic = mocker.patch("drf_integrations.cache.time.monotonic", return_value=0)
+    integration = get_client_integration()
+    installation = get_application(integration=integration).install(target_id=1)
+    timeout = client_pool.local.timeout
+
+    client = integration.get_client(installation.get_context())
+    monotonic.return_value = timeout - 1
+    assert integration.get_client(installation.get_context()) is client
+    monotonic.return_value = 2 * timeout - 2
+    assert integration.get_client(installation.get_context()) is client
+    monotonic.return_value = 3 * timeout
+    assert integration.get_client(installation.get_context()) is not client
+
+
+@pytest.mark.django_db
+def test_client_pool_disabled(get_client_integration, get_application):
+    """
+    Nothing is pooled unless INTEGRATIONS_CLIENT_POOL_ENABLED is set
+    """
+    integration = get_client_integration()
+    installation = get_application(integration=integration).install(target_id=1)
+    context = installation.get_context()
+    assert integration.get_client(context) is not integration.get_client(context)
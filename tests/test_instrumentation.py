@@ -0,0 +1,117 @@
+import pytest
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from drf_integrations.instrumentation import StatsdSink, get_sink, instrument
+from tests.test_auth_backends import REQUIRED_SCOPE, TestOAuthViewset
+
+
+@pytest.fixture
+def records(settings):
+    records = []
+
+    def sink(phase, **kwargs):
+        records.append(dict(phase=phase, **kwargs))
+
+    settings.INTEGRATIONS_INSTRUMENTATION_SINK = sink
+    return records
+
+
+def test_instrument_disabled():
+    """
+    Without sink, instrument returns a shared no-op context manager
+    """
+    assert get_sink() is None
+    with instrument("phase") as phase:
+        phase.integration = "integration"
+    assert instrument("other") is phase
+
+
+@pytest.mark.django_db
+def test_instrument_oauth_backend(get_integration, create_access_token, records):
+    """
+    The token and installation phases are recorded with their integration and queries
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="token",
+        scope=REQUIRED_SCOPE,
+    )
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(APIRequestFactory().post("", HTTP_AUTHORIZATION="Bearer token"))
+    assert response.status_code == status.HTTP_200_OK
+
+    assert [(record["phase"], record["integration"]) for record in records] == [
+        ("token", integration.name),
+        ("installation", integration.name),
+    ]
+    assert all(record["success"] and record["queries"] == 1 for record in records)
+    assert all(record["duration"] >= 0 for record in records)
+
+
+@pytest.mark.django_db
+def test_instrument_records_failures(get_integration, create_access_token, records):
+    """
+    Phases that raise are recorded as failed
+    """
+    integration = get_integration(is_local=True, has_form=False)
+    __, installation = create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="token",
+        scope=REQUIRED_SCOPE,
+    )
+    installation.delete()
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(APIRequestFactory().post("", HTTP_AUTHORIZATION="Bearer token"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert [(record["phase"], record["success"]) for record in records] == [
+        ("token", True),
+        ("installation", False),
+    ]
+
+
+@pytest.mark.django_db
+def test_instrument_sink_errors_are_ignored(
+    settings, mocker, get_integration, create_access_token
+):
+    """
+    A failing sink does not break authentication
+    """
+    settings.INTEGRATIONS_INSTRUMENTATION_SINK = mocker.Mock(side_effect=ValueError)
+    integration = get_integration(is_local=True, has_form=False)
+    create_access_token(
+        target_id=1,
+        application_kwargs=dict(local_integration_name=integration.name),
+        token="token",
+        scope=REQUIRED_SCOPE,
+    )
+    view = TestOAuthViewset.as_view({"post": "create"})
+
+    response = view(APIRequestFactory().post("", HTTP_AUTHORIZATION="Bearer token"))
+    assert response.status_code == status.HTTP_200_OK
+    assert settings.INTEGRATIONS_INSTRUMENTATION_SINK.call_count == 2
+
+
+def test_statsd_sink(settings, mocker):
+    """
+    StatsdSink sends the duration, queries and outcome of every phase
+    """
+    client = mocker.Mock()
+    settings.INTEGRATIONS_INSTRUMENTATION_SINK = StatsdSink(client, prefix="auth")
+
+    with pytest.raises(ValueError):
+        with instrument("signature", "shopify"):
+            raise ValueError()
+
+    client.timing.assert_called_once_with("auth.signature.shopify.duration", mocker.ANY)
+    client.incr.assert_has_calls(
+        [
+            mocker.call("auth.signature.shopify.queries", 0),
+            mocker.call("auth.signature.shopify.failure"),
+        ]
+    )
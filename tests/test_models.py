@@ -1,10 +1,21 @@
+import django
+import pickle
 import pytest
 from _pytest.fixtures import fixture
+from contextlib import nullcontext
+from datetime import timedelta
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import IntegrityError
+from django.utils import timezone
+from io import StringIO
 
-from drf_integrations import models
+from drf_integrations import integrations, models
+from drf_integrations.cache import internal_application_cache, internal_token_cache
+from drf_integrations.managers import ApplicationInstallationQuerySet
+from drf_integrations.scopes import check_scopes
 from tests import factories, integration_samples
 
 pytestmark = pytest.mark.django_db
@@ -71,6 +82,60 @@ def test_sync_with_integration_registry(get_integration, clear_integrations):
     assert app.internal_integration_name != "other"
 
 
+def test_sync_with_integration_registry_queries(
+    get_integration, clear_integrations, django_assert_num_queries, django_assert_max_num_queries
+):
+    """
+    Synchronizing reads the applications once, writes each kind of change in a single
+    query, and does not write anything if the applications are up to date
+    """
+    get_integration(is_local=False)
+    get_integration(is_local=False, has_form=True)
+    factories.ApplicationFactory(internal_integration_name="other", is_approved=True)
+
+    result = models.Application.objects.sync_with_integration_registry(dry_run=True)
+    assert sorted(result.created) == sorted(
+        [
+            integration_samples.TestInternalIntegration.name,
+            integration_samples.TestInternalWithFormIntegration.name,
+        ]
+    )
+    assert result.unapproved == ["other"]
+    assert models.Application.objects.count() == 1
+
+    with django_assert_max_num_queries(5):
+        result = models.Application.objects.sync_with_integration_registry()
+    assert len(result.created) == 2
+    assert models.Application.objects.filter(is_approved=True).count() == 2
+
+    models.Application.objects.filter(
+        internal_integration_name=integration_samples.TestInternalIntegration.name
+    ).update(name="Renamed")
+    result = models.Application.objects.sync_with_integration_registry()
+    assert result.updated == [integration_samples.TestInternalIntegration.name]
+    assert not result.created and not result.unapproved
+
+    with django_assert_num_queries(1):
+        assert not models.Application.objects.sync_with_integration_registry().has_changes
+
+
+def test_syncregistry_command(get_integration, clear_integrations):
+    """
+    The command reports the changes, and does not save them on a dry run
+    """
+    get_integration(is_local=False)
+
+    stdout = StringIO()
+    call_command("syncregistry", "--dry-run", stdout=stdout)
+    assert f"Create {integration_samples.TestInternalIntegration.name}" in stdout.getvalue()
+    assert models.Application.objects.count() == 0
+
+    stdout = StringIO()
+    call_command("syncregistry", stdout=stdout)
+    assert "successfully synchronized" in stdout.getvalue()
+    assert models.Application.objects.count() == 1
+
+
 def test_get_integration_instance(get_integration):
     """
     .get_by_internal_integration() correctly creates (if needed) an Application for
@@ -93,6 +158,69 @@ def test_get_integration_instance(get_integration):
     assert integration_samples.TestInternalIntegration == internal_integration
 
 
+def test_get_by_internal_integration_cached(get_integration, django_assert_num_queries):
+    """
+    .get_by_internal_integration() only writes when the Application is missing or
+    outdated, and is then read from the per-process cache until the Application is saved
+    """
+    integration = get_integration(is_local=False)
+    app = factories.ApplicationFactory(
+        internal_integration_name=integration.name, is_approved=False
+    )
+
+    # Outdated: it is updated, and only cached once committed
+    models.Application.objects.get_by_internal_integration(integration)
+    app.refresh_from_db()
+    assert app.is_approved
+
+    # Up to date: it is read and cached
+    with django_assert_num_queries(1):
+        assert models.Application.objects.get_by_internal_integration(integration) == app
+    with django_assert_num_queries(0):
+        cached = models.Application.objects.get_by_internal_integration(integration)
+    assert cached == app
+    cached.name = "Changed"
+    assert models.Application.objects.get_by_internal_integration(integration).name == app.name
+
+    app.save()
+    with django_assert_num_queries(1):
+        models.Application.objects.get_by_internal_integration(integration)
+
+
+def test_get_by_internal_integration_cached_on_commit(
+    get_integration, django_capture_on_commit_callbacks, django_assert_num_queries
+):
+    """
+    A newly created Application is only cached once the transaction is committed
+    """
+    integration = get_integration(is_local=False)
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        app = models.Application.objects.get_by_internal_integration(integration)
+    assert internal_application_cache.get("default", integration.name) is None
+
+    for callback in callbacks:
+        callback()
+    with django_assert_num_queries(0):
+        assert models.Application.objects.get_by_internal_integration(integration) == app
+
+
+def test_get_by_internal_integration_cached_for_replicas(
+    get_integration, mocker, django_capture_on_commit_callbacks, django_assert_num_queries
+):
+    """
+    The cached Application is shared by the reads sent to any replica
+    """
+    integration = get_integration(is_local=False)
+    with django_capture_on_commit_callbacks(execute=True):
+        app = models.Application.objects.get_by_internal_integration(integration)
+    assert internal_application_cache.get("default", integration.name) == app
+
+    mocker.patch("django.db.router.db_for_read", return_value="replica")
+    assert models.Application.objects.db == "replica"
+    with django_assert_num_queries(0):
+        assert models.Application.objects.get_by_internal_integration(integration) == app
+
+
 def test_get_integration_instance_local_error(get_integration):
     """
     .get_by_internal_integration() should fail for local integrations
@@ -208,3 +336,331 @@ def test_install_check_config_validates(get_integration, get_application, is_loc
     assert models.ApplicationInstallation.objects.get() == installation
     assert installation.get_config() == form_values
     assert installation.deleted_at is None
+
+
+def test_install_many_uninstall_many(
+    get_integration, get_application, django_assert_max_num_queries
+):
+    """
+    An internal integration can be installed to and uninstalled from many targets at
+    once, with a number of queries that does not depend on the number of targets
+    (from Django 4.1 on, for installing)
+    """
+    application = get_application(integration=get_integration(is_local=False))
+    application.install(target_id=1, config=dict(old="value"))
+    application.uninstall(target_id=1)
+
+    # Before Django 4.1, the installations are upserted one by one
+    upserts_in_bulk = django.VERSION >= (4, 1)
+    with django_assert_max_num_queries(6) if upserts_in_bulk else nullcontext():
+        installations = application.install_many([3, 1, 2, 3], config=dict(key="value"))
+    assert [installation.target_id for installation in installations] == [3, 1, 2]
+    assert models.ApplicationInstallation.objects.active().count() == 3
+    for installation in models.ApplicationInstallation.objects.all():
+        assert installation.config == dict(key="value")
+
+    with django_assert_max_num_queries(4):
+        uninstalled = application.uninstall_many([2, 3, 4])
+    assert sorted(installation.target_id for installation in uninstalled) == [2, 3]
+    assert all(installation.deleted_at for installation in uninstalled)
+    assert list(
+        models.ApplicationInstallation.objects.active().values_list("target_id", flat=True)
+    ) == [1]
+
+
+def test_install_many_before_django_41(get_integration, get_application, mocker):
+    """
+    Without bulk upserts, installations are upserted one by one
+    """
+    mocker.patch("django.VERSION", (4, 0, 0, "final", 0))
+    bulk_create = mocker.spy(ApplicationInstallationQuerySet, "bulk_create")
+    application = get_application(integration=get_integration(is_local=False))
+    application.install(target_id=1, config=dict(old="value"))
+    application.uninstall(target_id=1)
+
+    installations = application.install_many([2, 1], config=dict(key="value"))
+    assert [installation.target_id for installation in installations] == [2, 1]
+    assert all(installation.config == dict(key="value") for installation in installations)
+    assert models.ApplicationInstallation.objects.active().count() == 2
+    bulk_create.assert_not_called()
+
+
+def test_install_many_check_config(get_integration, get_application, mocker):
+    """
+    The config is validated once, and nothing is installed if it is not valid
+    """
+    integration = get_integration(is_local=False, has_form=True)
+    application = get_application(integration=integration)
+    check_config = mocker.spy(integration, "check_config")
+
+    application.install_many([1, 2, 3], config=dict(extra_field="value"))
+    assert check_config.call_count == 1
+
+    with pytest.raises(ValidationError):
+        application.install_many([4, 5], config=dict(extra_field="value too long"))
+    assert models.ApplicationInstallation.objects.count() == 3
+
+
+def test_install_many_local(get_integration, get_application):
+    """
+    A local integration can only be installed to one target
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    with pytest.raises(ValidationError):
+        application.install_many([1, 2])
+
+    assert [installation.target_id for installation in application.install_many([1])] == [1]
+
+
+def test_queryset_soft_delete_restore(get_integration, get_application, mocker):
+    """
+    Deleting a queryset soft-deletes the installations in bulk, which can be restored,
+    and sends the bulk signals
+    """
+    from drf_integrations.signals import installations_deleted, installations_restored
+
+    application = get_application(integration=get_integration(is_local=False))
+    installations = application.install_many([1, 2, 3])
+    deleted_receiver, restored_receiver = mocker.Mock(), mocker.Mock()
+    installations_deleted.connect(deleted_receiver)
+    installations_restored.connect(restored_receiver)
+    queryset = models.ApplicationInstallation.objects.filter(target_id__in=[1, 2])
+
+    try:
+        assert queryset.delete() == (2, {"drf_integrations.ApplicationInstallation": 2})
+        assert models.ApplicationInstallation.objects.count() == 3
+        assert list(
+            models.ApplicationInstallation.objects.active().values_list("target_id", flat=True)
+        ) == [3]
+        deleted_receiver.assert_called_once()
+        assert sorted(deleted_receiver.call_args.kwargs["pks"]) == sorted(
+            installation.pk for installation in installations[:2]
+        )
+        assert queryset.delete() == (0, {"drf_integrations.ApplicationInstallation": 0})
+        assert deleted_receiver.call_count == 1
+
+        assert models.ApplicationInstallation.objects.restore() == 2
+        assert models.ApplicationInstallation.objects.active().count() == 3
+        restored_receiver.assert_called_once()
+    finally:
+        installations_deleted.disconnect(deleted_receiver)
+        installations_restored.disconnect(restored_receiver)
+
+    assert queryset.hard_delete()[0] == 2
+    assert models.ApplicationInstallation.objects.count() == 1
+
+
+@pytest.fixture
+def enable_internal_token_cache(settings):
+    settings.INTEGRATIONS_INTERNAL_TOKEN_CACHE_ENABLED = True
+    settings.INTEGRATIONS_INTERNAL_TOKEN_BACKGROUND_REFRESH = False
+    internal_token_cache.clear()
+    cache.clear()
+    yield
+    internal_token_cache.clear()
+    cache.clear()
+
+
+def test_create_for_internal_integration(get_integration, get_application):
+    """
+    .create_for_internal_integration() reuses a valid internal token if there is one
+    """
+    application = get_application(integration=get_integration(is_local=False))
+    token, created = models.AccessToken.objects.create_for_internal_integration(
+        application=application
+    )
+    assert created
+    assert token.is_internal_only
+    assert token.application == application
+
+    same_token, created = models.AccessToken.objects.create_for_internal_integration(
+        application=application
+    )
+    assert not created
+    assert same_token == token
+
+
+def test_create_for_internal_integration_local_error(get_integration, get_application):
+    """
+    .create_for_internal_integration() should fail for local integrations
+    """
+    application = get_application(integration=get_integration(is_local=True))
+    with pytest.raises(ValueError):
+        models.AccessToken.objects.create_for_internal_integration(application=application)
+
+
+def test_create_for_internal_integration_cached(
+    get_integration,
+    get_application,
+    enable_internal_token_cache,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    """
+    With the internal token cache enabled, a valid token is returned without queries,
+    once the transaction that created it is committed
+    """
+    application = get_application(integration=get_integration(is_local=False))
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        token, __ = models.AccessToken.objects.create_for_internal_integration(
+            application=application
+        )
+    assert internal_token_cache.get(application.pk, token.scope) is None
+
+    for callback in callbacks:
+        callback()
+
+    with django_assert_num_queries(0):
+        cached_token, created = models.AccessToken.objects.create_for_internal_integration(
+            application=application
+        )
+    assert not created
+    assert cached_token == token
+
+
+def test_create_for_internal_integration_refresh(
+    get_integration,
+    get_application,
+    enable_internal_token_cache,
+    django_capture_on_commit_callbacks,
+):
+    """
+    A cached token about to expire is still returned, but a new one replaces it
+    """
+    application = get_application(integration=get_integration(is_local=False))
+    token, __ = models.AccessToken.objects.create_for_internal_integration(application=application)
+    token.expires = timezone.now() + timedelta(minutes=5)
+    token.save()
+    internal_token_cache.set(token)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        stale_token, __ = models.AccessToken.objects.create_for_internal_integration(
+            application=application
+        )
+    assert stale_token == token
+
+    new_token, __ = models.AccessToken.objects.create_for_internal_integration(
+        application=application
+    )
+    assert new_token != token
+    assert new_token.expires > token.expires
+    assert models.AccessToken.objects.filter(is_internal_only=True).count() == 2
+
+
+def test_get_integration_instance_memoized(get_integration, get_application, mocker):
+    """
+    .get_integration_instance() only looks up the registry again if the integration
+    name changes
+    """
+    internal_integration = get_integration(is_local=False)
+    local_integration = get_integration(is_local=True)
+    app = get_application(integration=internal_integration)
+    registry_get = mocker.spy(integrations, "get")
+
+    assert app.get_integration_instance() == internal_integration
+    assert app.get_integration_instance(internal_integration) == internal_integration
+    assert registry_get.call_count == 1
+    with pytest.raises(ValueError):
+        app.get_integration_instance(local_integration)
+
+    app.internal_integration_name = None
+    app.local_integration_name = local_integration.name
+    assert app.get_integration_instance() == local_integration
+    assert registry_get.call_count == 2
+
+
+def test_get_context_memoized(get_integration, get_application):
+    """
+    .get_context() returns the same context until the installation is saved or refreshed
+    """
+    integration = get_integration(is_local=False, has_form=True)
+    app = get_application(integration=integration)
+    installation = app.install(target_id=1, config=dict(extra_field="value"))
+
+    context = installation.get_context()
+    assert installation.get_context() is context
+    assert context.integration == integration
+    assert context.config == dict(extra_field="value")
+
+    installation.config = dict(extra_field="other")
+    installation.save()
+    new_context = installation.get_context()
+    assert new_context is not context
+    assert new_context.config == dict(extra_field="other")
+
+    installation.refresh_from_db()
+    assert installation.get_context() is not new_context
+
+
+def test_installation_pickle_drops_context(get_integration, get_application):
+    """
+    The memoized context and integration are not pickled along with the installation
+    """
+    app = get_application(integration=get_integration(is_local=False))
+    installation = app.install(target_id=1)
+    installation.get_context().integration
+
+    restored = pickle.loads(pickle.dumps(installation))
+    assert "_context" not in restored.__dict__
+    assert "_integration_instance" not in restored.application.__dict__
+    assert restored.get_context() == installation.get_context()
+
+
+def test_valid_scopes_access(settings):
+    """
+    Only the allowed scopes known to the scopes backend are returned, with their description
+    """
+    settings.OAUTH2_PROVIDER = dict(SCOPES={"read": "Read", "write": "Write", "admin": "Admin"})
+    application = factories.ApplicationFactory.build(allowed_scopes="write read unknown")
+    assert application.valid_scopes_access() == {"read": "Read", "write": "Write"}
+    assert application.has_scopes(["read", "write"])
+    assert not application.has_scopes(["read", "admin"])
+
+    application.allowed_scopes = None
+    assert application.valid_scopes_access() == {}
+    assert application.allowed_scope_set == frozenset()
+
+
+def test_check_scopes(django_assert_num_queries):
+    """
+    Scopes are checked for many applications at once, in memory or with a single query
+    """
+    first = factories.ApplicationFactory(allowed_scopes="read write")
+    second = factories.ApplicationFactory(allowed_scopes="read")
+    third = factories.ApplicationFactory(allowed_scopes=None)
+    expected = {
+        first.pk: frozenset(["read", "write"]),
+        second.pk: frozenset(["read"]),
+        third.pk: frozenset(),
+    }
+
+    assert check_scopes([first, second, third], ["read", "write"]) == expected
+    with django_assert_num_queries(1):
+        assert models.Application.objects.all().check_scopes(["read", "write"]) == expected
+
+
+def test_parsed_redirect_uris(mocker):
+    """
+    Redirect URIs are parsed once, until the field is assigned again
+    """
+    application = factories.ApplicationFactory.build(
+        redirect_uris="https://example.com/callback?a=1 myapp://callback"
+    )
+    urlparse = mocker.spy(models.urllib.parse, "urlparse")
+
+    assert [(uri.scheme, uri.hostname, uri.path) for uri in application.parsed_redirect_uris] == [
+        ("https", "example.com", "/callback"),
+        ("myapp", "callback", ""),
+    ]
+    assert sorted(application.get_allowed_schemes()) == ["https", "myapp"]
+    assert application.default_redirect_uri == "https://example.com/callback?a=1"
+    assert urlparse.call_count == 2
+
+    assert application.redirect_uri_allowed("https://example.com/callback?a=1&b=2")
+    assert not application.redirect_uri_allowed("https://example.com/callback")
+    assert not application.redirect_uri_allowed("https://example.com/other?a=1")
+    assert urlparse.call_count == 5
+
+    application.redirect_uris = "http://localhost/"
+    assert application.get_allowed_schemes() == ["http"]
+    assert application.default_redirect_uri == "http://localhost/"
@@ -0,0 +1,76 @@
+import django
+import pytest
+from django.core.management import call_command
+from io import StringIO
+
+from drf_integrations import integrations, operations
+from tests import integration_samples
+
+
+class IndexedForm(integration_samples.TestForm):
+    indexed_fields = ("extra_field", "not_in_form")
+
+
+class IntegrationWithIndexedFields(integration_samples.TestInternalWithFormIntegration):
+    name = "test_internal_form_indexed_fields"
+    config_form_class = IndexedForm
+
+
+@pytest.mark.skipif(django.VERSION < (3, 2), reason="Expression indexes require Django 3.2+")
+def test_add_config_key_index():
+    """
+    The index covers the config key and the application of active installations
+    """
+    operation = operations.AddConfigKeyIndex(
+        model="drf_integrations.ApplicationInstallation", key="extra_field"
+    )
+    index = operation.get_index()
+    assert index.name == operation.index_name
+    assert len(index.name) <= 30
+    assert len(index.expressions) == 2
+    assert index.condition is not None
+    assert operation.deconstruct() == (
+        "AddConfigKeyIndex",
+        (),
+        dict(model="drf_integrations.ApplicationInstallation", key="extra_field"),
+    )
+
+    other_operation = operations.AddConfigKeyIndex(
+        model="drf_integrations.ApplicationInstallation", key="other_field"
+    )
+    assert other_operation.index_name != operation.index_name
+
+
+def test_makeconfigindexes_dry_run():
+    """
+    The command creates an index per field declared in `indexed_fields` of the config form, and the
+    GIN index only when asked to
+    """
+    integrations.default_registry.integrations = {}
+    integrations.register(IntegrationWithIndexedFields)
+
+    stdout, stderr = StringIO(), StringIO()
+    call_command("makeconfigindexes", "--dry-run", stdout=stdout, stderr=stderr)
+    output = stdout.getvalue()
+    assert "on config key extra_field" in output
+    assert "not_in_form" not in output
+    assert "GIN" not in output
+    assert "not_in_form" in stderr.getvalue()
+
+    stdout = StringIO()
+    call_command("makeconfigindexes", "--dry-run", "--gin", stdout=stdout, stderr=StringIO())
+    assert "GIN index" in stdout.getvalue()
+
+
+@pytest.mark.parametrize("gin", [True, False])
+def test_makeconfigindexes_no_changes(gin):
+    """
+    Without indexed fields there is nothing to index
+    """
+    integrations.default_registry.integrations = {}
+    integrations.register(integration_samples.TestInternalWithFormIntegration)
+
+    stdout = StringIO()
+    args = ["--dry-run", "--gin"] if gin else ["--dry-run"]
+    call_command("makeconfigindexes", *args, stdout=stdout)
+    assert ("No changes detected" in stdout.getvalue()) is not gin
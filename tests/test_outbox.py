@@ -0,0 +1,144 @@
+import datetime
+import pytest
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from io import StringIO
+
+from drf_integrations.models import OutboxEvent
+from tests.integration_samples import TestLocalIntegration
+
+
+@pytest.fixture
+def dispatch_events(mocker):
+    return mocker.patch.object(TestLocalIntegration, "dispatch_events")
+
+
+@pytest.fixture
+def get_installation(get_integration, get_application):
+    integration = get_integration(is_local=True)
+
+    def getter(target_id: int = 1):
+        return get_application(integration=integration).install(target_id=target_id)
+
+    return getter
+
+
+@pytest.mark.django_db
+def test_enqueue_event_in_transaction(get_installation):
+    """
+    Events are only stored if the transaction that enqueues them commits
+    """
+    installation = get_installation()
+    context = installation.get_context()
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            context.integration.enqueue_event(context, "rolled_back")
+            raise RuntimeError()
+
+    event = context.integration.enqueue_event(context, "committed", dict(a=1))
+    assert list(OutboxEvent.objects.values_list("event_type", flat=True)) == ["committed"]
+    assert event.installation == installation
+    assert event.payload == dict(a=1)
+
+
+@pytest.mark.django_db
+def test_dispatch_batches_per_installation(get_installation, dispatch_events):
+    """
+    Pending events are dispatched in a batch per installation and marked as processed
+    """
+    installations = [get_installation(target_id=1), get_installation(target_id=2)]
+    for installation in installations + installations:
+        OutboxEvent.objects.enqueue(installation=installation, event_type="event")
+
+    assert OutboxEvent.objects.dispatch(batch_size=10) == (4, 0)
+    assert dispatch_events.call_count == 2
+    dispatched = [
+        (context.installation, [event.installation_id for event in events])
+        for context, events in (call.args for call in dispatch_events.call_args_list)
+    ]
+    assert dispatched == [(installation, [installation.pk] * 2) for installation in installations]
+    assert not OutboxEvent.objects.filter(processed_at__isnull=True).exists()
+    assert OutboxEvent.objects.dispatch(batch_size=10) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_dispatch_respects_batch_size(get_installation, dispatch_events):
+    """
+    Only up to batch_size events are claimed at a time, oldest first
+    """
+    installation = get_installation()
+    events = [
+        OutboxEvent.objects.enqueue(installation=installation, event_type="event")
+        for __ in range(3)
+    ]
+
+    assert OutboxEvent.objects.dispatch(batch_size=2) == (2, 0)
+    assert list(OutboxEvent.objects.pending()) == events[2:]
+
+
+@pytest.mark.django_db
+def test_dispatch_retries_with_backoff(settings, get_installation, dispatch_events):
+    """
+    Failed events are retried with exponential backoff until the max attempts
+    """
+    settings.INTEGRATIONS_OUTBOX_MAX_ATTEMPTS = 3
+    settings.INTEGRATIONS_OUTBOX_RETRY_BACKOFF = 10
+    dispatch_events.side_effect = ConnectionError("vendor down")
+    event = OutboxEvent.objects.enqueue(installation=get_installation(), event_type="event")
+
+    for attempt, backoff in [(1, 10), (2, 20)]:
+        before = timezone.now()
+        assert OutboxEvent.objects.dispatch() == (0, 1)
+        event.refresh_from_db()
+        assert event.attempts == attempt
+        assert "vendor down" in event.last_error
+        assert event.available_at >= before + datetime.timedelta(seconds=backoff)
+        assert event.failed_at is None
+        assert OutboxEvent.objects.dispatch() == (0, 0)
+        OutboxEvent.objects.update(available_at=timezone.now())
+
+    assert OutboxEvent.objects.dispatch() == (0, 1)
+    event.refresh_from_db()
+    assert event.failed_at is not None
+    assert not OutboxEvent.objects.pending().exists()
+
+
+@pytest.mark.django_db
+def test_dispatch_skips_claimed_events(get_installation, dispatch_events):
+    """
+    Claimed events are leased, so concurrent dispatchers do not pick them up
+    """
+    OutboxEvent.objects.enqueue(installation=get_installation(), event_type="event")
+
+    assert len(OutboxEvent.objects.claim(batch_size=10)) == 1
+    assert OutboxEvent.objects.claim(batch_size=10) == []
+
+
+@pytest.mark.django_db
+def test_dispatch_inactive_installation(get_installation, dispatch_events):
+    """
+    Events of uninstalled installations are not dispatched
+    """
+    installation = get_installation()
+    OutboxEvent.objects.enqueue(installation=installation, event_type="event")
+    installation.delete()
+
+    assert OutboxEvent.objects.dispatch() == (0, 1)
+    dispatch_events.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_dispatchoutbox_command(get_installation, dispatch_events):
+    """
+    The command drains all the pending events in batches
+    """
+    installation = get_installation()
+    for __ in range(3):
+        OutboxEvent.objects.enqueue(installation=installation, event_type="event")
+
+    stdout = StringIO()
+    call_command("dispatchoutbox", "--batch-size", "2", stdout=stdout)
+    assert "3 processed, 0 failed" in stdout.getvalue()
+    assert dispatch_events.call_count == 2
@@ -0,0 +1,164 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils import timezone
+
+from drf_integrations import models, routers
+from drf_integrations.cache import recent_writes
+
+
+@pytest.fixture
+def replicas(settings):
+    # Tests have a single DB, which is used as both the primary and the replica
+    settings.INTEGRATIONS_READ_REPLICAS = ["default"]
+    token = routers._primary_until.set(0.0)
+    yield settings.INTEGRATIONS_READ_REPLICAS
+    routers._primary_until.reset(token)
+    recent_writes.clear()
+    cache.clear()
+
+
+@pytest.fixture
+def installation(get_integration, get_application, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        return get_application(integration=get_integration(is_local=True)).install(target_id=1)
+
+
+def test_router_db_for_read(settings, replicas):
+    """
+    Reads of drf_integrations models go to a replica, unless pinned to the primary
+    """
+    router = routers.ReplicaRouter()
+    settings.INTEGRATIONS_READ_REPLICAS = []
+    assert router.db_for_read(models.Application) is None
+
+    settings.INTEGRATIONS_READ_REPLICAS = ["replica"]
+    assert router.db_for_read(models.Application) == "replica"
+    assert router.db_for_read(models.ApplicationInstallation) == "replica"
+    assert router.db_for_read(models.AccessToken) == "replica"
+    assert router.db_for_read(User) is None
+    assert router.db_for_read(models.Grant) is None
+    assert router.db_for_read(models.RefreshToken) is None
+    assert router.db_for_read(models.OutboxEvent) is None
+    assert router.db_for_read(models.WebhookEvent) is None
+
+    instance = models.Application()
+    instance._state.db = "other"
+    assert router.db_for_read(models.ApplicationInstallation, instance=instance) == "other"
+
+    with routers.use_primary():
+        assert router.db_for_read(models.Application) == "default"
+    assert router.db_for_read(models.Application) == "replica"
+
+
+def test_router_allow_relation(settings, replicas):
+    """
+    Objects of drf_integrations models can be related across the primary and replicas
+    """
+    settings.INTEGRATIONS_READ_REPLICAS = ["replica"]
+    router = routers.ReplicaRouter()
+    application = models.Application()
+    application._state.db = "replica"
+    installation = models.ApplicationInstallation()
+    installation._state.db = "default"
+    assert router.allow_relation(application, installation)
+
+    grant = models.Grant()
+    grant._state.db = "default"
+    assert router.allow_relation(grant, application)
+    assert router.allow_relation(grant, User()) is None
+
+    installation._state.db = "other"
+    assert router.allow_relation(application, installation) is None
+
+
+@pytest.mark.django_db
+def test_writes_stick_to_primary(replicas, installation):
+    """
+    Saving an installation pins the context, and its pk and target, to the primary
+    """
+    assert routers.is_pinned()
+    assert recent_writes.has_installation(installation)
+    assert recent_writes.has_target(1)
+    assert not recent_writes.has_target(2)
+
+    # Writes made by other processes are found in the shared cache
+    recent_writes.local.clear()
+    assert recent_writes.has_target(1)
+
+
+@pytest.mark.django_db
+def test_reads_before_writes_on_primary(get_integration, mocker):
+    """
+    Reads that writes depend on are made on the primary, even when reads go to replicas
+    """
+    integration = get_integration(is_local=False)
+    # Any read sent to the replica fails, as there is no such DB
+    mocker.patch("django.db.router.db_for_read", return_value="replica")
+
+    assert models.Application.objects.sync_with_integration_registry().created
+    assert not models.Application.objects.sync_with_integration_registry().has_changes
+
+    application = models.Application.objects.get_by_internal_integration(integration)
+    token, created = models.AccessToken.objects.create_for_internal_integration(
+        application=application
+    )
+    assert created
+    assert models.AccessToken.objects._get_or_create_internal_token(
+        application=application, scope=token.scope, valid_after=timezone.now()
+    ) == (token, False)
+
+
+@pytest.mark.django_db
+def test_get_from_replica(settings, installation, replicas, django_assert_num_queries):
+    """
+    Misses and installations written recently are read again from the primary
+    """
+    queryset = models.ApplicationInstallation.objects.active()
+
+    with django_assert_num_queries(1):
+        assert routers.get_from_replica(queryset, pk=installation.pk) == installation
+    with django_assert_num_queries(2):
+        with pytest.raises(models.ApplicationInstallation.DoesNotExist):
+            routers.get_from_replica(queryset, pk=0)
+
+    recent_writes.add_many([installation])
+    with django_assert_num_queries(2):
+        assert routers.get_from_replica(queryset, pk=installation.pk) == installation
+
+    settings.INTEGRATIONS_READ_REPLICAS = []
+    with django_assert_num_queries(1):
+        with pytest.raises(models.ApplicationInstallation.DoesNotExist):
+            routers.get_from_replica(queryset, pk=0)
+
+
+@pytest.mark.django_db
+def test_stickiness_middleware(replicas, installation):
+    """
+    Clients that wrote installations keep reading from the primary for a while
+    """
+    pinned = []
+
+    def view(request):
+        pinned.append(routers.is_pinned())
+        if request.GET.get("write"):
+            installation.save()
+        return HttpResponse()
+
+    middleware = routers.ReplicaStickinessMiddleware(view)
+    factory = RequestFactory()
+    cookie_name = middleware.cookie_name
+
+    response = middleware(factory.get("/"))
+    assert cookie_name not in response.cookies
+
+    response = middleware(factory.get("/", dict(write=1)))
+    assert response.cookies[cookie_name]["max-age"] == 5
+
+    request = factory.get("/")
+    request.COOKIES[cookie_name] = "1"
+    response = middleware(request)
+    assert cookie_name not in response.cookies
+    assert pinned == [False, False, True]
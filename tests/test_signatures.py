@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import hmac
+import json
+import pytest
+import tempfile
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from drf_integrations import integrations, models
+from drf_integrations.auth_backends import IntegrationSignatureAuthentication
+from drf_integrations.exceptions import RequestBodyTooLarge
+from drf_integrations.integrations.base import BaseIntegration
+from drf_integrations.signatures import (
+    BodySignatureVerifier,
+    QueryStringSignatureVerifier,
+    StreamingBodySignatureVerifier,
+)
+from example.drf_integrations_example.integrations.shopify import ShopifyProxySignatureVerifier
+
+SECRET = "secret"
+
+factory = APIRequestFactory()
+
+
+class WebhookSignatureVerifier(BodySignatureVerifier):
+    signature_header = "X-Signature"
+    encoding = "base64"
+
+
+class SignedIntegration(BaseIntegration):
+    name = "test_signed"
+    is_local = False
+    lookup_keys = ("account",)
+    signature_verifier = WebhookSignatureVerifier()
+
+    @classmethod
+    def get_installation_lookup_from_request(cls, request, **kwargs):
+        return cls.get_installation_lookup_from_config_values(
+            account=request.headers.get("X-Account")
+        )
+
+
+class SignedAuthentication(IntegrationSignatureAuthentication):
+    integration_class = SignedIntegration
+
+
+def sign(message: bytes, secret: str = SECRET) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), message, hashlib.sha256).digest()).decode()
+
+
+@pytest.fixture
+def installation():
+    integrations.register(SignedIntegration)
+    application = models.Application.objects.get_by_internal_integration(SignedIntegration)
+    return application.install(target_id=1, config=dict(account="acme", shared_secret=SECRET))
+
+
+def test_query_string_signature_verifier(mocker):
+    """
+    Query params are signed sorted, and the HMAC is keyed once per installation and secret
+    """
+    verifier = QueryStringSignatureVerifier()
+    installation = models.ApplicationInstallation(pk=1, config=dict(shared_secret=SECRET))
+    signature = hmac.new(SECRET.encode(), b"a=1,2&b=3", hashlib.sha256).hexdigest()
+    new_hmac = mocker.spy(hmac, "new")
+
+    request = Request(factory.get("/", dict(b="3", a=["2", "1"], signature=signature)))
+    assert verifier.verify(request, installation)
+    assert verifier.verify(request, installation)
+    assert new_hmac.call_count == 1
+
+    request = Request(factory.get("/", dict(b="4", a=["2", "1"], signature=signature)))
+    assert not verifier.verify(request, installation)
+
+    installation.config = dict(shared_secret="other")
+    request = Request(factory.get("/", dict(b="3", a=["2", "1"], signature=signature)))
+    assert not verifier.verify(request, installation)
+    assert new_hmac.call_count == 2
+
+
+def test_shopify_proxy_signature_verifier():
+    """
+    App proxy requests are verified as Shopify signs them, with its documented example
+    """
+    verifier = ShopifyProxySignatureVerifier()
+    installation = models.ApplicationInstallation(pk=1, config=dict(shared_secret="hush"))
+    params = dict(
+        extra=["1", "2"],
+        shop="shop-name.myshopify.com",
+        path_prefix="/apps/awesome_reviews",
+        timestamp="1317327555",
+        signature="a9718877bea71c2484f91608a7eaea1532bdf71f5c56825065fa4ccabe549ef3",
+    )
+    assert verifier.verify(Request(factory.get("/", params)), installation)
+
+    params["timestamp"] = "1317327556"
+    assert not verifier.verify(Request(factory.get("/", params)), installation)
+
+
+def test_body_signature_verifier_chunks():
+    """
+    The signature of a message given in chunks is the one of the whole message
+    """
+    verifier = WebhookSignatureVerifier()
+    installation = models.ApplicationInstallation(pk=1, config=dict(shared_secret=SECRET))
+    assert verifier.compute(installation, [b"a" * 10, b"b" * 10]) == sign(b"a" * 10 + b"b" * 10)
+    assert verifier.compute(models.ApplicationInstallation(pk=2, config={}), [b""]) is None
+
+
+@pytest.mark.django_db
+def test_signature_authentication(installation):
+    """
+    Requests signed with the secret of the installation are authenticated
+    """
+    body = b'{"id": 1}'
+    request = Request(
+        factory.post(
+            "/",
+            data=body,
+            content_type="application/json",
+            HTTP_X_ACCOUNT="acme",
+            HTTP_X_SIGNATURE=sign(body),
+        )
+    )
+    user, token = SignedAuthentication().authenticate(request)
+    assert user.is_anonymous
+    assert token.application == installation.application
+    assert request.auth_context.installation == installation
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "headers",
+    [
+        dict(HTTP_X_ACCOUNT="acme", HTTP_X_SIGNATURE=sign(b"other")),
+        dict(HTTP_X_ACCOUNT="unknown", HTTP_X_SIGNATURE=sign(b"{}")),
+        dict(HTTP_X_ACCOUNT="acme"),
+    ],
+)
+def test_signature_authentication_fails(installation, headers):
+    """
+    Requests without a valid signature for a known installation are not authenticated
+    """
+    request = Request(factory.post("/", data=b"{}", content_type="application/json", **headers))
+    assert SignedAuthentication().authenticate(request) is None
+    assert not hasattr(request, "auth_context")
+
+
+class StreamingWebhookSignatureVerifier(StreamingBodySignatureVerifier):
+    signature_header = "X-Signature"
+    encoding = "base64"
+    chunk_size = 16
+    spool_max_memory = 64
+    max_body_size = 1024
+
+
+def test_streaming_body_signature_verifier(mocker):
+    """
+    The body is hashed while spooled to a file, which the parsers then read it from
+    """
+    verifier = StreamingWebhookSignatureVerifier()
+    installation = models.ApplicationInstallation(pk=1, config=dict(shared_secret=SECRET))
+    body = json.dumps(dict(items=list(range(100)))).encode()
+    spooled_file = mocker.spy(tempfile, "SpooledTemporaryFile")
+
+    request = Request(
+        factory.post("/", data=body, content_type="application/json", HTTP_X_SIGNATURE=sign(body)),
+        parsers=[JSONParser()],
+    )
+    assert verifier.verify(request, installation)
+    buffer = spooled_file.spy_return
+    assert buffer._rolled
+    assert request.data == dict(items=list(range(100)))
+
+    request = Request(
+        factory.post("/", data=body, content_type="application/json", HTTP_X_SIGNATURE=sign(b"")),
+        parsers=[JSONParser()],
+    )
+    assert not verifier.verify(request, installation)
+    assert request.data == dict(items=list(range(100)))
+
+
+def test_streaming_body_signature_verifier_too_large():
+    """
+    Bodies over the maximum size are rejected
+    """
+    verifier = StreamingWebhookSignatureVerifier()
+    installation = models.ApplicationInstallation(pk=1, config=dict(shared_secret=SECRET))
+    body = b"a" * 2048
+
+    request = Request(
+        factory.post("/", data=body, content_type="text/plain", HTTP_X_SIGNATURE="a")
+    )
+    with pytest.raises(RequestBodyTooLarge):
+        verifier.verify(request, installation)
+
+    request = Request(
+        factory.post("/", data=body, content_type="text/plain", HTTP_X_SIGNATURE="a")
+    )
+    request._request.META["CONTENT_LENGTH"] = "10"
+    with pytest.raises(RequestBodyTooLarge):
+        verifier.verify(request, installation)
+
+
+def test_streaming_body_signature_verifier_body_read():
+    """
+    Bodies already read are verified from memory
+    """
+    verifier = StreamingWebhookSignatureVerifier()
+    installation = models.ApplicationInstallation(pk=1, config=dict(shared_secret=SECRET))
+    request = Request(
+        factory.post(
+            "/", data=b"{}", content_type="application/json", HTTP_X_SIGNATURE=sign(b"{}")
+        )
+    )
+    assert request.body == b"{}"
+    assert verifier.verify(request, installation)
@@ -0,0 +1,148 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from rest_framework import status
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.test import APIRequestFactory
+
+from drf_integrations.cache import BloomFilter, webhook_delivery_cache
+from drf_integrations.models import ApplicationInstallation, WebhookEvent
+from drf_integrations.views import WebhookIngestionViewSet
+from tests.integration_samples import TestLocalIntegration
+
+
+class InstallationAuthentication(BaseAuthentication):
+    def authenticate(self, request):
+        request.auth_context = ApplicationInstallation.objects.get().get_context()
+        return None
+
+
+class WebhookViewSet(WebhookIngestionViewSet):
+    authentication_classes = (InstallationAuthentication,)
+    permission_classes = ()
+    delivery_id_header = "X-Delivery-Id"
+    topic_header = "X-Topic"
+
+
+@pytest.fixture(autouse=True)
+def clear_webhook_delivery_cache():
+    webhook_delivery_cache.clear()
+    yield
+    webhook_delivery_cache.clear()
+
+
+@pytest.fixture
+def process_webhook(mocker):
+    return mocker.patch.object(TestLocalIntegration, "process_webhook")
+
+
+@pytest.fixture
+def installation(get_integration, get_application):
+    return get_application(integration=get_integration(is_local=True)).install(target_id=1)
+
+
+def test_bloom_filter():
+    """
+    Added items are always found, and the filter is emptied once full
+    """
+    bloom = BloomFilter(capacity=100, error_rate=0.01)
+    for i in range(100):
+        bloom.add(str(i))
+    assert all(str(i) in bloom for i in range(100))
+    assert sum(str(i) in bloom for i in range(100, 1100)) < 50
+
+    bloom.add("full")
+    assert len(bloom) == 1
+    assert "full" in bloom
+    assert "0" not in bloom
+
+
+@pytest.mark.django_db
+def test_ingest_skips_duplicates(installation, django_assert_num_queries):
+    """
+    New deliveries are stored without looking them up, duplicates are not stored again
+    """
+    with CaptureQueriesContext(connection) as queries:
+        assert WebhookEvent.objects.ingest(installation=installation, delivery_id="1", body=b"{}")
+    assert not [query for query in queries if query["sql"].startswith("SELECT")]
+    with django_assert_num_queries(1):
+        assert not WebhookEvent.objects.ingest(installation=installation, delivery_id="1")
+
+    # Deliveries stored by another process are caught by the unique constraint
+    webhook_delivery_cache.clear()
+    assert not WebhookEvent.objects.ingest(installation=installation, delivery_id="1")
+    assert WebhookEvent.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_ingestion_view(installation, process_webhook):
+    """
+    Deliveries are stored and acknowledged, then processed in the background
+    """
+    factory = APIRequestFactory()
+    view = WebhookViewSet.as_view({"post": "create"})
+
+    for __ in range(2):
+        request = factory.post(
+            "",
+            data=b'{"id": 1}',
+            content_type="application/json",
+            HTTP_X_DELIVERY_ID="delivery",
+            HTTP_X_TOPIC="orders/create",
+        )
+        response = view(request)
+        assert response.status_code == status.HTTP_200_OK
+        process_webhook.assert_not_called()
+
+    response = view(factory.post("", data=b"{}", content_type="application/json"))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    event = WebhookEvent.objects.get()
+    assert (event.delivery_id, event.topic, event.get_payload()) == (
+        "delivery",
+        "orders/create",
+        dict(id=1),
+    )
+
+    stdout = StringIO()
+    call_command("processwebhooks", stdout=stdout)
+    assert "1 processed, 0 failed" in stdout.getvalue()
+    process_webhook.assert_called_once()
+    context, processed_event = process_webhook.call_args.args
+    assert context.installation == installation
+    assert processed_event == event
+
+
+@pytest.mark.django_db
+def test_ingestion_view_large_body(settings, installation):
+    """
+    Deliveries over DATA_UPLOAD_MAX_MEMORY_SIZE are stored, as they are read from the stream
+    """
+    settings.DATA_UPLOAD_MAX_MEMORY_SIZE = 10
+    body = b'{"items": "%s"}' % (b"x" * 100)
+    request = APIRequestFactory().post(
+        "", data=body, content_type="application/json", HTTP_X_DELIVERY_ID="delivery"
+    )
+    response = WebhookViewSet.as_view({"post": "create"})(request)
+    assert response.status_code == status.HTTP_200_OK
+    assert bytes(WebhookEvent.objects.get().body) == body
+
+
+@pytest.mark.django_db
+def test_process_retries_failures(installation, process_webhook):
+    """
+    Failed events are retried later, while the other events are processed
+    """
+    WebhookEvent.objects.ingest(installation=installation, delivery_id="1")
+    WebhookEvent.objects.ingest(installation=installation, delivery_id="2")
+    process_webhook.side_effect = [ValueError("error"), None]
+
+    assert WebhookEvent.objects.process() == (1, 1)
+    failed = WebhookEvent.objects.get(delivery_id="1")
+    assert failed.attempts == 1
+    assert "error" in failed.last_error
+    assert failed.processed_at is None
+    assert WebhookEvent.objects.get(delivery_id="2").processed_at is not None
+    assert not WebhookEvent.objects.pending().exists()